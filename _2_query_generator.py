@@ -1,6 +1,6 @@
 import os
 import re
-from queryGPT import Query_GPT4
+from queryGPT import Query_GPT4_batch
 import json
 
 base_dir = "interim_results"
@@ -63,25 +63,34 @@ def generate_llm_prompt_for_query_generation(kpm_list, single_env):
     return "\n".join(lines)
 
 
+def generate_query_texts(prompts):
+    """Raw generated query lists ('- query' per line), one per prompt."""
+    # independent per-environment requests → one concurrent batch
+    print(f"🧠 Querying GPT-4 for {len(prompts)} env(s)...")
+    # The prompt is deliberately sent as both system and user message, as the original
+    # per-env Query_GPT4(user_msg, user_msg, 0) call did: the generated queries and their
+    # cache entries stay the same
+    return Query_GPT4_batch([(user_msg, user_msg) for user_msg in prompts], temp=0)
+
+
 # === Run full pipeline for each top-k environment ===
 if __name__ == "__main__":
     envs = load_environment_differences(INPUT_TXT_FILE, TOP_K)
+    prompts = []
     for i, env in enumerate(envs, start=1):
         prompt = generate_llm_prompt_for_query_generation(TARGET_KPMS, env)
 
         prompt_path = os.path.join(query_dir, f"{OUTPUT_PROMPT_PREFIX}_{i}.txt")
         with open(prompt_path, "w") as f:
             f.write(prompt)
+        print(f"✅ Saved query prompt to {prompt_path}")
+        prompts.append(prompt)
 
-        print(f"🧠 Querying GPT-4 for Env #{i}...")
-        system_msg = "You are a helpful assistant for domain-aware RAG query generation."
-        user_msg = prompt
-        result = Query_GPT4(user_msg, user_msg, 0)
+    results = generate_query_texts(prompts)
 
+    for i, result in enumerate(results, start=1):
         result_path = os.path.join(query_dir, f"{OUTPUT_QUERY_PREFIX}_{i}.txt")
         with open(result_path, "w") as f:
             f.write(result)
 
-        print(f"✅ Saved query prompt to {prompt_path}")
         print(f"✅ Saved generated queries to {result_path}\n")
-
@@ -1,66 +1,183 @@
+import json
 import pickle
-import faiss
 import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from rag_fusion import fuse, canonical_ids, topk_rows
+from rag_records import ChunkRecord, RetrievalRecord, query_records
 import os
 
 # === CONFIG ===
 index_dir = Path("./rag_index")
-top_k = 5
+top_k = 5                   # fused chunks per query handed to the reranker
+fusion_depth = 20           # candidates taken from each retriever before fusion
+fusion_method = os.environ.get("RAG_FUSION", "rrf")   # "rrf" | "weighted"
+fusion_weights = [1.0, 1.0]                            # dense, sparse
+encode_batch_size = 64      # queries per forward pass inside the single encode call
+sparse_block = 256          # queries per sparse product (bounds the dense score block)
 query_dir = Path("./interim_results/_2_query_gen")
 output_dir = Path("./interim_results/_3_retrieved_chunks")
-output_dir.mkdir(exist_ok=True)
+embed_model = "all-MiniLM-L6-v2"
 
-# === LOAD HYBRID INDEX ===
-print("📦 Loading index files...")
-with open(index_dir / "documents.pkl", "rb") as f:
-    documents = pickle.load(f)
+# faiss / sentence_transformers / scipy / sklearn are imported when an index is
+# loaded; a warm process keeps the model and index (load_model, shared_retriever)
+_models = {}
+_retrievers = {}
 
-with open(index_dir / "tfidf_vectorizer.pkl", "rb") as f:
-    tfidf_vectorizer = pickle.load(f)
+def file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
 
-faiss_index = faiss.read_index(str(index_dir / "dense_index.faiss"))
-model = SentenceTransformer("all-MiniLM-L6-v2")
 
-# === PROCESS EACH QUERY FILE ===
-for query_file in sorted(query_dir.glob("LLM_generated_queries_*.txt")):
-    with open(query_file, "r") as f:
-        queries = [q.strip("- ").strip() for q in f.readlines() if q.strip()]
+class HybridRetriever:
+    """Dense (FAISS) + sparse (TF-IDF) retrieval over rag_index, fused per query; the index is loaded once."""
 
-    print(f"\n📄 Loaded {len(queries)} queries from {query_file.name}\n")
+    def __init__(self, index_dir=index_dir):
+        self.index_dir = Path(index_dir)
+        print("📦 Loading index files...")
+        with open(self.index_dir / "documents.pkl", "rb") as f:
+            self.documents = pickle.load(f)
 
-    output_lines = []
+        with open(self.index_dir / "tfidf_vectorizer.pkl", "rb") as f:
+            self.tfidf_vectorizer = pickle.load(f)
+
+        import faiss
+        self.faiss_index = faiss.read_index(str(self.index_dir / "dense_index.faiss"))
+        self.check_consistency()
+        self.model = load_model()
+        self.tfidf_matrix = self.load_tfidf_matrix()
+        self.canonical = canonical_ids(self.documents)      # identical chunks collapse onto one id
+
+    def check_consistency(self):
+        """Refuse an index whose files come from different builds (FAISS ids would point at the wrong chunks)."""
+        n_docs, n_dense = len(self.documents), self.faiss_index.ntotal
+        if n_dense != n_docs:
+            raise RuntimeError(f"❌ {self.index_dir}: dense_index.faiss has {n_dense} vectors but documents.pkl "
+                               f"has {n_docs} chunks; rebuild the index (python rag_builder.py rebuild)")
+        hashes = [getattr(doc, "metadata", {}).get("chunk_hash") for doc in self.documents]
+        if not any(hashes):
+            return                                   # not written by rag_builder: no manifest to check
+        manifest_path = self.index_dir / "manifest.json"
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else None
+        if manifest is None or manifest.get("chunks") != hashes:
+            raise RuntimeError(f"❌ {self.index_dir}: documents.pkl does not match manifest.json "
+                               f"(interrupted rag_builder run?); rebuild the index (python rag_builder.py build)")
+
+    # === SPARSE DOCUMENT MATRIX (built once, saved next to dense_index.faiss) ===
+    def load_tfidf_matrix(self):
+        """L2-normalised TF-IDF rows of every document; rebuilt only when the documents or vectorizer change."""
+        from scipy import sparse
+        from sklearn.preprocessing import normalize
+        matrix_path = self.index_dir / "tfidf_matrix.npz"
+        meta_path = self.index_dir / "tfidf_matrix.json"
+        stamps = {"documents": file_stamp(self.index_dir / "documents.pkl"),
+                  "vectorizer": file_stamp(self.index_dir / "tfidf_vectorizer.pkl")}
+        if matrix_path.exists() and meta_path.exists():
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("stamps") == stamps:
+                matrix = sparse.load_npz(matrix_path).tocsr()
+                if matrix.shape[0] == len(self.documents):
+                    return matrix
+
+        print(f"🧮 Building sparse TF-IDF matrix for {len(self.documents)} documents...")
+        matrix = normalize(self.tfidf_vectorizer.transform([doc.page_content for doc in self.documents])).tocsr()
+        sparse.save_npz(matrix_path, matrix)
+        with open(meta_path, "w") as f:
+            json.dump({"stamps": stamps, "shape": list(matrix.shape)}, f, indent=2)
+        return matrix
+
+    def sparse_topk(self, queries, k):
+        """Cosine top-k (document ids, scores) per query: batched sparse products, then argpartition."""
+        from sklearn.preprocessing import normalize
+        query_matrix = normalize(self.tfidf_vectorizer.transform(queries))
+        hits, hit_scores = [], []
+        for start in range(0, query_matrix.shape[0], sparse_block):
+            scores = (query_matrix[start:start + sparse_block] @ self.tfidf_matrix.T).toarray()   # (queries, documents)
+            top, top_scores = topk_rows(scores, k)              # best first, ties by document id
+            hits.append(top)
+            hit_scores.append(top_scores)
+        return np.concatenate(hits), np.concatenate(hit_scores)
+
+    # === DENSE + SPARSE SEARCH: one encode, one FAISS search, batched sparse scoring ===
+    def retrieve(self, queries):
+        """[QueryRecord] → [RetrievalRecord] with the top_k fused chunks of each query."""
+        if not queries:
+            return []
+        texts = [q.text for q in queries]
+        print(f"\n🔍 Searching {len(texts)} queries...")
+        query_dense = self.model.encode(texts, batch_size=encode_batch_size)
+        D, I = self.faiss_index.search(np.ascontiguousarray(query_dense, dtype=np.float32), fusion_depth)
+        sparse_hits, sparse_scores = self.sparse_topk(texts, fusion_depth)
+
+        records = []
+        for q, query in enumerate(queries):
+            # HYBRID FUSION (dense: smaller L2 distance is better)
+            fused = fuse([(I[q], -D[q]), (sparse_hits[q], sparse_scores[q])], method=fusion_method,
+                         top_n=top_k, canonical=self.canonical, weights=fusion_weights)
+            chunks = [ChunkRecord(self.documents[doc_id].page_content, self.documents[doc_id].metadata.get("source", ""),
+                                  float(score), int(doc_id)) for doc_id, score in fused]
+            records.append(RetrievalRecord(query.query_id, query.variant, query.text, fusion_method, chunks))
+        return records
 
-    for query in queries:
-        print(f"🔍 Processing query: {query}")
-        output_lines.append(f"\n=== Query: {query} ===\n")
 
-        # DENSE SEARCH
-        query_dense = model.encode([query])
-        D, I = faiss_index.search(np.array(query_dense), top_k)
-        retrieved_dense = [documents[i] for i in I[0]]
+def load_model(name=embed_model):
+    """SentenceTransformer, loaded once per process."""
+    if name not in _models:
+        from sentence_transformers import SentenceTransformer
+        _models[name] = SentenceTransformer(name)
+    return _models[name]
 
-        # SPARSE SEARCH
-        sparse_query_vec = tfidf_vectorizer.transform([query])
-        doc_texts = [doc.page_content for doc in documents]
-        sparse_doc_matrix = tfidf_vectorizer.transform(doc_texts)
-        sim_scores = cosine_similarity(sparse_query_vec, sparse_doc_matrix).flatten()
-        top_sparse_idx = np.argsort(sim_scores)[-top_k:][::-1]
-        retrieved_sparse = [documents[i] for i in top_sparse_idx]
 
-        # HYBRID MERGE
-        combined = {doc.page_content: doc.metadata.get("source", "") for doc in retrieved_dense + retrieved_sparse}
+def shared_retriever(index_dir=index_dir):
+    """Process-wide HybridRetriever for `index_dir`, reloaded when the index files change."""
+    index_dir = Path(index_dir)
+    stamps = [file_stamp(index_dir / name) for name in ("documents.pkl", "tfidf_vectorizer.pkl", "dense_index.faiss")]
+    cached = _retrievers.get(str(index_dir.resolve()))
+    if cached is None or cached[0] != stamps:
+        cached = (stamps, HybridRetriever(index_dir))
+        _retrievers[str(index_dir.resolve())] = cached
+    return cached[1]
 
-        for i, (chunk, source) in enumerate(combined.items(), 1):
+
+def format_retrieved(records):
+    """Text layout of retrieved_chunks_*.txt (parsed by _4_rerank_with_llm.parse_chunks)."""
+    output_lines = []
+    for record in records:
+        output_lines.append(f"\n=== Query: {record.query} ===\n")
+        for i, chunk in enumerate(record.chunks, 1):
             output_lines.append(f"--- Result #{i} ---\n")
-            output_lines.append(chunk.strip()[:800] + "\n")
-            output_lines.append(f"📌 Source: {source}\n")
+            output_lines.append(chunk.content.strip()[:800] + "\n")
+            output_lines.append(f"📌 Source: {chunk.source}\n")
+            output_lines.append(f"📈 Score: {chunk.score:.4f} ({record.method})\n")
+    return "\n".join(output_lines)
+
+
+def main():
+    output_dir.mkdir(exist_ok=True)
+
+    # === GATHER QUERIES FROM EVERY FILE ===
+    queries, variants = [], []
+    for query_file in sorted(query_dir.glob("LLM_generated_queries_*.txt")):
+        variants.append(query_file.stem.replace("LLM_generated_queries_", ""))
+        with open(query_file, "r") as f:
+            file_queries = query_records(variants[-1], f.read())
+        print(f"📄 Loaded {len(file_queries)} queries from {query_file.name}")
+        queries += file_queries
+
+    records = HybridRetriever().retrieve(queries)
+
+    # === SCATTER RESULTS BACK TO PER-FILE OUTPUTS ===
+    by_variant = {variant: [] for variant in variants}
+    for record in records:
+        print(f"🔍 Processing query: {record.query}")
+        by_variant[record.variant].append(record)
+    for variant, variant_records in by_variant.items():
+        output_file = output_dir / f"retrieved_chunks_{variant}.txt"
+        with open(output_file, "w") as f:
+            f.write(format_retrieved(variant_records))
+
+        print(f"✅ Retrieved chunks saved to {output_file}")
 
-    output_file = output_dir / f"retrieved_chunks_{query_file.stem.replace('LLM_generated_queries_', '')}.txt"
-    with open(output_file, "w") as f:
-        f.write("\n".join(output_lines))
 
-    print(f"✅ Retrieved chunks saved to {output_file}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
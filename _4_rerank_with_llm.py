@@ -1,11 +1,14 @@
 from pathlib import Path
 import re
-from queryGPT import Query_GPT4
+import json
+import time
+import numpy as np
+from rerankers import get_reranker
+from rag_records import ChunkRecord, RetrievalRecord, RerankRecord
 import os
 from glob import glob
 
 output_dir = "./interim_results/_4_reranked_results"
-os.makedirs(output_dir, exist_ok=True)
 
 # === Helper: Parse .txt files ===
 def parse_chunks(file_path):
@@ -21,46 +24,78 @@ def parse_chunks(file_path):
         parsed.append((query, chunks))
     return parsed
 
-# === Prompt builder (ask for re-ordered contents) ===
-def build_prompt(query, chunks):
-    prompt = [
-        "You are a 5G systems expert. Given the following query and retrieved document chunks from 3GPP/ORAN specs, re-rank the chunks from most to least relevant based on how useful they are to answer the query.\n\n",
-        f"Query: \"{query}\"\n\nChunks:\n"
-    ]
-    for i, chunk in enumerate(chunks, 1):
-        prompt.append(f"--- Chunk #{i} ---\n{chunk['content']}\n📌 Source: {chunk['source']}\n\n")
+def retrieval_records(file_path):
+    """RetrievalRecords of one retrieved_chunks_*.txt file."""
+    variant = re.findall(r'\d+', os.path.basename(file_path))[-1]  # Extract '1', '2', '3' from file name
+    return [RetrievalRecord(f"{variant}-{n:03d}", variant, query, "text",
+                            [ChunkRecord(c['content'], c['source']) for c in chunks])
+            for n, (query, chunks) in enumerate(parse_chunks(file_path))]
 
-    prompt.append(
-        "Please return the reordered chunks (from most to least relevant), including their full content and source. Do not return a list of numbers or summaries—just return the full chunks in the new order.\n"
-    )
-    return ''.join(prompt)
+# === Re-rank: the backend decides how to batch the queries ===
+def rerank_records(retrievals, reranker=None):
+    """[RetrievalRecord] → [RerankRecord]; queries without chunks are skipped."""
+    reranker = reranker or get_reranker()
+    jobs = [record for record in retrievals if record.chunks]
+    print(f"🔀 Re-ranking {len(jobs)} queries with the '{reranker.name}' backend")
+    start = time.perf_counter()
+    rankings, latencies = reranker.rerank([(r.query, [c.content for c in r.chunks]) for r in jobs])
+    wall = time.perf_counter() - start
+
+    records = []
+    for r, ranking, seconds in zip(jobs, rankings, latencies):
+        latency_ms = seconds * 1000 if seconds is not None else None
+        if isinstance(ranking, Exception):
+            records.append(RerankRecord(r.query_id, r.variant, r.query, reranker.name,
+                                        latency_ms=latency_ms, error=str(ranking)))
+            continue
+        chunks = [ChunkRecord(r.chunks[i].content, r.chunks[i].source, float(score), r.chunks[i].doc_id)
+                  for i, score in ranking]
+        records.append(RerankRecord(r.query_id, r.variant, r.query, reranker.name, chunks, latency_ms))
+
+    # Per-query latency report (only from queries the backend timed individually)
+    ms = np.array([record.latency_ms for record in records if record.latency_ms is not None])
+    if len(ms):
+        print(f"⏱️ Re-rank latency per query: mean {ms.mean():.1f} ms, p50 {np.percentile(ms, 50):.1f} ms, "
+              f"p95 {np.percentile(ms, 95):.1f} ms")
+    print(f"⏱️ Re-rank wall time: {wall:.2f}s for {len(jobs)} queries")
+    return records
+
+def format_reranked(record):
+    """One query block of reranked_results_*.txt (also the knowledge text _6 answers from)."""
+    if record.error is not None:
+        return f"Error processing query: {record.query}\n{record.error}\n\n"
+    lines = [f"=== Query: {record.query} ===\n", "--- Re-ranked Results (Full Chunks) ---\n"]
+    for rank, chunk in enumerate(record.chunks, 1):
+        lines.append(f"--- Chunk #{rank} (score {chunk.score:.4f}) ---\n{chunk.content}\n📌 Source: {chunk.source}\n\n")
+    return "".join(lines)
+
+def write_latency_report(records):
+    with open(os.path.join(output_dir, "rerank_latency.json"), "w") as f:
+        json.dump({"backend": records[0].backend if records else None,
+                   "queries": [{"query_id": r.query_id, "query": r.query, "latency_ms": round(r.latency_ms, 3) if r.latency_ms is not None else None}
+                               for r in records]}, f, indent=2)
 
 # === Main script ===
-retrieved_files = sorted(glob("./interim_results/_3_retrieved_chunks/retrieved_chunks_*.txt"))
-if not retrieved_files:
-    print("❌ No retrieved chunk files found. Check the directory or Top_K setting.")
+def main():
+    os.makedirs(output_dir, exist_ok=True)
+    retrieved_files = sorted(glob("./interim_results/_3_retrieved_chunks/retrieved_chunks_*.txt"))
+    if not retrieved_files:
+        print("❌ No retrieved chunk files found. Check the directory or Top_K setting.")
 
-for file_path in retrieved_files:
-    output_lines = []
-    parsed_entries = parse_chunks(file_path)
-    system_msg = ""
+    retrievals = [record for file_path in retrieved_files for record in retrieval_records(file_path)]
+    records = rerank_records(retrievals)
+    write_latency_report(records)
 
-    for query, chunks in parsed_entries:
-        if not chunks:
-            continue
-        prompt = build_prompt(query, chunks)
-        try:
-            response_text = Query_GPT4(system_msg, prompt, 0)
+    output_by_variant = {re.findall(r'\d+', os.path.basename(file_path))[-1]: [] for file_path in retrieved_files}
+    for record in records:
+        output_by_variant[record.variant].append(format_reranked(record))
 
-            output_lines.append(f"=== Query: {query} ===\n")
-            output_lines.append("--- Re-ranked Results (Full Chunks) ---\n")
-            output_lines.append(response_text + "\n\n")
+    for variant, output_lines in output_by_variant.items():
+        # Save to separate file based on index
+        out_path = os.path.join(output_dir, f"reranked_results_{variant}.txt")
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.writelines(output_lines)
 
-        except Exception as e:
-            output_lines.append(f"Error processing query: {query}\n{e}\n\n")
 
-    # Save to separate file based on index
-    suffix = re.findall(r'\d+', file_path)[-1]  # Extract '1', '2', '3' from file name
-    out_path = os.path.join(output_dir, f"reranked_results_{suffix}.txt")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.writelines(output_lines)
+if __name__ == "__main__":
+    main()
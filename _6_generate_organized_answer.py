@@ -1,11 +1,10 @@
 import os
 import glob
-from queryGPT import Query_GPT4  # Make sure this is your working wrapper
+from queryGPT import Query_GPT4_batch  # Make sure this is your working wrapper
 
 # Input/output paths
-query_files = sorted(glob.glob("./interim_results/_5_split_queries/query_*.txt"))
+query_glob = "./interim_results/_5_split_queries/query_*.txt"
 output_dir = "./interim_results/_6_organized_answers"
-os.makedirs(output_dir, exist_ok=True)
 
 # System prompt
 system_msg = (
@@ -40,24 +39,38 @@ Avoid bullet-point summaries unless it's necessary for clarity. Focus on clarity
 Write your answer below:
 """
 
-# Loop through queries
-for i, filepath in enumerate(query_files):
-    with open(filepath, "r", encoding="utf-8") as f:
-        retrieved_knowledge = f.read()
-
-    query_line = next((line for line in retrieved_knowledge.splitlines() if line.startswith("=== Query:")), "")
-    user_msg = build_user_msg(retrieved_knowledge)
-    print(f"🟡 Processing: {filepath}")
-
-    try:
-        answer = Query_GPT4(system_msg, user_msg, temp=0.3)
-    except Exception as e:
-        print(f"❌ Error in {filepath}: {e}")
-        continue
+def answer_all(knowledge_texts):
+    """Answer every retrieved-knowledge block concurrently; failures come back in place."""
+    return Query_GPT4_batch([(system_msg, build_user_msg(k)) for k in knowledge_texts], temp=0.3, return_exceptions=True)
 
+def write_answer(i, query_line, answer, out_dir=output_dir):
     # Save both the query and the answer in the output file
-    output_path = os.path.join(output_dir, f"organized_answer_{i:03d}.txt")
+    os.makedirs(out_dir, exist_ok=True)
+    output_path = os.path.join(out_dir, f"organized_answer_{i:03d}.txt")
     with open(output_path, "w", encoding="utf-8") as out:
         out.write(f"{query_line}\n\n=== Answer ===\n{answer}\n")
 
     print(f"✅ Saved answer with query to: {output_path}")
+
+def main():
+    # Build every prompt, then answer all queries concurrently
+    jobs = []
+    for i, filepath in enumerate(sorted(glob.glob(query_glob))):
+        with open(filepath, "r", encoding="utf-8") as f:
+            retrieved_knowledge = f.read()
+
+        query_line = next((line for line in retrieved_knowledge.splitlines() if line.startswith("=== Query:")), "")
+        jobs.append((i, filepath, query_line, retrieved_knowledge))
+        print(f"🟡 Processing: {filepath}")
+
+    answers = answer_all([knowledge for _, _, _, knowledge in jobs])
+
+    for (i, filepath, query_line, _), answer in zip(jobs, answers):
+        if isinstance(answer, Exception):
+            print(f"❌ Error in {filepath}: {answer}")
+            continue
+        write_answer(i, query_line, answer)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,20 @@ import re
 import json
 import numpy as np
 from pathlib import Path
-from queryGPT import Query_GPT4
+import queryGPT
+from queryGPT import Query_GPT4_batch
+from derivation_store import DerivationStore, prompt_digest
+from shap_store import shared_store
+from oran_loader import read_log
 from _7_1_shap_prompt import get_symbolic_form_prompt, get_math_equation_prompt, get_importance_form
 
 # === CONFIG ===
 INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
 INPUT_TXT_FILE = f"./env_encoder/decoded_differences/decoded_differences_ORAN_log_new{INPUT_ENV_ID}.txt"
 SHAP_DIR = "./shap_outputs"
+shap_store = shared_store(SHAP_DIR)
 KPM_LOG_DIR = "./dataset"
-output_dir = Path("./interim_results/_7_past_shap_prompt")
+output_dir = Path("./interim_results/_7_past_shap_prompt") / f"env_new{INPUT_ENV_ID}"   # per env: envs may run concurrently
 output_dir.mkdir(parents=True, exist_ok=True)
 
 
@@ -79,6 +84,17 @@ json_blocks = re.findall(r'\{\s+"env_name":.*?\n\}', raw_text, re.DOTALL)
 env_data = [json.loads(block) for block in json_blocks]
 TOP_K = min(TOP_K, len(env_data))
 
+# === Past / current KPM logs, read once (typed, only the columns the prompt uses) ===
+KPM_LOG_COLUMNS = KPM_KEYS + ["DL_Buffer", "Users"]
+_kpm_logs = {}
+
+def load_kpm_log(env_name):
+    """Projected log of `env_name`, or None when the full log is missing."""
+    if env_name not in _kpm_logs:
+        path = f"{KPM_LOG_DIR}/{env_name}.csv"
+        _kpm_logs[env_name] = read_log(path, KPM_LOG_COLUMNS) if os.path.exists(path) else None
+    return _kpm_logs[env_name]
+
 def RAG_needed(user_query):
     # Simple heuristic: if "derivative" or "partial derivative" is mentioned, RAG is needed
     trigger_keywords = ["Reformulate", "derivative"]
@@ -91,6 +107,41 @@ def retrieve_context():
     # For now, just return our simple cheat sheet
     return RAG_DOCUMENT
 
+# === LLM derivations: depend only on the KPM (and model), derived once and stored ===
+system_msg = "You are an expert in wireless networks and Open RAN."
+derivation_store = DerivationStore()
+llm_model = queryGPT.LLM_MODEL
+digests = {kpm_target: prompt_digest(system_msg, get_symbolic_form_prompt(kpm_target),
+                                     get_math_equation_prompt(""), retrieve_context())
+           for kpm_target in KPM_KEYS}
+# the lock spans check → derive → store, so concurrent environments derive each KPM once
+with derivation_store.locked():
+    stored = {kpm_target: derivation_store.get(llm_model, kpm_target, digests[kpm_target]) for kpm_target in KPM_KEYS}
+    missing = [kpm_target for kpm_target in KPM_KEYS if stored[kpm_target] is None]
+
+    if missing:
+        # KPMs are independent, so each step runs as one batch
+        symbolic_forms = Query_GPT4_batch(
+            [(system_msg, get_symbolic_form_prompt(kpm_target)) for kpm_target in missing], temp=0)
+
+        math_requests = []
+        for symbolic_form in symbolic_forms:
+            print(symbolic_form)
+            math_equation_prompt = get_math_equation_prompt(symbolic_form)
+            needs_rag = RAG_needed(math_equation_prompt)
+
+            retrieved_context = retrieve_context() if needs_rag else None
+            #print("[Planner Decision] Needs RAG?", needs_rag, retrieved_context)
+            math_requests.append((system_msg, retrieved_context+math_equation_prompt))
+        math_equations = Query_GPT4_batch(math_requests, temp=0)
+        derivation_store.put_many(llm_model, {kpm_target: (symbolic_form, math_equation, digests[kpm_target])
+                                              for kpm_target, symbolic_form, math_equation
+                                              in zip(missing, symbolic_forms, math_equations)})
+        stored.update((kpm_target, pair) for kpm_target, pair in zip(missing, zip(symbolic_forms, math_equations)))
+        print(f"🧮 Derived {len(missing)} KPM form(s) with {llm_model}, stored in {derivation_store.path}")
+    else:
+        print(f"🧮 All {len(KPM_KEYS)} KPM forms loaded from {derivation_store.path} (no LLM calls)")
+
 # === Generate prompt for each top-k environment and KPM ===
 for variant_id in range(1, TOP_K + 1):
     env = env_data[variant_id - 1]
@@ -98,19 +149,7 @@ for variant_id in range(1, TOP_K + 1):
     differences = env["differences"]
 
     for kpm_target in KPM_KEYS:
-        symbolic_form_prompt = get_symbolic_form_prompt(kpm_target)
-        #print(symbolic_form_prompt)
-        system_msg = "You are an expert in wireless networks and Open RAN."
-        symbolic_form = Query_GPT4(system_msg, symbolic_form_prompt, 0)
-        print(symbolic_form)
-
-        math_equation_prompt = get_math_equation_prompt(symbolic_form)
-        needs_rag = RAG_needed(math_equation_prompt)
-
-        retrieved_context = retrieve_context() if needs_rag else None
-        #print("[Planner Decision] Needs RAG?", needs_rag, retrieved_context)
-
-        math_equation = Query_GPT4(system_msg, retrieved_context+math_equation_prompt, 0)
+        symbolic_form, math_equation = stored[kpm_target]
         print(math_equation)
 
         importance_form_prompt = get_importance_form(symbolic_form)
@@ -189,22 +228,18 @@ KPM is: {kpm_target}"""
             prompt_lines.append("  - No meaningful changes.")
 
         prompt_lines.append("\n• Past vs. Current KPMs:")
+        past_df = load_kpm_log(env_name)
+        curr_df = load_kpm_log(f"ORAN_log_new{INPUT_ENV_ID}")
         for kpm in KPM_KEYS:
-            past_csv = f"{KPM_LOG_DIR}/{env_name}.csv"
-            curr_csv = f"{KPM_LOG_DIR}/ORAN_log_new{INPUT_ENV_ID}.csv"
-            if os.path.exists(past_csv) and os.path.exists(curr_csv):
-                import pandas as pd
-                past_df = pd.read_csv(past_csv)
-                curr_df = pd.read_csv(curr_csv)
-
+            if past_df is not None and curr_df is not None:
                 if kpm in past_df.columns and kpm in curr_df.columns and "Users" in past_df.columns and "Users" in curr_df.columns:
                     if kpm_target == "Avg_Delay_ms" and kpm in ["Throughput_Mbps", "DL_Buffer"]:
-                        past_val = (past_df[kpm] / past_df["Users"]).mean()
-                        curr_val = (curr_df[kpm] / curr_df["Users"]).mean()
+                        past_val = (past_df[kpm].astype("float64") / past_df["Users"]).mean()
+                        curr_val = (curr_df[kpm].astype("float64") / curr_df["Users"]).mean()
                         prompt_lines.append(f"  - {kpm}: past = {past_val:.4f}, current = {curr_val:.4f}")
                     else:
-                        past_val = past_df[kpm].mean()
-                        curr_val = curr_df[kpm].mean()
+                        past_val = past_df[kpm].astype("float64").mean()
+                        curr_val = curr_df[kpm].astype("float64").mean()
                         prompt_lines.append(f"  - {kpm}: past = {past_val:.4f}, current = {curr_val:.4f}")
                 else:
                     prompt_lines.append(f"  - {kpm}: ⚠️ column missing in CSV, skipped")
@@ -213,25 +248,12 @@ KPM is: {kpm_target}"""
 
         prompt_lines.append("\n• Normalized SHAP values:")
         for kpm in SHAP_KPM_KEYS:
-            shap_path = f"{SHAP_DIR}/{env_name}_{kpm}_shap.npy"
-            feature_path = f"{SHAP_DIR}/{env_name}_{kpm}_features.npy"
-            if not os.path.exists(shap_path) or not os.path.exists(feature_path):
+            if not shap_store.has(env_name, kpm):
                 prompt_lines.append(f"  - ⚠️ Missing SHAP for {kpm}")
                 continue
 
-            shap_values = np.load(shap_path)
-            feature_names = np.load(feature_path, allow_pickle=True)
-            mean_abs = np.mean(np.abs(shap_values), axis=0)
-            norm_shap = mean_abs / np.sum(mean_abs) if np.sum(mean_abs) > 0 else mean_abs
-
-            feat, vals = list(feature_names), list(norm_shap)
-            sched_idx = [i for i, n in enumerate(feat) if 'Scheduling' in n]
-            if sched_idx:
-                sched_total = sum(vals[i] for i in sched_idx)
-                for i in sorted(sched_idx, reverse=True):
-                    del feat[i]; del vals[i]
-                feat.append("Scheduling")
-                vals.append(sched_total)
+            # normalised mean |SHAP| with Scheduling_* already merged
+            feat, vals = shap_store.open(env_name).aggregated(kpm, normalized=True)
 
             prompt_lines.append(f"  - {kpm}:")
             for f, v in zip(feat, vals):
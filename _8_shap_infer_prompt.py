@@ -1,8 +1,10 @@
+import os
 import glob
 from pathlib import Path
 
-output_dir = Path("./interim_results/_8_shap_inference_prompt")
-output_dir.mkdir(exist_ok=True)
+INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
+output_dir = Path("./interim_results/_8_shap_inference_prompt") / f"env_new{INPUT_ENV_ID}"
+output_dir.mkdir(parents=True, exist_ok=True)
 
 def generate_shap_inference_prompts(shap_prompt_glob, output_prefix):
     """
@@ -29,6 +31,6 @@ def generate_shap_inference_prompts(shap_prompt_glob, output_prefix):
 if __name__ == "__main__":
     out_name = "LLM_shap_inference_prompt"
     generate_shap_inference_prompts(
-        shap_prompt_glob="./interim_results/_7_past_shap_prompt/LLM_shap_prompt_*.txt",
+        shap_prompt_glob=f"./interim_results/_7_past_shap_prompt/env_new{INPUT_ENV_ID}/LLM_shap_prompt_*.txt",
         output_prefix=out_name
     )
@@ -1,20 +1,22 @@
 import glob
 import json
 import os
+import sys
 import numpy as np
 import re
 from pathlib import Path
-from queryGPT import Query_GPT4
+from queryGPT import Query_GPT4_batch
+from shap_store import shared_store
 import math
 
 # === CONFIG ===
-INPUT_TXT_GLOB = "./interim_results/_8_shap_inference_prompt/LLM_shap_inference_prompt_*.txt"
-output_dir = Path("./interim_results/_9_shap_output")
-output_dir.mkdir(exist_ok=True)
-
 # Get current environment ID (default to "0" for safety)
 INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
 
+INPUT_TXT_GLOB = f"./interim_results/_8_shap_inference_prompt/env_new{INPUT_ENV_ID}/LLM_shap_inference_prompt_*.txt"
+output_dir = Path("./interim_results/_9_shap_output")
+output_dir.mkdir(exist_ok=True)
+
 # Create subfolder for each env
 env_output_dir = output_dir / f"env_new{INPUT_ENV_ID}"
 env_output_dir.mkdir(parents=True, exist_ok=True)
@@ -24,8 +26,38 @@ OUTPUT_PREFIX = env_output_dir / "LLM_shap_output"
 
 
 SHAP_DIR = "./shap_outputs"
+shap_store = shared_store(SHAP_DIR)
 shap_outputs = []
 
+REASONER_OUTPUT = os.environ.get("ORCA_REASONER_OUTPUT", "json_schema")  # "json_schema" | "text"
+BETA_FEATURES = ["ant_tilt_deg", "CIO", "TxPower", "PRB_num", "DL_Buffer", "Avg_SNR_dB", "Scheduling"]
+
+# Structured output for the β dictionary: the step-by-step derivation goes to
+# "reasoning", the final numbers to "beta" — no second extraction call needed.
+BETA_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "beta_importance_shift",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "reasoning": {"type": "string",
+                              "description": "Output format items 1-6, worked out in full."},
+                "kpm": {"type": "string"},
+                "beta": {
+                    "type": "object",
+                    "properties": {f: {"type": "number"} for f in BETA_FEATURES},
+                    "required": BETA_FEATURES,
+                    "additionalProperties": False,
+                },
+            },
+            "required": ["reasoning", "kpm", "beta"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 def extract_clean_json(response: str):
     import json
     import re
@@ -57,7 +89,71 @@ def extract_clean_json(response: str):
         raise ValueError("No valid JSON block found.")
 
 
+def json_candidates(text):
+    """Fenced and brace-balanced top-level {...} blocks, last first (the final answer ends the response)."""
+    fenced = re.findall(r"```(?:json)?\s*(\{[\s\S]*?\})\s*```", text)
+    blocks, depth, start, in_string, escaped = [], 0, None, False, False
+    for pos, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"' and depth:
+            in_string = True
+        elif ch == "{":
+            if depth == 0:
+                start = pos
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                blocks.append(text[start:pos + 1])
+    return fenced[::-1] + blocks[::-1]
+
+
+def load_json_lenient(candidate):
+    """json.loads of one extracted {...} block, then the same clean-ups as extract_clean_json, then expression evaluation."""
+    cleaned = candidate.strip()
+    attempts = [lambda: cleaned]
+    cleaned = cleaned.replace("'", '"')
+    cleaned = re.sub(r'([{,])\s*([a-zA-Z0-9_]+)\s*:', r'\1 "\2":', cleaned)
+    cleaned = re.sub(r",\s*([}\]])", r"\1", cleaned)
+    attempts += [lambda: cleaned, lambda: evaluate_expressions_in_json(cleaned)]
+    for attempt in attempts:
+        try:
+            return json.loads(attempt())
+        except ValueError:
+            continue
+    return None
+
+
+def beta_from(parsed, target_kpm):
+    """{target_kpm: {feature: β}} from a structured or free-form JSON answer, or None.
+
+    Only a complete answer counts: its keys must be exactly BETA_FEATURES, so a
+    partial dictionary or an intermediate per-KPM table is not taken for it.
+    """
+    if not isinstance(parsed, dict):
+        return None
+    beta = parsed.get("beta") if isinstance(parsed.get("beta"), dict) else parsed.get(target_kpm)
+    if not isinstance(beta, dict) or set(beta) != set(BETA_FEATURES):
+        return None
+    try:
+        return {target_kpm: {f: float(v) for f, v in beta.items()}}
+    except (TypeError, ValueError):
+        return None
+
 
+def parse_beta_json(response, target_kpm):
+    """Local extraction of the β dictionary; raises ValueError when nothing usable is found."""
+    for candidate in json_candidates(response):
+        parsed = beta_from(load_json_lenient(candidate), target_kpm)
+        if parsed is not None:
+            return parsed
+    raise ValueError(f"No β dictionary for {target_kpm} found in the response.")
 
 
 def evaluate_expressions_in_json(s):
@@ -75,7 +171,21 @@ def evaluate_expressions_in_json(s):
     pattern = r':\s*([^"\n\r:,]+?)\s*(?=[,}])'
     return re.sub(pattern, try_eval, s)
 
-# === MAIN LOOP ===
+def build_json_extract_prompt(response):
+    return f"""
+    From the response between <BEGIN> and <END>
+    Extract and show only final outputs in a json format.  
+    Do not include any markdown, extra text, or code fences.
+
+    <BEGIN>
+    {response}
+    <END>
+
+    Return only the JSON dictionary.
+    """
+
+# === Select prompts (skip based on slice and KPM) ===
+selected = []
 for i, prompt_file in enumerate(sorted(glob.glob(INPUT_TXT_GLOB)), start=1):
     with open(prompt_file, "r") as f:
         prompt = f.read()
@@ -100,40 +210,66 @@ for i, prompt_file in enumerate(sorted(glob.glob(INPUT_TXT_GLOB)), start=1):
         print(f"⏭️ Skipping {slice_type} with KPM {target_kpm} (Only Avg_Delay_ms for URLLC)")
         continue
 
+    selected.append((i, prompt_file, prompt, target_kpm))
+
+# === LLM calls: prompts are independent → one reasoning batch; the β JSON is
+# parsed locally and a JSON-extraction call is only made where that fails ===
+if REASONER_OUTPUT not in ("json_schema", "text"):
+    raise ValueError(f"Unknown ORCA_REASONER_OUTPUT '{REASONER_OUTPUT}' (expected json_schema or text)")
+system_msg = "You are a reasoning agent for SHAP value estimation."
+print(f"\n🔍 Querying GPT-4 with {len(selected)} prompt(s) ({REASONER_OUTPUT} output)...")
+reasoning_responses = Query_GPT4_batch(
+    [(system_msg, prompt) for _, _, prompt, _ in selected], temp=0,
+    response_format=BETA_RESPONSE_FORMAT if REASONER_OUTPUT == "json_schema" else None)
 
-    print(f"\n🔍 Querying GPT-4 with {prompt_file}...")
-    system_msg = "You are a reasoning agent for SHAP value estimation."
-    response = Query_GPT4(system_msg, prompt, 0)
+parsed_outputs, fallback_jobs = {}, []
+for n, ((i, prompt_file, prompt, target_kpm), reasoning_response) in enumerate(zip(selected, reasoning_responses)):
+    try:
+        parsed_outputs[n] = parse_beta_json(reasoning_response, target_kpm)
+    except ValueError as e:
+        print(f"⚠️ Local JSON extraction failed for {prompt_file}: {e} → extraction call")
+        fallback_jobs.append(n)
+
+extract_responses = Query_GPT4_batch(
+    [(system_msg, build_json_extract_prompt(reasoning_responses[n])) for n in fallback_jobs], temp=0)
+fallback_failed = 0
+for n, response in zip(fallback_jobs, extract_responses):
     print(response)
+    try:
+        parsed_outputs[n] = parse_beta_json(response, selected[n][3])
+    except ValueError:
+        try:
+            parsed_outputs[n] = extract_clean_json(response)
+        except Exception as e:
+            print(f"❌ JSON parse failed: {e}")
+            print("🔎 Full LLM Response:\n", response)
+            fallback_failed += 1
+
+extraction_stats = {
+    "output_mode": REASONER_OUTPUT,
+    "responses": len(selected),
+    "parsed_locally": len(selected) - len(fallback_jobs),
+    "fallback_calls": len(fallback_jobs),
+    "fallback_failed": fallback_failed,
+}
+with open(env_output_dir / "json_extraction_stats.json", "w") as f:
+    json.dump(extraction_stats, f, indent=2)
+print(f"🧾 β JSON: {extraction_stats['parsed_locally']}/{len(selected)} parsed locally, "
+      f"{len(fallback_jobs)} extraction fallback call(s), {fallback_failed} unparsed")
+
+# === MAIN LOOP ===
+for n, ((i, prompt_file, prompt, _), reasoning_response) in enumerate(zip(selected, reasoning_responses)):
+    print(f"\n🔍 GPT-4 response for {prompt_file}:")
+    print(reasoning_response)
 
     raw_path = OUTPUT_PREFIX.parent / f"LLM_shap_output_raw_{i}.txt"
     with open(raw_path, "w") as f:
-        f.write(response)
-
-    json_extract_prompt = f"""
-    From the response between <BEGIN> and <END>
-    Extract and show only final outputs in a json format.  
-    Do not include any markdown, extra text, or code fences.
+        f.write(reasoning_response)
 
-    <BEGIN>
-    {response}
-    <END>
-
-    Return only the JSON dictionary.
-    """
-    response = Query_GPT4(system_msg, json_extract_prompt, 0)
-    "=============================================================================================="
-    print(json_extract_prompt)
-    "=============================================================================================="
-    print(response)
-
-    try:
-        parsed = extract_clean_json(response)
-        print("✅ JSON parsed successfully.")
-    except Exception as e:
-        print(f"❌ JSON parse failed: {e}")
-        print("🔎 Full LLM Response:\n", response)
-        raise e
+    if n not in parsed_outputs:
+        continue
+    parsed = parsed_outputs[n]
+    print("✅ JSON parsed successfully.")
 
     env_match = re.search(r"### Reference Environment: ([^\n]+)", prompt)
     kpm_match = re.search(r"KPM is: ([^\n]+)", prompt)
@@ -158,59 +294,31 @@ for i, prompt_file in enumerate(sorted(glob.glob(INPUT_TXT_GLOB)), start=1):
             continue
 
         try:
-            past_file = f"{SHAP_DIR}/{env_name}_{target_kpm}_ytest.npy"
-            curr_file = f"{SHAP_DIR}/ORAN_log_new{INPUT_ENV_ID}_{target_kpm}_ytest.npy"
-            if not (Path(past_file).exists() and Path(curr_file).exists()):
+            curr_env = f"ORAN_log_new{INPUT_ENV_ID}"
+            if not (shap_store.has(env_name, target_kpm) and shap_store.has(curr_env, target_kpm)):
                 print(f"⚠️ Missing KPM files for {target_kpm} in {env_name}")
                 continue
 
-            past_vals = np.load(past_file)
-            curr_vals = np.load(curr_file)
-            past_kpm = float(np.mean(past_vals))
-            curr_kpm = float(np.mean(curr_vals))
+            past_shap = shap_store.open(env_name)
+            past_kpm = past_shap.stats(target_kpm)["ytest_mean"]
+            curr_kpm = shap_store.open(curr_env).stats(target_kpm)["ytest_mean"]
             if past_kpm == 0:
                 print(f"⚠️ KPM_past is zero for {target_kpm}, skipping")
                 continue
             kpm_scale = curr_kpm / past_kpm
 
-            mean_abs_path = f"{SHAP_DIR}/{env_name}_{target_kpm}_mean_abs.npy"
-            if not Path(mean_abs_path).exists():
-                print(f"⚠️ Missing past SHAP file for {target_kpm}")
-                continue
-            loaded = np.load(mean_abs_path, allow_pickle=True)
-            past_shap_vals = dict(zip(loaded[0], map(float, loaded[1])))
-            past_total = sum(past_shap_vals.values())
-
-            shap_path = f"{SHAP_DIR}/{env_name}_{target_kpm}_shap.npy"
-            feature_path = f"{SHAP_DIR}/{env_name}_{target_kpm}_features.npy"
-            if not (Path(shap_path).exists() and Path(feature_path).exists()):
-                print(f"⚠️ Missing normalized SHAP files for {target_kpm}")
-                continue
+            past_total = past_shap.stats(target_kpm)["mean_abs_total"]
 
-            shap_raw = np.load(shap_path)
-            feature_names = list(np.load(feature_path, allow_pickle=True))
-            ϕ_past_norm = np.mean(np.abs(shap_raw), axis=0)
-            ϕ_past_norm = ϕ_past_norm / np.sum(ϕ_past_norm)
+            # normalised mean |SHAP| with Scheduling_* already merged
+            agg_feats, agg_norm = past_shap.aggregated(target_kpm, normalized=True)
+            ϕ_dict = {name: float(v) for name, v in zip(agg_feats, agg_norm) if name != "Scheduling" or v > 0}
 
-            sched_sum = 0.0
             print(f"\n📌 Normalized SHAP values from the reference environment ({env_name}) for {target_kpm}:")
-            for i_f, name in enumerate(feature_names):
-                if "Scheduling" in name:
-                    sched_sum += ϕ_past_norm[i_f]
-                else:
-                    print(f"   • {name:16s}: {ϕ_past_norm[i_f]:.6f}")
-            if sched_sum > 0:
-                print(f"   • Scheduling       : {sched_sum:.6f}")
-
-            ϕ_dict = {}
-            sched_sum = 0.0
-            for i_f, name in enumerate(feature_names):
-                if "Scheduling" in name:
-                    sched_sum += ϕ_past_norm[i_f]
-                else:
-                    ϕ_dict[name] = ϕ_past_norm[i_f]
-            if sched_sum > 0:
-                ϕ_dict["Scheduling"] = sched_sum
+            for name, v in ϕ_dict.items():
+                if name != "Scheduling":
+                    print(f"   • {name:16s}: {v:.6f}")
+            if ϕ_dict.get("Scheduling", 0) > 0:
+                print(f"   • Scheduling       : {ϕ_dict['Scheduling']:.6f}")
 
             beta = parsed[target_kpm]
             ϕ_new_unnorm = {}
@@ -254,7 +362,7 @@ for i, prompt_file in enumerate(sorted(glob.glob(INPUT_TXT_GLOB)), start=1):
 
             parsed[target_kpm] = ϕ_abs
 
-            output_path = output_dir / f"LLM_shap_output_{i}_{target_kpm}.json"
+            output_path = env_output_dir / f"LLM_shap_output_{i}_{target_kpm}.json"
             with open(output_path, "w") as f:
                 json.dump({target_kpm: ϕ_abs}, f, indent=2)
             print(f"✅ Saved GPT-4 SHAP output to {output_path}")
@@ -277,3 +385,9 @@ with open(merged_output_path, "w") as f:
     json.dump(merged_by_kpm, f, indent=2)
 
 print(f"📊 Merged SHAP values grouped by KPM saved to {merged_output_path}")
+
+# A β answer that neither local parsing nor the extraction call recovered is a stage failure,
+# so the orchestrator does not run the comparison on missing outputs
+if fallback_failed:
+    sys.exit(f"❌ {fallback_failed} of {len(selected)} β answer(s) could not be parsed "
+             f"(see {env_output_dir / 'json_extraction_stats.json'})")
@@ -2,6 +2,7 @@ import os
 import json
 import numpy as np
 import matplotlib.pyplot as plt
+from shap_store import shared_store
 
 INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
 # Detect slice type from decoded_differences json
@@ -15,7 +16,8 @@ print(f"📂 Detected slice type: {slice_type}")
 
 
 # === Configuration ===
-actual_prefix = f"shap_outputs/ORAN_log_new{INPUT_ENV_ID}"
+shap_store = shared_store("shap_outputs")
+actual_env = f"ORAN_log_new{INPUT_ENV_ID}"
 llm_prefix = f"interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/LLM_shap_output"
 extrap_path = f"interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/extrapolated.json"
 no_know_path = f"interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/no_external_knowledge_llm.json"
@@ -66,21 +68,13 @@ for target in targets:
         print(f"⏭️ Skipping {slice_type} with KPM {target} (Only Avg_Delay_ms for urllc)")
         continue
 
-    actual_path = f"{actual_prefix}_{target}_mean_abs.npy"
-    if not os.path.exists(actual_path):
-        print(f"❌ Missing actual SHAP: {actual_path}")
+    if not shap_store.has(actual_env, target):
+        print(f"❌ Missing actual SHAP: {actual_env} → {target}")
         continue
 
-    # === Load actual SHAP ===
-    data = np.load(actual_path, allow_pickle=True)
-    raw_feats = data[0].tolist()
-    raw_vals = data[1].astype(float).tolist()
-
-    # Merge "Scheduling_*" into "Scheduling"
-    actual_vals_map = {}
-    for feat, val in zip(raw_feats, raw_vals):
-        key = "Scheduling" if feat.startswith("Scheduling") else feat
-        actual_vals_map[key] = actual_vals_map.get(key, 0.0) + val
+    # === Load actual SHAP (Scheduling_* already merged into "Scheduling") ===
+    agg_feats, agg_vals = shap_store.open(actual_env).aggregated(target)
+    actual_vals_map = {feat: float(val) for feat, val in zip(agg_feats, agg_vals)}
 
     # === Get full feature set from all sources
     all_feats = set(actual_vals_map.keys())
@@ -0,0 +1,116 @@
+import os
+import sys
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from shap_store import ShapStore
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "env_encoder"))
+from env_index import EnvIndex, embed, DISTANCE_METRICS
+
+"""
+Reference-environment retrieval benchmark
+-----------------------------------------
+Leave-one-out over every encoded environment that has actual SHAP in the
+store: each one is used as the "new" environment, the others as references.
+For every ENV_DISTANCE metric the retrieved references are scored with the
+same cosine error as _shap_evaluation.py (aggregated mean |SHAP|, feature
+union, Scheduling merged) between the query's actual SHAP and the
+reference's actual SHAP — i.e. how good a starting point the reference is.
+
+Each query is searched in an index built from the other environments only, so
+the Mahalanobis covariance is fitted without the query row.
+
+Reported per metric: mean cosine error of the top-1 reference, mean over the
+top-K, and top-1 hit rate (top-1 is the best available reference). A top-1
+reference that shares no target with the query has no error: it counts as a
+miss in the hit rate and is left out of the top-1 mean (reported as
+"unscored"). The oracle (best reference per query) and random (mean over all
+references) rows bound what any metric can achieve.
+
+Needs encoderEnv.py to have been run (env_encoder/encoded_env) and the SHAP
+store populated (_0_shap_recursive.py).
+"""
+
+ENCODED_DIR = "./env_encoder/encoded_env"
+SHAP_DIR = "./shap_outputs"
+TOP_K = int(os.environ.get("BENCH_TOP_K", "3"))
+SLICE_TARGETS = {"embb": ["Throughput_Mbps"], "urllc": ["Avg_Delay_ms"]}
+DEFAULT_TARGETS = ["user_throughput", "Avg_Delay_ms", "Throughput_Mbps"]
+
+shap_store = ShapStore(SHAP_DIR)
+
+
+def cosine_error(a, b):
+    sim = cosine_similarity([a], [b])[0][0]
+    return 1 - sim
+
+
+def targets_for(env):
+    name = env.lower()
+    for slice_name, targets in SLICE_TARGETS.items():
+        if slice_name in name:
+            return targets
+    return DEFAULT_TARGETS
+
+
+def shap_error(query_env, ref_env):
+    """Mean cosine error over the query's targets that both environments have."""
+    errors = []
+    for target in targets_for(query_env):
+        if not (shap_store.has(query_env, target) and shap_store.has(ref_env, target)):
+            continue
+        q_feat, q_vals = shap_store.open(query_env).aggregated(target)
+        r_feat, r_vals = shap_store.open(ref_env).aggregated(target)
+        q_map, r_map = dict(zip(q_feat, q_vals)), dict(zip(r_feat, r_vals))
+        feature_list = sorted(set(q_map) | set(r_map))
+        errors.append(cosine_error([q_map.get(f, 0.0) for f in feature_list],
+                                   [r_map.get(f, 0.0) for f in feature_list]))
+    return float(np.mean(errors)) if errors else None
+
+
+# === Environments with both an encoding and actual SHAP ===
+all_names, _, _ = embed(ENCODED_DIR, "l2")
+names = [n for n in all_names if shap_store.exists(n)]
+if len(names) < 2:
+    sys.exit(f"❌ Need at least 2 encoded environments with SHAP in {SHAP_DIR}, found {len(names)}")
+rows = [all_names.index(n) for n in names]
+
+# Pairwise SHAP error matrix (NaN where a pair has no common target)
+errors = np.full((len(names), len(names)), np.nan)
+for i, q in enumerate(names):
+    for j, r in enumerate(names):
+        if i != j:
+            e = shap_error(q, r)
+            errors[i, j] = np.nan if e is None else e
+scored = ~np.all(np.isnan(errors), axis=1)
+print(f"📂 {len(names)} environments with SHAP, {int(scored.sum())} usable as queries")
+
+results = {}
+for metric in DISTANCE_METRICS:
+    _, vectors, num_dims = embed(ENCODED_DIR, metric)
+    vectors = vectors[rows]
+
+    top1, topk, hits, unscored = [], [], [], 0
+    for i in np.flatnonzero(scored):
+        refs = np.delete(np.arange(len(names)), i)
+        index = EnvIndex([names[j] for j in refs], vectors[refs], num_dims, metric=metric)
+        _, idx = index.search(vectors[i], k=min(TOP_K, len(refs)))
+        errs = errors[i, refs[idx[0]]]
+        if np.isnan(errs[0]):
+            unscored += 1
+        else:
+            top1.append(errs[0])
+        if not np.all(np.isnan(errs)):
+            topk.append(np.nanmean(errs))
+        hits.append(not np.isnan(errs[0]) and np.isclose(errs[0], np.nanmin(errors[i])))
+    results[metric] = (np.mean(top1) if top1 else np.nan, np.mean(topk) if topk else np.nan, np.mean(hits), unscored)
+
+oracle = np.nanmin(errors[scored], axis=1).mean()
+random = np.nanmean(errors[scored], axis=1).mean()
+
+print(f"\n📊 Retrieval quality (actual-SHAP cosine error, lower is better, top-K = {TOP_K}):")
+for metric, (e1, ek, hit, unscored) in results.items():
+    print(f"   • {metric:<12s} | top-1: {e1:.4f} | top-{TOP_K} mean: {ek:.4f} | top-1 hit rate: {hit:.2%}"
+          f" | unscored top-1: {unscored}")
+print(f"   • {'oracle':<12s} | top-1: {oracle:.4f}")
+print(f"   • {'random':<12s} | top-1: {random:.4f}")
@@ -2,10 +2,12 @@ import numpy as np
 import os
 import json
 from pathlib import Path
+from shap_store import shared_store
 
 INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
 # === CONFIG ===
 SHAP_DIR = "./shap_outputs"
+shap_store = shared_store(SHAP_DIR)
 OUTPUT_PATH = f"./interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/extrapolated.json"
 
 # === Reference environments for extrapolation
@@ -43,14 +45,11 @@ for kpm in kpm_targets:
         print("⚠️ Unknown slice type, keeping all KPMs.")
 
     for env in envs:
-        shap_path = f"{SHAP_DIR}/{env}_{kpm}_mean_abs.npy"
-        if not os.path.exists(shap_path):
-            print(f"❌ Missing SHAP file: {shap_path}")
+        if not shap_store.has(env, kpm):
+            print(f"❌ Missing SHAP for {env} → {kpm} in {SHAP_DIR}")
             continue
 
-        loaded = np.load(shap_path, allow_pickle=True)
-        features = loaded[0]
-        values = loaded[1].astype(float)
+        features, values = shap_store.open(env).mean_abs(kpm)
         vectors.append(values)
         features_list = features
 
@@ -0,0 +1,212 @@
+import os
+import time
+import asyncio
+import tempfile
+from llm_stub_server import StubServer
+
+"""
+queryGPT client check (against the local stub server, no network needed)
+------------------------------------------------------------------------
+* pooled client: many calls share one keep-alive connection
+* model / temperature pass-through (temperature omitted for o-series)
+* retries: 429 with Retry-After is honoured, 5xx and read timeouts are retried,
+  400 fails immediately, exhausted retries raise
+* Query_GPT4_batch: requests run concurrently, results keep submission order,
+  failures can be returned in place; RPM / TPM buckets throttle
+* response cache: a repeated prompt costs no request, temperature is part of
+  the key, replay mode never calls the API nor writes the cache, TTL expiry and
+  LRU size bound
+"""
+
+server = StubServer().start()
+os.environ["OPENAI_BASE_URL"] = server.base_url
+os.environ["OPENAI_API_KEY"] = "stub-key"
+os.environ["ORCA_LLM_TIMEOUT"] = "0.5"
+os.environ["ORCA_LLM_MAX_RETRIES"] = "3"
+os.environ["ORCA_LLM_BACKOFF_BASE"] = "0.05"
+os.environ["ORCA_LLM_CACHE_MODE"] = "off"  # enabled explicitly for the cache checks below
+
+import openai  # noqa: E402
+import queryGPT  # noqa: E402
+import llm_batch  # noqa: E402
+from queryGPT import Query_GPT4, Query_GPT4_batch, RateLimiter, CacheMissError  # noqa: E402
+from llm_cache import ResponseCache  # noqa: E402
+
+failures = 0
+
+
+def check(name, ok, detail=""):
+    global failures
+    failures += not ok
+    print(f"   {'✅' if ok else '❌'} {name}{(' — ' + detail) if detail else ''}")
+
+
+def attempts_of(fn):
+    before = len(server.requests)
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as err:  # noqa: BLE001
+        result = err
+    return result, len(server.requests) - before, time.perf_counter() - start
+
+
+print("🧪 queryGPT against", server.base_url)
+
+# --- Pooling -------------------------------------------------------------
+for i in range(20):
+    Query_GPT4("sys", f"ping {i}", 0)
+ports = {r["port"] for r in server.requests[-20:]}
+check("20 calls reuse one connection", len(ports) == 1, f"{len(ports)} distinct client port(s)")
+
+# --- Pass-through ----------------------------------------------------------
+Query_GPT4("sys", "o-series", 0)
+body = server.requests[-1]["body"]
+check("default model is o4-mini without temperature", body["model"] == "o4-mini" and "temperature" not in body, str(body.get("model")))
+Query_GPT4("sys", "chat model", 0.3, model="gpt-4o")
+body = server.requests[-1]["body"]
+check("temperature passed for gpt-4o", body["model"] == "gpt-4o" and body.get("temperature") == 0.3, str(body.get("temperature")))
+
+# --- Retries ------------------------------------------------------------------
+server.script += [(429, {"Retry-After": "0.3"}, 0.0)] * 2
+result, n, elapsed = attempts_of(lambda: Query_GPT4("sys", "rate limited", 0))
+check("429 ×2 then success", isinstance(result, str) and n == 3, f"{n} attempts")
+check("Retry-After honoured", elapsed >= 0.6, f"{elapsed:.2f}s")
+
+server.script += [(503, {}, 0.0), (500, {}, 0.0)]
+result, n, _ = attempts_of(lambda: Query_GPT4("sys", "server error", 0))
+check("5xx retried", isinstance(result, str) and n == 3, f"{n} attempts")
+
+server.script += [(200, {}, 1.0)]
+result, n, _ = attempts_of(lambda: Query_GPT4("sys", "slow", 0))
+check("read timeout retried", isinstance(result, str) and n == 2, f"{n} attempts")
+
+server.script += [(400, {}, 0.0)]
+result, n, _ = attempts_of(lambda: Query_GPT4("sys", "bad request", 0))
+check("400 not retried", isinstance(result, openai.BadRequestError) and n == 1, f"{n} attempt(s)")
+
+server.script += [(429, {"retry-after-ms": "10"}, 0.0)] * 4
+result, n, _ = attempts_of(lambda: Query_GPT4("sys", "always limited", 0))
+check("exhausted retries raise", isinstance(result, openai.RateLimitError) and n == 4, f"{n} attempts")
+
+# --- Batch engine ------------------------------------------------------------
+server.script += [(200, {}, 0.3)] * 16
+start = time.perf_counter()
+results = Query_GPT4_batch([("sys", f"batch {i}") for i in range(16)], concurrency=8)
+elapsed = time.perf_counter() - start
+check("batch keeps submission order", all(f"batch {i})" in r for i, r in enumerate(results)))
+check("batch runs concurrently", elapsed < 1.2, f"16 × 0.3s in {elapsed:.2f}s with concurrency 8")
+
+server.script += [(200, {}, 0.0), (400, {}, 0.0)]
+results = Query_GPT4_batch([("sys", "ok"), ("sys", "bad")], concurrency=1, return_exceptions=True)
+check("batch returns failures in place", isinstance(results[0], str) and isinstance(results[1], openai.BadRequestError))
+
+
+async def drain(limiter, sizes):
+    start = time.perf_counter()
+    for size in sizes:
+        await limiter.acquire(size)
+    return time.perf_counter() - start
+
+elapsed = asyncio.run(drain(RateLimiter(rpm=120, tpm=0), [1] * 123))
+check("RPM bucket throttles after the burst", 1.3 < elapsed < 2.5, f"123 requests at 120 rpm in {elapsed:.2f}s")
+elapsed = asyncio.run(drain(RateLimiter(rpm=0, tpm=6000), [6000, 100]))
+check("TPM bucket throttles", 0.8 < elapsed < 1.8, f"6100 tokens at 6000 tpm in {elapsed:.2f}s")
+
+# --- Response cache -------------------------------------------------------------
+tmp_dir = tempfile.mkdtemp()
+queryGPT.CACHE_PATH = os.path.join(tmp_dir, "cache.sqlite")
+queryGPT.CACHE_MODE = "readwrite"
+
+first, n1, _ = attempts_of(lambda: Query_GPT4("sys", "cache me", 0.2, model="gpt-4o"))
+again, n2, _ = attempts_of(lambda: Query_GPT4("sys", "cache me", 0.2, model="gpt-4o"))
+check("repeated prompt served from cache", first == again and (n1, n2) == (1, 0), f"{n1} then {n2} request(s)")
+_, n3, _ = attempts_of(lambda: Query_GPT4("sys", "cache me", 0.7, model="gpt-4o"))
+check("temperature is part of the key", n3 == 1, f"{n3} request(s)")
+_, n4, _ = attempts_of(lambda: Query_GPT4_batch([("sys", "cache me", 0.2), ("sys", "batch new", 0.2)], model="gpt-4o"))
+check("batch uses the cache", n4 == 1, f"{n4} request(s) for 1 cached + 1 new prompt")
+
+queryGPT.CACHE_MODE = "replay"
+db_changes = queryGPT.get_cache()._db.total_changes
+hit, n5, _ = attempts_of(lambda: Query_GPT4("sys", "cache me", 0.2, model="gpt-4o"))
+miss, n6, _ = attempts_of(lambda: Query_GPT4("sys", "never seen", 0.2, model="gpt-4o"))
+check("replay answers hits and raises on misses without calling the API",
+      hit == first and isinstance(miss, CacheMissError) and n5 + n6 == 0)
+check("replay does not write to the cache", queryGPT.get_cache()._db.total_changes == db_changes)
+counters = queryGPT.get_cache().counters
+check("hit / miss counters", counters["hits"] == 3 and counters["misses"] == 4, str(counters))
+
+def snapshot(path):
+    return {p: open(p, "rb").read() for p in (path, path + "-wal") if os.path.exists(p)}
+
+before_files = snapshot(queryGPT.CACHE_PATH)
+replay_cache = ResponseCache(queryGPT.CACHE_PATH, readonly=True)
+replay_hit = replay_cache.get(queryGPT.cache_key("gpt-4o", "sys", "cache me", 0.2))
+replay_cache.close()
+missing = os.path.join(tmp_dir, "missing", "cache.sqlite")
+empty = ResponseCache(missing, readonly=True)
+check("read-only cache opens without creating or modifying files",
+      replay_hit == first and snapshot(queryGPT.CACHE_PATH) == before_files
+      and empty.get("k") is None and not os.path.exists(os.path.dirname(missing)))
+
+ttl_cache = ResponseCache(os.path.join(tmp_dir, "ttl.sqlite"), ttl=0.2)
+ttl_cache.put("k", "m", {}, "v")
+fresh = ttl_cache.get("k")
+time.sleep(0.3)
+check("TTL expiry", fresh == "v" and ttl_cache.get("k") is None)
+
+lru = ResponseCache(os.path.join(tmp_dir, "lru.sqlite"), max_bytes=3000)
+for i in range(5):
+    lru.put(f"k{i}", "m", {}, "x" * 998)   # 1000 bytes each with the "{}" request
+    time.sleep(0.01)
+    lru.get("k0")                          # keep k0 recently used
+kept = [k for k in ("k0", "k1", "k2", "k3", "k4") if lru.get(k) is not None]
+check("LRU eviction keeps recent entries within the size bound", kept == ["k0", "k3", "k4"], str(kept))
+
+# --- Batch backend -----------------------------------------------------------------
+llm_batch.BATCH_DIR = os.path.join(tmp_dir, "batches")
+llm_batch.POLL_INTERVAL = 0.05
+queryGPT.LLM_BACKEND = "batch"
+queryGPT.CACHE_MODE = "readwrite"
+
+before = len(server.requests)
+results = Query_GPT4_batch([("sys", "cache me", 0.2)] + [("sys", f"offline {i}", 0.2) for i in range(5)], model="gpt-4o")
+paths = [r["path"] for r in server.requests[before:]]
+check("batch job: one upload, one batch, no chat calls",
+      paths.count("/v1/files") == 1 and paths.count("/v1/batches") == 1
+      and not any(p.endswith("/chat/completions") for p in paths), str(paths))
+check("batch responses map back in order (cached prompt not submitted)",
+      results[0] == first and all(f"offline {i})" in r for i, r in enumerate(results[1:]))
+      and server.batches["batch-stub-0"]["request_counts"]["total"] == 5)
+_, n7, _ = attempts_of(lambda: Query_GPT4_batch([("sys", "offline 3", 0.2)], model="gpt-4o"))
+check("batch results are cached", n7 == 0, f"{n7} request(s)")
+
+server.batch_fail_ids = {"req-000001"}
+results = Query_GPT4_batch([("sys", "fail 0"), ("sys", "fail 1")], model="gpt-4o", return_exceptions=True)
+check("failed batch lines come back in place",
+      isinstance(results[0], str) and isinstance(results[1], llm_batch.BatchRequestError))
+server.batch_fail_ids = set()
+
+queryGPT.CACHE_MODE = "off"
+server.batch_poll_errors = 2
+results = Query_GPT4_batch([("sys", "poll retry 0"), ("sys", "poll retry 1")], model="gpt-4o", return_exceptions=True)
+check("transient poll errors are retried, not fatal",
+      server.batch_poll_errors == 0 and all(f"poll retry {i})" in r for i, r in enumerate(results)), str(results))
+
+kwargs_list = [queryGPT.chat_kwargs("sys", f"resume {i}", 0, "gpt-4o") for i in range(3)]
+server.batch_polls = 10**6                  # never finishes: the first run gives up polling
+try:
+    llm_batch.run_batch(kwargs_list, queryGPT.get_client(), tag="resume", timeout=0.1)
+except TimeoutError:
+    pass
+server.batch_polls = 0
+before = len(server.requests)
+resumed = llm_batch.run_batch(kwargs_list, queryGPT.get_client(), tag="resume")
+paths = [r["path"] for r in server.requests[before:]]
+check("rerun resumes the pending batch instead of resubmitting",
+      "/v1/batches" not in paths and all(f"resume {i})" in r for i, r in enumerate(resumed)), str(paths))
+queryGPT.LLM_BACKEND = "async"
+
+server.stop()
+print("\n✅ All checks passed" if not failures else f"\n❌ {failures} check(s) failed")
+raise SystemExit(1 if failures else 0)
@@ -4,6 +4,7 @@ import os
 import re
 from pathlib import Path
 from queryGPT import Query_GPT4
+from shap_store import shared_store
 
 INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
 # === Reference environments for extrapolation
@@ -24,6 +25,7 @@ print(f"📂 Detected slice type from {env1}: {slice_type}")
 
 # === CONFIG ===
 shap_dir = Path("./shap_outputs")
+shap_store = shared_store(str(shap_dir))
 output_dir = Path(f"./interim_results/_9_shap_output/env_new{INPUT_ENV_ID}")
 output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -45,24 +47,17 @@ for kpm in kpm_keys:
     else:
         kpm_keys = ["Throughput_Mbps", "Avg_Delay_ms", "user_throughput"] 
         
-    f1 = shap_dir / f"{env1}_{kpm}_mean_abs.npy"
-    f2 = shap_dir / f"{env2}_{kpm}_mean_abs.npy"
-
-    if not (f1.exists() and f2.exists()):
+    if not (shap_store.has(env1, kpm) and shap_store.has(env2, kpm)):
         raise FileNotFoundError(f"Missing SHAP files for {kpm}")
 
-    arr1 = np.load(f1, allow_pickle=True)
-    arr2 = np.load(f2, allow_pickle=True)
-
-    features = arr1[0]
-    values1 = arr1[1].astype(float)
-    values2 = arr2[1].astype(float)
+    features, values1 = shap_store.open(env1).mean_abs(kpm)
+    _, values2 = shap_store.open(env2).mean_abs(kpm)
 
     if not np.allclose(values1, values2, atol=1e-3):
         print(f"⚠️ SHAP values for {kpm} are not exactly identical between {env1} and {env2}.")
 
-    shap_env1[kpm] = {f: round(v, 4) for f, v in zip(features, values1)}
-    shap_env2[kpm] = {f: round(v, 4) for f, v in zip(features, values2)}
+    shap_env1[kpm] = {f: round(float(v), 4) for f, v in zip(features, values1)}
+    shap_env2[kpm] = {f: round(float(v), 4) for f, v in zip(features, values2)}
 
 # === Load environment differences ===
 diff_txt = []
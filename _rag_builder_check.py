@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+import subprocess
+import numpy as np
+import faiss
+from scipy import sparse
+import rag_builder
+from _3_hybrid_rag_retrieval import HybridRetriever
+
+"""
+rag_builder check on a small generated text corpus
+--------------------------------------------------
+* first build writes every file _3_hybrid_rag_retrieval.py loads, row-aligned
+* an unchanged corpus is not re-embedded and keeps its index version
+* appending a document embeds only its chunks and keeps existing document ids
+* editing / deleting a document drops its stale chunks without re-embedding the rest
+* the saved TF-IDF matrix stamps match, so retrieval does not rebuild it
+* an interrupted build leaves no manifest, the retriever refuses to load it, and
+  the next build starts from scratch
+* `python rag_builder.py build` (the CLI) writes a documents.pkl other processes can load
+
+RAG_CHECK_ENCODER=hash swaps all-MiniLM-L6-v2 for a deterministic hashing
+encoder when the model cannot be downloaded.
+"""
+
+
+class HashEncoder:
+    def encode(self, texts, batch_size=None):
+        return np.stack([np.frombuffer(hashlib.sha256(t.encode("utf-8")).digest(), dtype=np.uint8)
+                         .astype(np.float32) / 255.0 for t in texts])
+
+
+class CountingEncoder:
+    def __init__(self, inner):
+        self.inner, self.encoded, self.calls = inner, 0, 0
+
+    def encode(self, texts, batch_size=None):
+        self.calls += 1
+        self.encoded += len(texts)
+        return self.inner.encode(texts, batch_size=batch_size)
+
+
+if os.environ.get("RAG_CHECK_ENCODER", "model") == "hash":
+    base_encoder = HashEncoder()
+else:
+    from sentence_transformers import SentenceTransformer
+    base_encoder = SentenceTransformer(rag_builder.EMBED_MODEL)
+
+failures = 0
+
+
+def check(name, ok, detail=""):
+    global failures
+    failures += not ok
+    print(f"   {'✅' if ok else '❌'} {name}{(' — ' + detail) if detail else ''}")
+
+
+def write_doc(corpus, name, topic, paragraphs):
+    with open(os.path.join(corpus, name), "w") as f:
+        f.write("\n\n".join(f"{topic} paragraph {p}: " + " ".join(f"{topic}-term{(p * 7 + w) % 50}" for w in range(40))
+                            for p in range(paragraphs)))
+
+
+def load(index_dir):
+    with open(os.path.join(index_dir, "documents.pkl"), "rb") as f:
+        docs = pickle.load(f)
+    return docs, faiss.read_index(os.path.join(index_dir, "dense_index.faiss"))
+
+
+def build(corpus, index_dir):
+    encoder = CountingEncoder(base_encoder)
+    manifest = rag_builder.build(corpus, index_dir, encoder=encoder)
+    return manifest, encoder
+
+
+tmp = tempfile.mkdtemp()
+corpus, index_dir = os.path.join(tmp, "corpus"), os.path.join(tmp, "rag_index")
+os.makedirs(corpus)
+write_doc(corpus, "oran_e2.txt", "e2", 20)
+write_doc(corpus, "nr_mac.md", "mac", 15)
+rag_builder.EMBED_BATCH = 8
+
+print("🧪 rag_builder on", corpus)
+manifest, enc = build(corpus, index_dir)
+docs, index = load(index_dir)
+emb = np.load(os.path.join(index_dir, "embeddings.npy"))
+vectorizer = pickle.load(open(os.path.join(index_dir, "tfidf_vectorizer.pkl"), "rb"))
+matrix = sparse.load_npz(os.path.join(index_dir, "tfidf_matrix.npz"))
+check("first build is row-aligned", len(docs) == index.ntotal == emb.shape[0] == matrix.shape[0] == manifest["num_chunks"],
+      f"{len(docs)} chunk(s)")
+check("embedded in batches", enc.calls == -(-enc.encoded // 8) and enc.encoded == len(docs), f"{enc.calls} encode call(s)")
+_, hit = index.search(emb[[3]], 1)
+check("dense index returns a chunk for its own vector", hit[0, 0] == 3)
+check("TF-IDF matrix matches the vectorizer", matrix.shape[1] == len(vectorizer.vocabulary_))
+with open(os.path.join(index_dir, "tfidf_matrix.json")) as f:
+    stamps = json.load(f)["stamps"]
+check("TF-IDF stamps match documents.pkl / vectorizer",
+      stamps["documents"] == rag_builder.file_stamp(os.path.join(index_dir, "documents.pkl"))
+      and stamps["vectorizer"] == rag_builder.file_stamp(os.path.join(index_dir, "tfidf_vectorizer.pkl")))
+
+again, enc = build(corpus, index_dir)
+check("unchanged corpus is not re-embedded", enc.encoded == 0 and again["index_version"] == manifest["index_version"])
+
+write_doc(corpus, "ric_xapp.txt", "xapp", 6)
+before = [d.page_content for d in docs]
+appended, enc = build(corpus, index_dir)
+docs, index = load(index_dir)
+new_chunks = appended["num_chunks"] - manifest["num_chunks"]
+check("append embeds only the new chunks", enc.encoded == new_chunks > 0, f"{enc.encoded} embedded, {new_chunks} new")
+check("existing document ids are stable", [d.page_content for d in docs[:len(before)]] == before)
+check("dense index extended", index.ntotal == len(docs) and appended["index_version"] == manifest["index_version"] + 1)
+
+write_doc(corpus, "nr_mac.md", "mac", 12)   # shorter: trailing chunks disappear
+os.remove(os.path.join(corpus, "ric_xapp.txt"))
+edited, enc = build(corpus, index_dir)
+docs, index = load(index_dir)
+emb = np.load(os.path.join(index_dir, "embeddings.npy"))
+check("edit / delete drops stale chunks", index.ntotal == len(docs) == emb.shape[0]
+      and not any(d.metadata["source"] == "ric_xapp.txt" for d in docs), f"{len(docs)} chunk(s)")
+check("unchanged chunks are not re-embedded", enc.encoded < edited["num_chunks"], f"{enc.encoded} embedded")
+check("embeddings still match their chunks",
+      np.allclose(emb, np.asarray(base_encoder.encode([d.page_content for d in docs]), dtype=np.float32), atol=1e-5))
+check("manifest history", [h["index_version"] for h in edited["history"]] == [1, 2, 3], str(edited["history"]))
+
+real_replace = os.replace
+
+
+def crash_on_documents(src, dst):
+    if os.path.basename(dst) == "documents.pkl":
+        raise OSError("simulated crash")
+    real_replace(src, dst)
+
+
+write_doc(corpus, "ric_xapp.txt", "xapp", 6)
+os.replace = crash_on_documents
+try:
+    build(corpus, index_dir)
+    check("interrupted build raises", False)
+except OSError:
+    pass
+finally:
+    os.replace = real_replace
+check("interrupted build leaves no manifest", rag_builder.load_manifest(index_dir) is None)
+try:
+    HybridRetriever(index_dir)
+    check("retriever refuses the interrupted index", False)
+except RuntimeError as e:
+    check("retriever refuses the interrupted index", True, str(e).splitlines()[0][:70])
+recovered, enc = build(corpus, index_dir)
+docs, index = load(index_dir)
+check("next build starts from scratch and is consistent", index.ntotal == len(docs) == recovered["num_chunks"]
+      and enc.encoded == len(docs) and recovered["index_version"] == 1, f"{enc.encoded} embedded")
+
+# CLI path: a copied document needs no encoder (its chunk hashes are known), but its chunks are new
+# Documents created by rag_builder running as __main__
+with open(os.path.join(corpus, "nr_mac.md")) as src, open(os.path.join(corpus, "nr_mac_copy.md"), "w") as dst:
+    dst.write(src.read())
+env = dict(os.environ, RAG_CORPUS_DIR=corpus, RAG_INDEX_DIR=index_dir)
+cli = subprocess.run([sys.executable, "rag_builder.py", "build"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                     env=env, capture_output=True, text=True)
+check("CLI build succeeds", cli.returncode == 0, cli.stderr.strip().splitlines()[-1] if cli.returncode else "")
+load_code = ("import pickle, sys; docs = pickle.load(open(sys.argv[1], 'rb')); "
+             "print(len(docs), type(docs[0]).__module__)")
+loaded = subprocess.run([sys.executable, "-c", load_code, os.path.join(index_dir, "documents.pkl")],
+                        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+check("CLI documents.pkl loads in another process", loaded.returncode == 0
+      and "__main__" not in loaded.stdout, (loaded.stdout or loaded.stderr).strip().splitlines()[-1])
+
+print("\n✅ All checks passed" if not failures else f"\n❌ {failures} check(s) failed")
+raise SystemExit(1 if failures else 0)
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import pickle
+import random
+import tempfile
+import numpy as np
+import faiss
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sklearn.feature_extraction.text import HashingVectorizer
+import rag_builder
+from rag_fusion import fuse, canonical_ids, topk_rows
+
+"""
+Hybrid fusion benchmark: recall / MRR / chunks-to-LLM / latency
+---------------------------------------------------------------
+Compares, on a labeled query set against a rag_index:
+
+* dense / sparse        – each retriever alone, top-N
+* concat (previous)     – dense top-N + sparse top-N, deduplicated on text
+                          (what _3_hybrid_rag_retrieval.py used to emit: up to 2N chunks)
+* rrf / weighted        – rag_fusion over FUSION_DEPTH candidates per retriever, top-N
+
+Labeled set (RAG_BENCH_SET, JSONL): {"query": ..., "relevant": [doc ids or source names]}.
+Without one, queries are sampled from the index itself: a shuffled, partly
+dropped word window of a random chunk, labeled with that chunk. Without an
+index, a small synthetic corpus is built with rag_builder in a temp dir.
+
+RAG_BENCH_ENCODER=hashing uses a bag-of-words hashing encoder instead of
+all-MiniLM-L6-v2 (offline runs; the dense side is then lexical as well).
+"""
+
+# === Config ===
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "./rag_index")
+BENCH_SET = os.environ.get("RAG_BENCH_SET", os.path.join(INDEX_DIR, "labeled_queries.jsonl"))
+NUM_QUERIES = int(os.environ.get("RAG_BENCH_QUERIES", "200"))
+ENCODER = os.environ.get("RAG_BENCH_ENCODER", "model")
+TOP_N = 5
+FUSION_DEPTH = 20
+SEED = 7
+
+
+class HashingEncoder:
+    def __init__(self, dims=512):
+        self.vectorizer = HashingVectorizer(n_features=dims, alternate_sign=False)
+
+    def encode(self, texts, batch_size=None):
+        return normalize(self.vectorizer.transform(texts)).toarray().astype(np.float32)
+
+
+def synthetic_corpus(folder, rng):
+    vocab = [f"term{i}" for i in range(400)]
+    topics = ["PRB allocation", "SNR estimation", "slice scheduling", "E2 interface", "beam tilt", "HARQ delay"]
+    os.makedirs(folder, exist_ok=True)
+    for t, topic in enumerate(topics):
+        local = rng.sample(vocab, 80)
+        paragraphs = [topic + ": " + " ".join(rng.choice(local) for _ in range(60)) + "." for _ in range(25)]
+        with open(os.path.join(folder, f"spec_{t}.txt"), "w") as f:
+            f.write("\n\n".join(paragraphs))
+
+
+def sample_queries(documents, canonical, rng, n):
+    queries = []
+    for doc_id in rng.sample(range(len(documents)), min(n, len(documents))):
+        words = documents[doc_id].page_content.split()
+        start = rng.randrange(max(1, len(words) - 12))
+        window = [w for j, w in enumerate(words[start:start + 12]) if j % 2 == 0]
+        rng.shuffle(window)
+        queries.append({"query": " ".join(window), "relevant": {int(canonical[doc_id])}})
+    return queries
+
+
+def load_labeled(path, documents, canonical):
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            relevant = set()
+            for item in entry["relevant"]:
+                if isinstance(item, int):
+                    relevant.add(int(canonical[item]))
+                else:
+                    relevant.update(int(canonical[i]) for i, d in enumerate(documents) if d.metadata.get("source") == item)
+            queries.append({"query": entry["query"], "relevant": relevant})
+    return queries
+
+
+def main():
+    rng = random.Random(SEED)
+    encoder = HashingEncoder() if ENCODER == "hashing" else None
+    index_dir = INDEX_DIR
+    if not os.path.exists(os.path.join(index_dir, "manifest.json")) and not os.path.exists(
+            os.path.join(index_dir, "dense_index.faiss")):
+        tmp = tempfile.mkdtemp()
+        print(f"📦 No index at {index_dir}: building a synthetic corpus in {tmp}")
+        synthetic_corpus(os.path.join(tmp, "corpus"), rng)
+        index_dir = os.path.join(tmp, "rag_index")
+        rag_builder.build(os.path.join(tmp, "corpus"), index_dir, encoder=encoder or HashingEncoder())
+        encoder = encoder or HashingEncoder()
+    if encoder is None:
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer("all-MiniLM-L6-v2")
+
+    with open(os.path.join(index_dir, "documents.pkl"), "rb") as f:
+        documents = pickle.load(f)
+    with open(os.path.join(index_dir, "tfidf_vectorizer.pkl"), "rb") as f:
+        vectorizer = pickle.load(f)
+    faiss_index = faiss.read_index(os.path.join(index_dir, "dense_index.faiss"))
+    matrix_path = os.path.join(index_dir, "tfidf_matrix.npz")
+    tfidf_matrix = (sparse.load_npz(matrix_path) if os.path.exists(matrix_path)
+                    else normalize(vectorizer.transform([d.page_content for d in documents]))).tocsr()
+    canonical = canonical_ids(documents)
+
+    bench_set = BENCH_SET if index_dir == INDEX_DIR else ""
+    queries = (load_labeled(bench_set, documents, canonical) if os.path.exists(bench_set)
+               else sample_queries(documents, canonical, rng, NUM_QUERIES))
+    texts = [q["query"] for q in queries]
+    print(f"🧪 {len(queries)} labeled queries over {len(documents)} chunks "
+          f"({'labeled set' if os.path.exists(bench_set) else 'sampled from the index'})")
+
+    # --- Shared retrieval (identical for every method) ----------------------
+    start = time.perf_counter()
+    D, I = faiss_index.search(np.ascontiguousarray(encoder.encode(texts), dtype=np.float32), FUSION_DEPTH)
+    dense_ms = (time.perf_counter() - start) * 1000 / len(texts)
+    start = time.perf_counter()
+    sparse_ids, sparse_scores = topk_rows((normalize(vectorizer.transform(texts)) @ tfidf_matrix.T).toarray(),
+                                          FUSION_DEPTH)
+    sparse_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    def concat(q):
+        seen, out = set(), []
+        for doc in list(I[q][:TOP_N]) + list(sparse_ids[q][:TOP_N]):
+            if doc >= 0 and documents[doc].page_content not in seen:
+                seen.add(documents[doc].page_content)
+                out.append(int(canonical[doc]))
+        return out
+
+    methods = {
+        "dense": lambda q: [int(canonical[d]) for d in I[q][:TOP_N] if d >= 0],
+        "sparse": lambda q: [int(canonical[d]) for d in sparse_ids[q][:TOP_N]],
+        "concat (previous)": concat,
+        "rrf": lambda q: [d for d, _ in fuse([(I[q], -D[q]), (sparse_ids[q], sparse_scores[q])], "rrf",
+                                             TOP_N, canonical)],
+        "weighted": lambda q: [d for d, _ in fuse([(I[q], -D[q]), (sparse_ids[q], sparse_scores[q])], "weighted",
+                                                  TOP_N, canonical)],
+    }
+
+    print(f"\n⏱️ shared retrieval: dense {dense_ms:.3f} ms/query, sparse {sparse_ms:.3f} ms/query\n")
+    print(f"{'method':<20}{'recall':>8}{'MRR':>8}{'chunks':>8}{'ms/query':>10}")
+    for name, method in methods.items():
+        start = time.perf_counter()
+        ranked = [method(q) for q in range(len(queries))]
+        elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+        hits = [next((r for r, d in enumerate(docs, 1) if d in q["relevant"]), None)
+                for docs, q in zip(ranked, queries)]
+        recall = np.mean([h is not None for h in hits])
+        mrr = np.mean([1.0 / h if h else 0.0 for h in hits])
+        chunks = np.mean([len(docs) for docs in ranked])
+        print(f"{name:<20}{recall:>8.3f}{mrr:>8.3f}{chunks:>8.1f}{elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
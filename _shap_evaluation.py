@@ -3,11 +3,13 @@ import json
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from pathlib import Path
+from shap_store import ShapStore
 
 INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
 
 # === Paths ===
-actual_prefix = f"shap_outputs/ORAN_log_new{INPUT_ENV_ID}"
+shap_store = ShapStore("shap_outputs")
+actual_env = f"ORAN_log_new{INPUT_ENV_ID}"
 llm_prefix = f"interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/LLM_shap_output"
 extrap_path = f"interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/extrapolated.json"
 no_know_path = f"interim_results/_9_shap_output/env_new{INPUT_ENV_ID}/no_external_knowledge_llm.json"
@@ -77,20 +79,13 @@ def nrmse_max(a, b):
 
 # === Evaluate per target
 for target in targets:
-    actual_path = f"{actual_prefix}_{target}_mean_abs.npy"
-    if not os.path.exists(actual_path):
-        print(f"❌ Missing actual SHAP: {actual_path}")
+    if not shap_store.has(actual_env, target):
+        print(f"❌ Missing actual SHAP: {actual_env} → {target}")
         continue
 
-    # === Load actual
-    arr = np.load(actual_path, allow_pickle=True)
-    raw_feats = arr[0].tolist()
-    raw_vals = arr[1].astype(float).tolist()
-
-    actual_map = {}
-    for feat, val in zip(raw_feats, raw_vals):
-        key = "Scheduling" if feat.startswith("Scheduling") else feat
-        actual_map[key] = actual_map.get(key, 0.0) + val
+    # === Load actual (Scheduling_* already merged into "Scheduling")
+    agg_feats, agg_vals = shap_store.open(actual_env).aggregated(target)
+    actual_map = {feat: float(val) for feat, val in zip(agg_feats, agg_vals)}
 
     # === Union of all features
     feature_union = set(actual_map.keys())
@@ -0,0 +1,159 @@
+import os
+import sys
+import ast
+import time
+import shutil
+import tarfile
+import tempfile
+import statistics
+import subprocess
+from orca_orchestrator import GLOBAL_DAG, ENV_DAG
+
+"""
+Stage start-up benchmark
+------------------------
+For every pipeline stage script, times what a stage pays before it does any
+work: the interpreter plus the script's module-level imports.
+
+* cold      – a fresh interpreter importing the stage's top-level imports, as
+              run_ORCA.sh paid for every stage of every environment
+              (median of STARTUP_BENCH_RUNS runs; "wall" includes interpreter start)
+* warm      – the same imports in a process already warmed like an
+              orca_orchestrator worker (warm_worker()); global stages always run cold
+* heaviest  – the top-level imports that dominate the cold time (python -X importtime)
+
+STARTUP_BENCH_BASELINE=<git rev> (e.g. HEAD~1) also measures the cold imports
+of that revision's stage scripts, for a before / after column.
+"""
+
+# === Config ===
+RUNS = int(os.environ.get("STARTUP_BENCH_RUNS", "3"))
+BASELINE = os.environ.get("STARTUP_BENCH_BASELINE", "")
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RAG_SCRIPTS = ["_2_query_generator.py", "_3_hybrid_rag_retrieval.py", "_4_rerank_with_llm.py",
+               "_6_generate_organized_answer.py", "rag_pipeline.py"]
+
+PROBE = """
+import time
+{warm}
+start = time.perf_counter()
+{imports}
+print("IMPORT_MS", (time.perf_counter() - start) * 1000)
+"""
+
+
+def stages():
+    """(stage, cwd relative to the root, script, warmable) in pipeline order."""
+    out = [(stage, cwd, script, False) for stage, cwd, script in GLOBAL_DAG]
+    out += [(stage, ".", script, True) for stage, (script, _) in ENV_DAG.items()]
+    known = {script for _, _, script, _ in out}
+    out += [(os.path.splitext(script)[0], ".", script, True) for script in RAG_SCRIPTS if script not in known]
+    return out
+
+
+def top_level_imports(path):
+    """Source of the module-level import statements of a script (including those under try / if)."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    imports, pending = [], list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.unparse(node))
+        elif isinstance(node, (ast.If, ast.Try)) and not (isinstance(node, ast.If) and "__main__" in ast.unparse(node.test)):
+            pending[:0] = list(node.body)
+    return "\n".join(imports)
+
+
+def run_probe(root, cwd, code, extra_args=()):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.path.join(root, cwd)]), MPLBACKEND="Agg")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *extra_args, "-c", code], cwd=os.path.join(root, cwd), env=env,
+                            capture_output=True, text=True)
+    wall = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}")
+    import_ms = next(float(line.split()[1]) for line in result.stdout.splitlines() if line.startswith("IMPORT_MS"))
+    return import_ms, wall, result.stderr
+
+
+def imported_names(importtime_log):
+    return {line.split("|")[2].strip() for line in importtime_log.splitlines()
+            if line.startswith("import time:") and "cumulative" not in line}
+
+
+def heaviest(importtime_log, skip=(), n=3):
+    """Top-level modules by cumulative import time from a -X importtime log (interpreter start-up excluded)."""
+    top = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith(" ") and not name.startswith("  ") and name.strip() not in skip:
+            top.append((int(cumulative), name.strip()))
+    return ", ".join(f"{name} {us / 1e6:.2f}s" for us, name in sorted(top, reverse=True)[:n])
+
+
+def measure(root, cwd, script, warm, startup_modules=()):
+    imports = top_level_imports(os.path.join(root, cwd, script))
+    cold = [run_probe(root, cwd, PROBE.format(warm="", imports=imports)) for _ in range(RUNS)]
+    result = {"cold_ms": statistics.median(c[0] for c in cold), "wall_ms": statistics.median(c[1] for c in cold)}
+    _, _, log = run_probe(root, cwd, PROBE.format(warm="", imports=imports), ["-X", "importtime"])
+    result["heaviest"] = heaviest(log, startup_modules)
+    if warm:
+        warm_code = "import orca_orchestrator\norca_orchestrator.warm_worker()"
+        result["warm_ms"] = statistics.median(run_probe(root, cwd, PROBE.format(warm=warm_code, imports=imports))[0]
+                                              for _ in range(RUNS))
+    return result
+
+
+def export_revision(rev):
+    folder = tempfile.mkdtemp(prefix="startup_bench_")
+    archive = os.path.join(folder, "tree.tar")
+    subprocess.run(["git", "archive", "-o", archive, rev], cwd=ROOT, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(os.path.join(folder, "tree"))
+    return os.path.join(folder, "tree")
+
+
+def main():
+    _, interpreter_ms, _ = run_probe(ROOT, ".", PROBE.format(warm="", imports="pass"))
+    startup_modules = imported_names(run_probe(ROOT, ".", PROBE.format(warm="", imports="pass"), ["-X", "importtime"])[2])
+    baseline_root = export_revision(BASELINE) if BASELINE else None
+    print(f"🧪 Stage start-up over {RUNS} run(s); bare interpreter {interpreter_ms:.0f} ms"
+          + (f"; baseline {BASELINE}" if BASELINE else ""))
+
+    header = f"\n{'stage':<28}{'cold ms':>9}{'wall ms':>9}{'warm ms':>9}"
+    header += f"{'base ms':>9}" if BASELINE else ""
+    print(header + "   heaviest cold imports")
+    totals = {"cold_ms": 0.0, "warm_ms": 0.0, "base_ms": 0.0}
+    for stage, cwd, script, warm in stages():
+        try:
+            result = measure(ROOT, cwd, script, warm, startup_modules)
+        except RuntimeError as e:
+            print(f"{stage:<28}  ❌ {e}")
+            continue
+        line = f"{stage:<28}{result['cold_ms']:>9.0f}{result['wall_ms']:>9.0f}"
+        line += f"{result['warm_ms']:>9.1f}" if warm else f"{'–':>9}"
+        totals["cold_ms"] += result["cold_ms"]
+        totals["warm_ms"] += result["warm_ms"] if warm else result["cold_ms"]
+        if BASELINE:
+            path = os.path.join(baseline_root, cwd, script)
+            try:
+                base = statistics.median(run_probe(baseline_root, cwd, PROBE.format(warm="", imports=top_level_imports(path)))[0]
+                                         for _ in range(RUNS)) if os.path.exists(path) else None
+            except RuntimeError:
+                base = None
+            line += f"{base:>9.0f}" if base is not None else f"{'n/a':>9}"
+            totals["base_ms"] += base or 0.0
+        print(f"{line}   {result['heaviest']}")
+
+    print(f"\n⏱️ Sum over stages: cold {totals['cold_ms']:.0f} ms, warm {totals['warm_ms']:.0f} ms"
+          + (f", baseline {totals['base_ms']:.0f} ms" if BASELINE else "")
+          + " (imports only, interpreter start excluded)")
+    if baseline_root:
+        shutil.rmtree(os.path.dirname(baseline_root))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+## derivation_store.py
+
+import os
+import sys
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # non-POSIX: no inter-process locking
+    fcntl = None
+
+"""
+Derivation store
+----------------
+The symbolic form of a KPM and its reformulated measurable-parameter equation
+(_7_past_shap_prompt.py) depend only on the KPM, the model and the prompt
+templates — not on the environment or the reference variant. They are derived
+once and persisted here, so later environments build their prompts without
+any LLM round-trip.
+
+Entries are keyed on (model, KPM) and carry a digest of the prompts they were
+derived from; an entry whose digest no longer matches (edited template, RAG
+sheet, system message) is treated as missing and derived again.
+
+Writers take an exclusive fcntl lock on <store>.lock (`locked()`), so
+orchestrator workers running _7 for several environments at once neither lose
+each other's entries nor derive the same KPM twice: _7 holds the lock from its
+missing-entry check until its derivations are stored.
+
+CLI:
+    python derivation_store.py list [path]
+    python derivation_store.py invalidate [KPM ...]     # no KPM = everything
+        (ORCA_LLM_MODEL=<model> restricts invalidation to that model)
+"""
+
+DEFAULT_PATH = os.environ.get("ORCA_DERIVATION_STORE", os.path.join("interim_results", "derivation_store.json"))
+STORE_VERSION = 1
+
+
+def prompt_digest(*parts):
+    """Digest of everything the derivation prompts are built from."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class DerivationStore:
+    """JSON-backed {(model, kpm): {symbolic_form, math_equation, digest}} map."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.entries = self._read()
+        self._lock_file, self._lock_depth = None, 0
+
+    @staticmethod
+    def _key(model, kpm):
+        return f"{model}|{kpm}"
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        return stored["entries"] if stored.get("version") == STORE_VERSION else {}
+
+    def _write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": STORE_VERSION, "entries": self.entries}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    @contextmanager
+    def locked(self):
+        """Exclusive inter-process lock on the store (re-entrant per instance); entries are re-read inside it."""
+        if self._lock_depth == 0:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._lock_file = open(self.path + ".lock", "a")
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            self.entries = self._read()
+            yield self
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                self._lock_file.close()          # releases the flock
+                self._lock_file = None
+
+    def get(self, model, kpm, digest):
+        """(symbolic_form, math_equation), or None when missing or derived from other prompts."""
+        entry = self.entries.get(self._key(model, kpm))
+        if entry is None or entry["digest"] != digest:
+            return None
+        return entry["symbolic_form"], entry["math_equation"]
+
+    def put_many(self, model, derivations):
+        """Persist {kpm: (symbolic_form, math_equation, digest)}; merges with concurrent writers under the lock."""
+        with self.locked():
+            for kpm, (symbolic_form, math_equation, digest) in derivations.items():
+                self.entries[self._key(model, kpm)] = {
+                    "model": model, "kpm": kpm, "digest": digest, "created_at": time.time(),
+                    "symbolic_form": symbolic_form, "math_equation": math_equation,
+                }
+            self._write()
+
+    def invalidate(self, kpms=None, model=None):
+        """Drop entries matching the given KPMs / model (None matches all); returns the count."""
+        with self.locked():
+            victims = [key for key, entry in self.entries.items()
+                       if (not kpms or entry["kpm"] in kpms) and (model is None or entry["model"] == model)]
+            for key in victims:
+                del self.entries[key]
+            if victims:
+                self._write()
+        return len(victims)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "invalidate"):
+        sys.exit("usage: python derivation_store.py list [store_path] | invalidate [KPM ...]")
+    if sys.argv[1] == "list":
+        store = DerivationStore(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH)
+        if not store.entries:
+            print(f"📭 No derivations in {store.path}")
+        for entry in sorted(store.entries.values(), key=lambda e: (e["model"], e["kpm"])):
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created_at"]))
+            print(f"🧮 {entry['model']} / {entry['kpm']}: digest {entry['digest']}, derived {created}")
+    else:
+        store = DerivationStore()
+        removed = store.invalidate(sys.argv[2:] or None, os.environ.get("ORCA_LLM_MODEL"))
+        print(f"🧹 Invalidated {removed} derivation(s) in {store.path}")
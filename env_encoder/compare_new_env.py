@@ -1,60 +1,41 @@
 import os
-import glob
 import numpy as np
 import json
+from env_index import EnvIndex, embed, DISTANCE_METRIC
 
 """
 compare_all_new_envs_v2.py
 ---------------------------
-* For each encoded ORAN_log_new*.npy vector:
-  - Compare it against all other environment vectors (excluding other new logs).
-  - Compute numeric + soft slice distance.
+* For every encoded ORAN_log_new* environment (all in one batch):
+  - Compare it against all other environment vectors (excluding other new logs)
+    through the persistent nearest-neighbour index (env_index.py).
+  - Compute numeric (ENV_DISTANCE: l2 / wasserstein / mahalanobis) + soft slice distance.
   - Save top-3 closest environments (excluding new ones) into a JSON file.
 """
 
 ENCODED_DIR = "encoded_env"
 NEW_PREFIX = "ORAN_log_new"
+TOP_K = 3
 output_folder = "compare_env"
 os.makedirs(output_folder, exist_ok=True)
 
-NUM_DIMS = 3  # Users_z, DL_Buffer_z, Avg_SNR_z
+# --- Load new environment vectors and the reference index ----------
+names, vectors, _ = embed(ENCODED_DIR, DISTANCE_METRIC)
+new_rows = [i for i, n in enumerate(names) if n.startswith(NEW_PREFIX)]
 
-# --- Load all new environment vectors -----------------------------
-new_files = sorted(glob.glob(os.path.join(ENCODED_DIR, f"{NEW_PREFIX}*_env_vector.npy")))
+if not new_rows:
+    raise FileNotFoundError(f"No environments with prefix '{NEW_PREFIX}' in {ENCODED_DIR}")
 
-if not new_files:
-    raise FileNotFoundError(f"No files found with prefix '{NEW_PREFIX}' in {ENCODED_DIR}")
+env_index = EnvIndex.load_or_build(ENCODED_DIR, exclude_prefix=NEW_PREFIX, metric=DISTANCE_METRIC)
+print(f"📐 Distance metric: {DISTANCE_METRIC} ({len(env_index)} reference environments)")
+new_vectors = vectors[new_rows]
+all_topk = env_index.topk(new_vectors, k=TOP_K)
 
-for new_path in new_files:
-    NEW_NAME = os.path.basename(new_path).replace("_env_vector.npy", "")
-    vec_new = np.load(new_path)
+for row, vec_new, topk in zip(new_rows, new_vectors, all_topk):
+    NEW_NAME = names[row]
     print(f"\n📄 Loaded {NEW_NAME}: shape={vec_new.shape}, values={np.round(vec_new, 4)}")
 
-    results = []
-    for other_path in glob.glob(os.path.join(ENCODED_DIR, "*_env_vector.npy")):
-        other_name = os.path.basename(other_path).replace("_env_vector.npy", "")
-
-        # Skip self and other new logs
-        if other_name.startswith(NEW_PREFIX):
-            continue
-
-        vec_other = np.load(other_path)
-        if vec_other.shape != vec_new.shape:
-            print(f"⚠️  Skipping {other_name}: shape mismatch {vec_other.shape}")
-            continue
-
-        # --- numeric distance ---------------------------------------
-        dist_num = np.linalg.norm(vec_new[:NUM_DIMS] - vec_other[:NUM_DIMS])
-
-        # --- soft slice penalty -------------------------------------
-        same_slice = np.allclose(vec_new[NUM_DIMS:], vec_other[NUM_DIMS:])
-        dist = dist_num if same_slice else dist_num * 2.0
-
-        results.append((other_name, dist))
-
     # --- Report top 3 ----------------------------------------------
-    topk = sorted(results, key=lambda x: x[1])[:3]
-
     print(f"\n🔍 Top 3 closest to {NEW_NAME}:")
     for name, dist in topk:
         print(f"   • {name:25s} → Distance: {dist:.4f}")
@@ -1,47 +1,264 @@
 # compute_env_stats.py
 
 import os
+import sys
 import json
 import glob
-import pandas as pd
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oran_loader import iter_log_chunks
+
+"""
+Global environment statistics (streaming)
+-----------------------------------------
+* Every log is streamed in chunks into mergeable per-file partials:
+  exact moments (Welford / Chan parallel merge) plus a t-digest style
+  quantile sketch. Memory is O(sketch size), not O(total rows).
+* Per-file partials are computed in parallel (ENV_STATS_WORKERS, default:
+  one per core) and cached in env_stats_cache.json keyed on size + mtime,
+  so adding a log only processes that log and merges it into the stored
+  aggregate.
+* global_env_stats.json keeps the mean / std layout the encoder reads and
+  adds count, min, max and sketch quantiles per feature.
+"""
 
 INPUT_FOLDER = "../dataset"
 OUTPUT_JSON  = "global_env_stats.json"
+CACHE_JSON   = "env_stats_cache.json"
 
-NUM_FEATURES = ["Users", "DL_Buffer", "Avg_SNR_dB"]
+NUM_FEATURES = ["Users", "DL_Buffer", "Avg_SNR_dB", "PRB_num", "TxPower"]
 CAT_FEATURE  = "Slice"
 
-# --- Accumulate raw values ---------------------------------------------
-values_num = {c: [] for c in NUM_FEATURES}
-categories = set()
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+SKETCH_COMPRESSION = 200
+STATS_VERSION = 2
+ENV_STATS_WORKERS = int(os.environ.get("ENV_STATS_WORKERS", "0"))
+
+
+class RunningMoments:
+    """Count / mean / M2 accumulator, mergeable with Chan et al.'s parallel update."""
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n, self.mean, self.m2 = n, mean, m2
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size:
+            batch_mean = float(values.mean())
+            self.merge(RunningMoments(int(values.size), batch_mean, float(((values - batch_mean) ** 2).sum())))
+        return self
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        return self
+
+    @property
+    def std(self):
+        # sample std (ddof=1), same as pandas Series.std()
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def to_dict(self):
+        return {"n": self.n, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["n"], d["mean"], d["m2"])
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (merging t-digest with the k1 arcsine scale).
+    Centroids are re-binned with vectorised numpy ops, so a chunk of any size
+    is folded in without a Python-level loop over its values.
+    """
+
+    def __init__(self, compression=SKETCH_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min, self.max = math.inf, -math.inf
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * np.arcsin(2 * np.clip(q, 0.0, 1.0) - 1)
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        cum = np.cumsum(weights)
+        # bin every centroid by the k-scale value of its mid-point quantile
+        bins = np.floor(self._k((cum - weights / 2) / total)).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        w = np.add.reduceat(weights, starts)
+        m = np.add.reduceat(means * weights, starts) / w
+        self.means, self.weights = m, w
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size:
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self._compress(np.r_[self.means, values], np.r_[self.weights, np.ones(values.size)])
+        return self
+
+    def merge(self, other):
+        if other.weights.size:
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+            self._compress(np.r_[self.means, other.means], np.r_[self.weights, other.weights])
+        return self
+
+    def quantile(self, q):
+        if not self.weights.size:
+            return float("nan")
+        cum = np.cumsum(self.weights)
+        pos = (cum - self.weights / 2) / cum[-1]
+        return float(np.interp(q, np.r_[0.0, pos, 1.0], np.r_[self.min, self.means, self.max]))
+
+    def to_dict(self):
+        return {"compression": self.compression, "min": self.min, "max": self.max,
+                "means": self.means.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d["compression"])
+        sketch.min, sketch.max = d["min"], d["max"]
+        sketch.means = np.asarray(d["means"], dtype=np.float64)
+        sketch.weights = np.asarray(d["weights"], dtype=np.float64)
+        return sketch
 
-for csv_path in glob.glob(os.path.join(INPUT_FOLDER, "ORAN_log_*.csv")):
-    df = pd.read_csv(csv_path)
 
+# === Per-file partials ===
+def file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def compute_partial(csv_path):
+    """Stream one log into {feature: moments + sketch} and its Slice values."""
+    moments = {c: RunningMoments() for c in NUM_FEATURES}
+    sketches = {c: QuantileSketch() for c in NUM_FEATURES}
+    categories = set()
+
+    for df in iter_log_chunks(csv_path, NUM_FEATURES + [CAT_FEATURE]):
+        for col in NUM_FEATURES:
+            if col in df.columns:
+                values = df[col].dropna().to_numpy(dtype=np.float64)
+                moments[col].update(values)
+                sketches[col].update(values)
+
+        if CAT_FEATURE in df.columns:
+            categories.update(map(str, df[CAT_FEATURE].dropna().unique()))
+
+    return {
+        "stamp": file_stamp(csv_path),
+        "numeric": {c: {"moments": moments[c].to_dict(), "sketch": sketches[c].to_dict()} for c in NUM_FEATURES},
+        "categories": sorted(categories),
+    }
+
+
+def empty_aggregate():
+    return {"files": [], "numeric": {c: {"moments": RunningMoments().to_dict(),
+                                         "sketch": QuantileSketch().to_dict()} for c in NUM_FEATURES},
+            "categories": []}
+
+
+def merge_into(aggregate, name, partial):
     for col in NUM_FEATURES:
-        if col in df.columns:
-            values_num[col].extend(df[col].dropna().tolist())
+        agg, part = aggregate["numeric"][col], partial["numeric"][col]
+        agg["moments"] = RunningMoments.from_dict(agg["moments"]).merge(
+            RunningMoments.from_dict(part["moments"])).to_dict()
+        agg["sketch"] = QuantileSketch.from_dict(agg["sketch"]).merge(
+            QuantileSketch.from_dict(part["sketch"])).to_dict()
+    aggregate["categories"] = sorted(set(aggregate["categories"]) | set(partial["categories"]))
+    aggregate["files"].append(name)
+
 
-    if CAT_FEATURE in df.columns:
-        categories.update(df[CAT_FEATURE].dropna().unique())
+def load_cache():
+    if os.path.exists(CACHE_JSON):
+        with open(CACHE_JSON, "r") as f:
+            cache = json.load(f)
+        if cache.get("version") == STATS_VERSION:
+            return cache
+    return {"version": STATS_VERSION, "partials": {}, "aggregate": empty_aggregate()}
 
-# --- Compute mean / std -------------------------------------------------
-stats = {}
-for col in NUM_FEATURES:
-    if values_num[col]:
-        series = pd.Series(values_num[col])
+
+def save_json(path, obj, indent=None):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=indent)
+    os.replace(tmp, path)
+
+
+def main():
+    csv_paths = {os.path.basename(p): p for p in sorted(glob.glob(os.path.join(INPUT_FOLDER, "ORAN_log_*.csv")))}
+    cache = load_cache()
+    partials = cache["partials"]
+
+    # --- Per-file partials: only new or modified logs are streamed -----------
+    stale = [name for name, p in csv_paths.items()
+             if partials.get(name, {}).get("stamp") != file_stamp(p)]
+    if stale:
+        workers = ENV_STATS_WORKERS if ENV_STATS_WORKERS > 0 else (os.cpu_count() or 1)
+        workers = max(1, min(workers, len(stale)))
+        print(f"📊 Streaming {len(stale)} log(s) with {workers} worker(s)...")
+        paths = [csv_paths[n] for n in stale]
+        if workers == 1:
+            results = [compute_partial(p) for p in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(compute_partial, paths))
+        partials.update(zip(stale, results))
+
+    # --- Aggregate: fold new logs into the stored one unless something changed
+    aggregate = cache["aggregate"]
+    previous = set(aggregate["files"])
+    if previous <= set(csv_paths) and not previous & set(stale):
+        added = [n for n in csv_paths if n not in previous]
+    else:
+        print("♻️ Logs were modified or removed — re-merging all partials")
+        aggregate, added = empty_aggregate(), list(csv_paths)
+    for name in added:
+        merge_into(aggregate, name, partials[name])
+
+    cache["partials"] = {n: partials[n] for n in csv_paths}
+    cache["aggregate"] = aggregate
+    save_json(CACHE_JSON, cache)
+
+    # --- Global stats -----------------------------------------------------------
+    stats = {}
+    for col in NUM_FEATURES:
+        moments = RunningMoments.from_dict(aggregate["numeric"][col]["moments"])
+        if moments.n == 0:
+            continue
+        sketch = QuantileSketch.from_dict(aggregate["numeric"][col]["sketch"])
         stats[col] = {
-            "mean": float(series.mean()),
-            "std":  float(series.std())
+            "mean": moments.mean,
+            "std":  moments.std,
+            "count": moments.n,
+            "min": sketch.min,
+            "max": sketch.max,
+            "quantiles": {f"p{round(q * 100):02d}": sketch.quantile(q) for q in QUANTILES},
         }
 
-# --- Add categorical list ----------------------------------------------
-stats[CAT_FEATURE] = {
-    "values": sorted(categories)
-}
+    # --- Add categorical list ----------------------------------------------
+    stats[CAT_FEATURE] = {
+        "values": sorted(aggregate["categories"])
+    }
+
+    # --- Save JSON ----------------------------------------------------------
+    save_json(OUTPUT_JSON, stats, indent=2)
+
+    print(f"✅ Global stats (pruned) saved to {OUTPUT_JSON} ({len(added)} log(s) merged, {len(csv_paths)} total)")
 
-# --- Save JSON ----------------------------------------------------------
-with open(OUTPUT_JSON, "w") as f:
-    json.dump(stats, f, indent=2)
 
-print(f"✅ Global stats (pruned) saved to {OUTPUT_JSON}")
+if __name__ == "__main__":
+    main()
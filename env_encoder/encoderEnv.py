@@ -1,70 +1,231 @@
 import os
+import sys
 import glob
 import json
+import hashlib
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import OneHotEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oran_loader import read_log
 
 """
-Environment‑vector encoder (pruned version)
--------------------------------------------
+Environment‑vector encoder (pruned version, batch)
+--------------------------------------------------
 * **Keeps only**: Users, DL_Buffer, Avg_SNR_dB (numeric) and Slice (categorical).
 * **No stability test** – every selected feature is always encoded.
 * Uses the same global stats JSON for z‑score normalisation of numeric features.
+* All environments are encoded in one vectorised pass into
+  `encoded_env/env_matrix.npy` (n_envs × d, float64) plus `env_index.json`
+  (row names, feature layout, raw per-log means and the stats hash).
+* ENCODER_APPEND=1 only reads logs that are new or modified since the last run;
+  if global_env_stats.json changed, every row is re-normalised from the stored
+  raw means (no log is re-read for that).
+* ENCODER_PER_ENV_FILES=1 additionally writes the old per-env
+  `<env>_env_vector.npy` / `.txt` files.
+* Distribution sketch: `env_sketch.npy` holds, per environment and per
+  SKETCH_FEATURES column (KPMs plus PRB_num / TxPower), the z-scored mean
+  followed by z-scored quantiles at SKETCH_QUANTILES. env_index.py builds the
+  Wasserstein and Mahalanobis embeddings from it.
 """
 
 # === Paths ===
 input_folder  = "../dataset"
 output_folder = "encoded_env"
-os.makedirs(output_folder, exist_ok=True)
+stats_path    = "./global_env_stats.json"
+
+MATRIX_NAME = "env_matrix.npy"
+SKETCH_NAME = "env_sketch.npy"
+INDEX_NAME  = "env_index.json"
+INDEX_VERSION = 2
 
-stats_path = "./global_env_stats.json"
-with open(stats_path, "r") as f:
-    global_stats = json.load(f)
+APPEND_MODE    = os.environ.get("ENCODER_APPEND", "0") == "1"
+PER_ENV_FILES  = os.environ.get("ENCODER_PER_ENV_FILES", "0") == "1"
 
 # === Feature definitions (pruned) ===
 NUM_FEATURES = ["Users", "DL_Buffer", "Avg_SNR_dB"]
 CAT_FEATURES = ["Slice"]
 ALL_FEATURES = NUM_FEATURES + CAT_FEATURES
 
-for path in sorted(glob.glob(f"{input_folder}/ORAN_log_*.csv")):
-    df = pd.read_csv(path)
-    fname = os.path.splitext(os.path.basename(path))[0]
+# === Distribution sketch ===
+SKETCH_FEATURES = NUM_FEATURES + ["PRB_num", "TxPower"]
+# mid-points of 10 equal-mass bins, so mean |Δquantile| approximates W1
+SKETCH_QUANTILES = [0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.85, 0.95]
+
+
+def stats_digest(global_stats):
+    """Hash of exactly the stats the encoding depends on."""
+    used = {col: [global_stats[col]["mean"], global_stats[col]["std"]] for col in SKETCH_FEATURES}
+    used["Slice"] = sorted(global_stats["Slice"]["values"])
+    return hashlib.sha256(json.dumps(used, sort_keys=True).encode()).hexdigest()
 
-    print(f"\n📂 Encoding {fname} ...")
 
-    encoded_vec   = []
-    feature_dims  = {}
+def file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
 
-    # --- numeric features ------------------------------------------------
-    for col in NUM_FEATURES:
+
+def summarize_log(path):
+    """Raw means, quantiles and first Slice value of one log."""
+    df = read_log(path, ALL_FEATURES + SKETCH_FEATURES)
+    for col in ALL_FEATURES + SKETCH_FEATURES:
         if col not in df.columns:
-            raise ValueError(f"Missing expected numeric column: {col}")
-        mean, std = global_stats[col]["mean"], global_stats[col]["std"]
-        col_mean  = df[col].mean()
-        norm_val  = (col_mean - mean) / std if std > 0 else 0.0
-        print(f"  🔢 {col}: raw={col_mean:.4f}, norm={norm_val:.4f}")
-        encoded_vec.append(norm_val)
-        feature_dims[col] = 1
-
-    # --- categorical: Slice ---------------------------------------------
-    if "Slice" not in df.columns:
-        raise ValueError("Missing expected categorical column: Slice")
+            kind = "categorical" if col in CAT_FEATURES else "numeric"
+            raise ValueError(f"Missing expected {kind} column: {col}")
+    values = {col: df[col].dropna().to_numpy(dtype=np.float64) for col in SKETCH_FEATURES}
+    return {
+        "stamp": file_stamp(path),
+        "raw": {col: float(v.mean()) for col, v in values.items()},
+        "quantiles": {col: np.quantile(v, SKETCH_QUANTILES).tolist() for col, v in values.items()},
+        "slice": str(df["Slice"].iloc[0]),
+    }
+
+
+def _zscore(values, col, global_stats):
+    mean, std = global_stats[col]["mean"], global_stats[col]["std"]
+    return (np.asarray(values, dtype=np.float64) - mean) / std if std > 0 else np.zeros(np.shape(values))
+
+
+def encode_matrix(summaries, global_stats):
+    """Vectorised z-score + one-hot for every summary at once → (n_envs, d) matrix."""
     cats = sorted(global_stats["Slice"]["values"])
-    val  = df["Slice"].iloc[0]
-    encoder = OneHotEncoder(categories=[[c for c in cats]], sparse_output=False, handle_unknown="ignore")
-    onehot  = encoder.fit_transform(df[["Slice"]].head(1))[0]
-    print(f"  🏷️  Slice: value={val}, one‑hot={onehot.tolist()}")
-    encoded_vec.extend(onehot)
-    feature_dims["Slice"] = len(cats)
+    raw = np.array([[s["raw"][col] for col in NUM_FEATURES] for s in summaries], dtype=np.float64).reshape(-1, len(NUM_FEATURES))
+    mean = np.array([global_stats[col]["mean"] for col in NUM_FEATURES], dtype=np.float64)
+    std = np.array([global_stats[col]["std"] for col in NUM_FEATURES], dtype=np.float64)
+    safe_std = np.where(std > 0, std, 1.0)
+    z = np.where(std > 0, (raw - mean) / safe_std, 0.0)
+
+    # unknown slice values encode as all-zeros, like handle_unknown="ignore"
+    cat_pos = {c: i for i, c in enumerate(cats)}
+    onehot = np.zeros((len(summaries), len(cats)), dtype=np.float64)
+    rows = [(i, cat_pos[s["slice"]]) for i, s in enumerate(summaries) if s["slice"] in cat_pos]
+    if rows:
+        r, c = zip(*rows)
+        onehot[list(r), list(c)] = 1.0
+    return np.hstack([z, onehot])
+
+
+def encode_sketch(summaries, global_stats):
+    """(n_envs, F·(1+Q)) matrix: per sketch feature the z-scored mean then its z-scored quantiles."""
+    blocks = []
+    for col in SKETCH_FEATURES:
+        means = np.array([[s["raw"][col]] for s in summaries], dtype=np.float64).reshape(-1, 1)
+        quants = np.array([s["quantiles"][col] for s in summaries], dtype=np.float64).reshape(-1, len(SKETCH_QUANTILES))
+        blocks.append(_zscore(np.hstack([means, quants]), col, global_stats))
+    return np.hstack(blocks)
+
+
+def sketch_layout():
+    columns = [f"{col}_{tag}" for col in SKETCH_FEATURES
+               for tag in ["mean"] + [f"q{round(q * 100):02d}" for q in SKETCH_QUANTILES]]
+    return {"features": SKETCH_FEATURES, "quantiles": SKETCH_QUANTILES, "columns": columns}
+
+
+def feature_layout(global_stats):
+    dims = {col: 1 for col in NUM_FEATURES}
+    dims["Slice"] = len(global_stats["Slice"]["values"])
+    columns = NUM_FEATURES + [f"Slice_{c}" for c in sorted(global_stats["Slice"]["values"])]
+    return dims, columns
+
+
+def load_index(folder=output_folder):
+    path = os.path.join(folder, INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        index = json.load(f)
+    return index if index.get("version") == INDEX_VERSION else None
+
+
+def load_env_matrix(folder=output_folder, mmap=True):
+    """(names, matrix, index) of every encoded environment in one read."""
+    index = load_index(folder)
+    if index is None:
+        raise FileNotFoundError(f"No {INDEX_NAME} in {folder} — run encoderEnv.py first")
+    matrix = np.load(os.path.join(folder, MATRIX_NAME), mmap_mode="r" if mmap else None)
+    if matrix.shape[0] != len(index["names"]):
+        raise ValueError(f"{MATRIX_NAME} has {matrix.shape[0]} rows but {INDEX_NAME} lists {len(index['names'])} envs")
+    return list(index["names"]), matrix, index
+
+
+def load_env_sketch(folder=output_folder, mmap=True):
+    """(names, sketch matrix, index) — the distribution embedding, see encode_sketch()."""
+    index = load_index(folder)
+    if index is None:
+        raise FileNotFoundError(f"No {INDEX_NAME} in {folder} — run encoderEnv.py first")
+    sketch = np.load(os.path.join(folder, SKETCH_NAME), mmap_mode="r" if mmap else None)
+    if sketch.shape[0] != len(index["names"]):
+        raise ValueError(f"{SKETCH_NAME} has {sketch.shape[0]} rows but {INDEX_NAME} lists {len(index['names'])} envs")
+    return list(index["names"]), sketch, index
+
+
+def save_outputs(folder, matrix, sketch, index):
+    for name, arr in [(MATRIX_NAME, matrix), (SKETCH_NAME, sketch)]:
+        tmp = os.path.join(folder, name + ".tmp.npy")
+        np.save(tmp, arr)
+        os.replace(tmp, os.path.join(folder, name))
+    tmp_index = os.path.join(folder, INDEX_NAME + ".tmp")
+    with open(tmp_index, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_index, os.path.join(folder, INDEX_NAME))
+
+
+def write_per_env_files(folder, names, matrix, feature_dims):
+    for fname, vec_np in zip(names, matrix):
+        np.save(os.path.join(folder, f"{fname}_env_vector.npy"), vec_np)
+        with open(os.path.join(folder, f"{fname}_env_vector.txt"), "w") as f:
+            f.write(f"Feature dims: {feature_dims}\n")
+            f.write("Encoded vector:\n" + np.array2string(vec_np, precision=4))
+
+
+def main():
+    os.makedirs(output_folder, exist_ok=True)
+    with open(stats_path, "r") as f:
+        global_stats = json.load(f)
+    digest = stats_digest(global_stats)
+
+    paths = {os.path.splitext(os.path.basename(p))[0]: p
+             for p in sorted(glob.glob(f"{input_folder}/ORAN_log_*.csv"))}
+
+    # --- Reuse summaries of unchanged logs in append mode ------------------
+    previous = load_index() if APPEND_MODE else None
+    known = {}
+    if previous is not None:
+        known = {name: s for name, s in zip(previous["names"], previous["summaries"])}
+        if previous["stats_hash"] != digest:
+            print("♻️ Global stats changed — re-normalising every environment")
+
+    summaries, read = [], 0
+    for fname, path in paths.items():
+        summary = known.get(fname)
+        if summary is None or summary["stamp"] != file_stamp(path):
+            print(f"📂 Encoding {fname} ...")
+            summary = summarize_log(path)
+            read += 1
+        summaries.append(summary)
 
-    vec_np = np.array(encoded_vec, dtype=float)
-    print(f"  ✅ Encoded vector shape: {vec_np.shape}, values: {vec_np}")
+    # --- One vectorised pass over all environments -------------------------
+    names = list(paths)
+    matrix = encode_matrix(summaries, global_stats)
+    sketch = encode_sketch(summaries, global_stats)
+    feature_dims, columns = feature_layout(global_stats)
+    index = {
+        "version": INDEX_VERSION,
+        "stats_hash": digest,
+        "feature_dims": feature_dims,
+        "columns": columns,
+        "num_dims": len(NUM_FEATURES),
+        "sketch": sketch_layout(),
+        "names": names,
+        "summaries": summaries,
+    }
+    save_outputs(output_folder, matrix, sketch, index)
+    if PER_ENV_FILES:
+        write_per_env_files(output_folder, names, matrix, feature_dims)
 
-    np.save(os.path.join(output_folder, f"{fname}_env_vector.npy"), vec_np)
+    print(f"  ✅ Encoded matrix shape: {matrix.shape}, sketch shape: {sketch.shape} "
+          f"({read} log(s) read, {len(names) - read} reused)")
+    print(f"\n✅ Environment encoding (pruned) completed → {os.path.join(output_folder, MATRIX_NAME)}")
 
-    with open(os.path.join(output_folder, f"{fname}_env_vector.txt"), "w") as f:
-        f.write(f"Feature dims: {feature_dims}\n")
-        f.write("Encoded vector:\n" + np.array2string(vec_np, precision=4))
 
-print("\n✅ Environment encoding (pruned) completed.")
+if __name__ == "__main__":
+    main()
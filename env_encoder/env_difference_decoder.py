@@ -1,9 +1,22 @@
 import os
+import sys
 import json
 import numpy as np
-import pandas as pd
 import glob
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oran_loader import read_log
+
+"""
+Environment difference decoder
+------------------------------
+* Every log is summarised once (per-column means + first categorical values)
+  into encoded_env/env_summaries.json, keyed on file size + mtime; reference
+  logs shared by many new environments are never re-parsed.
+* All (new env, top-k reference) pairs are decoded in one array operation over
+  the summary matrix; JSON / TXT outputs are written at the end.
+"""
+
 # === Configurations ===
 encoded_dir = "encoded_env"
 dataset_dir = "../dataset"
@@ -11,70 +24,125 @@ new_env_csvs = sorted(glob.glob("../dataset/ORAN_log_new*.csv"))
 top_k = 3
 compare_results_dir = "./compare_env"
 output_folder = "./decoded_differences"
-os.makedirs(output_folder, exist_ok=True)
+SUMMARY_CACHE = os.path.join(encoded_dir, "env_summaries.json")
+SUMMARY_VERSION = 1
 
 numerical_features = [
     "Users", "PRB_num", "DL_Buffer",
     "TxPower", "Avg_SNR_dB", "ant_tilt_deg", "CIO"
 ]
 categorical_features = ["Slice", "Scheduling"]
-
-if not new_env_csvs:
-    raise FileNotFoundError("❌ No new environment CSVs found with pattern: ../dataset/ORAN_log_new*.csv")
-
-# === Process each new environment file
-for new_env_csv in new_env_csvs:
-    new_env_name = os.path.splitext(os.path.basename(new_env_csv))[0]
-
-    results_from_compare_script = os.path.join(compare_results_dir, f"topk_similar_envs_{new_env_name}.json")
-    output_path = os.path.join(output_folder, f"decoded_differences_{new_env_name}.json")
-    output_txt_path = os.path.join(output_folder, f"decoded_differences_{new_env_name}.txt")
-
-    if not os.path.exists(results_from_compare_script):
-        print(f"⚠️ Skipping {new_env_name}: Missing compare results file {results_from_compare_script}")
-        continue
-
-    new_df = pd.read_csv(new_env_csv)
-
-    with open(results_from_compare_script, "r") as f:
-        topk_envs = json.load(f)
-
-    all_differences = []
-    print_lines = []
-
-    for entry in topk_envs[:top_k]:
-        name = entry["name"]
-        dist = entry["distance"]
-        compare_csv = os.path.join(dataset_dir, name + ".csv")
-        if not os.path.exists(compare_csv):
-            print(f"⚠️ Missing file: {compare_csv}")
+used_columns = numerical_features + categorical_features
+
+
+# === Per-environment summaries (cached) ===
+def file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def summarize_log(path):
+    """Column means (None if absent) and first categorical values of one log."""
+    df = read_log(path, used_columns)
+    return {
+        "stamp": file_stamp(path),
+        "means": {col: float(df[col].astype("float64").mean()) if col in df.columns else None
+                  for col in numerical_features},
+        "first": {col: str(df[col].iloc[0]) if col in df.columns else None
+                  for col in categorical_features},
+    }
+
+
+def load_summaries(names):
+    """{env: summary} for every env in `names`, reading only new or modified logs."""
+    cache = {}
+    if os.path.exists(SUMMARY_CACHE):
+        with open(SUMMARY_CACHE, "r") as f:
+            stored = json.load(f)
+        if stored.get("version") == SUMMARY_VERSION and stored.get("columns") == used_columns:
+            cache = stored["envs"]
+
+    changed = False
+    for name in names:
+        path = os.path.join(dataset_dir, name + ".csv")
+        if name not in cache or cache[name]["stamp"] != file_stamp(path):
+            print(f"📂 Summarising {name} ...")
+            cache[name] = summarize_log(path)
+            changed = True
+
+    if changed:
+        os.makedirs(encoded_dir, exist_ok=True)
+        tmp = SUMMARY_CACHE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": SUMMARY_VERSION, "columns": used_columns, "envs": cache}, f)
+        os.replace(tmp, SUMMARY_CACHE)
+    return {name: cache[name] for name in names}
+
+
+def main():
+    if not new_env_csvs:
+        raise FileNotFoundError("❌ No new environment CSVs found with pattern: ../dataset/ORAN_log_new*.csv")
+    os.makedirs(output_folder, exist_ok=True)
+
+    # --- Collect every (new env, reference) pair --------------------------
+    jobs, pairs = [], []          # pairs: (job index, reference name, distance)
+    for new_env_csv in new_env_csvs:
+        new_env_name = os.path.splitext(os.path.basename(new_env_csv))[0]
+        results_from_compare_script = os.path.join(compare_results_dir, f"topk_similar_envs_{new_env_name}.json")
+        if not os.path.exists(results_from_compare_script):
+            print(f"⚠️ Skipping {new_env_name}: Missing compare results file {results_from_compare_script}")
             continue
-
-        old_df = pd.read_csv(compare_csv)
-
-        print(f"\n🔍 Comparing {new_env_name} with: {name} (Distance = {dist:.4f})")
-        print_lines.append(f"🔍 Comparing with: {name} (Distance = {dist:.4f})\n")
+        with open(results_from_compare_script, "r") as f:
+            topk_envs = json.load(f)
+
+        jobs.append(new_env_name)
+        for entry in topk_envs[:top_k]:
+            compare_csv = os.path.join(dataset_dir, entry["name"] + ".csv")
+            if not os.path.exists(compare_csv):
+                print(f"⚠️ Missing file: {compare_csv}")
+                continue
+            pairs.append((len(jobs) - 1, entry["name"], entry["distance"]))
+
+    if not jobs:
+        return
+
+    # --- One summary per distinct log, then one vectorised diff ------------
+    env_names = list(dict.fromkeys(jobs + [name for _, name, _ in pairs]))
+    summaries = load_summaries(env_names)
+    row = {name: i for i, name in enumerate(env_names)}
+    means = np.array([[np.nan if summaries[n]["means"][c] is None else summaries[n]["means"][c]
+                       for c in numerical_features] for n in env_names], dtype=np.float64)
+    firsts = np.array([[summaries[n]["first"][c] for c in categorical_features] for n in env_names], dtype=object)
+
+    new_idx = np.array([row[jobs[j]] for j, _, _ in pairs], dtype=np.int64)
+    old_idx = np.array([row[name] for _, name, _ in pairs], dtype=np.int64)
+    new_vals, old_vals = means[new_idx], means[old_idx]
+    deltas = new_vals - old_vals
+    present = ~(np.isnan(new_vals) | np.isnan(old_vals))
+    new_cats, old_cats = firsts[new_idx], firsts[old_idx]
+
+    # --- Assemble outputs ----------------------------------------------------
+    all_differences = {j: [] for j in range(len(jobs))}
+    print_lines = {j: [] for j in range(len(jobs))}
+    for p, (j, name, dist) in enumerate(pairs):
+        print(f"\n🔍 Comparing {jobs[j]} with: {name} (Distance = {dist:.4f})")
+        print_lines[j].append(f"🔍 Comparing with: {name} (Distance = {dist:.4f})\n")
         differences = {}
 
-        for col in numerical_features:
-            if col in new_df.columns and col in old_df.columns:
-                new_val = new_df[col].mean()
-                old_val = old_df[col].mean()
-                delta = new_val - old_val
+        for c, col in enumerate(numerical_features):
+            if present[p, c]:
                 differences[col] = {
-                    "new": round(new_val, 4),
-                    "old": round(old_val, 4),
-                    "delta": round(delta, 4)
+                    "new": round(float(new_vals[p, c]), 4),
+                    "old": round(float(old_vals[p, c]), 4),
+                    "delta": round(float(deltas[p, c]), 4)
                 }
 
-        for col in categorical_features:
-            if col in new_df.columns and col in old_df.columns:
-                new_val = str(new_df[col].iloc[0])
-                old_val = str(old_df[col].iloc[0])
+        for c, col in enumerate(categorical_features):
+            if new_cats[p, c] is not None and old_cats[p, c] is not None:
                 differences[col] = {
-                    "new": new_val,
-                    "old": old_val,
-                    "changed": new_val != old_val
+                    "new": new_cats[p, c],
+                    "old": old_cats[p, c],
+                    "changed": new_cats[p, c] != old_cats[p, c]
                 }
 
         result = {
@@ -85,14 +153,21 @@ for new_env_csv in new_env_csvs:
 
         result_str = json.dumps(result, indent=2)
         print(result_str)
-        print_lines.append(result_str + "\n")
-        all_differences.append(result)
+        print_lines[j].append(result_str + "\n")
+        all_differences[j].append(result)
 
     # === Save results
-    with open(output_txt_path, "w") as f:
-        f.writelines(print_lines)
+    for j, new_env_name in enumerate(jobs):
+        output_path = os.path.join(output_folder, f"decoded_differences_{new_env_name}.json")
+        output_txt_path = os.path.join(output_folder, f"decoded_differences_{new_env_name}.txt")
+        with open(output_txt_path, "w") as f:
+            f.writelines(print_lines[j])
+
+        with open(output_path, "w") as f:
+            json.dump(all_differences[j], f, indent=2)
+
+        print(f"\n✅ Saved decoded differences for {new_env_name} to:\n  {output_path}\n  {output_txt_path}")
 
-    with open(output_path, "w") as f:
-        json.dump(all_differences, f, indent=2)
 
-    print(f"\n✅ Saved decoded differences for {new_env_name} to:\n  {output_path}\n  {output_txt_path}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+## env_index.py
+
+import os
+import numpy as np
+from encoderEnv import load_env_matrix, load_env_sketch, MATRIX_NAME
+
+"""
+Nearest-neighbour index over encoded reference environments
+-----------------------------------------------------------
+Distance metrics (ENV_DISTANCE, default "l2"), all doubled when the Slice
+one-hot differs:
+* l2          — ‖num_new − num_ref‖₂ over the z-scored means of env_matrix.npy
+                (the original compare_new_env.py distance).
+* wasserstein — W1 between the z-scored per-feature distributions, averaged
+                over the sketch features; estimated from the quantile sketch
+                as mean |Δquantile|.
+* mahalanobis — √(Δμᵀ Σ⁻¹ Δμ) over the z-scored sketch-feature means, with Σ
+                the reference-set covariance shrunk towards I.
+
+Every metric is an Lp norm after a linear map of the numeric part (identity,
+I/(F·Q) with p=1, or the Cholesky factor of Σ⁻¹), so one search path serves all.
+
+* References are grouped by their Slice one-hot. A query's own slice group
+  is searched with plain distances, every other group with doubled ones, and
+  the per-group top-k lists are merged — exact, not approximate.
+* Small indexes (≤ ENV_INDEX_BRUTE_MAX references) use one vectorised
+  distance matrix per query batch; larger ones use a scipy cKDTree per slice
+  group (brute force is used if scipy is unavailable).
+* The index persists to encoded_env/env_nn_index_<metric>.npz (no pickles)
+  and is rebuilt automatically when env_matrix.npy changes.
+"""
+
+NEW_PREFIX = "ORAN_log_new"
+SLICE_PENALTY = 2.0
+DISTANCE_METRICS = ("l2", "wasserstein", "mahalanobis")
+DISTANCE_METRIC = os.environ.get("ENV_DISTANCE", "l2")
+MAHALANOBIS_SHRINKAGE = 0.1
+BRUTE_FORCE_MAX = int(os.environ.get("ENV_INDEX_BRUTE_MAX", "20000"))
+QUERY_BATCH = 1024
+
+
+def index_file(metric):
+    return f"env_nn_index_{metric}.npz"
+
+
+def _check_metric(metric):
+    if metric not in DISTANCE_METRICS:
+        raise ValueError(f"Unknown ENV_DISTANCE '{metric}' (expected one of {DISTANCE_METRICS})")
+    return metric
+
+
+def embed(encoded_dir="encoded_env", metric=None):
+    """
+    (names, vectors, num_dims) for every encoded environment under `metric`:
+    the first num_dims columns are the metric's numeric part, the rest the Slice one-hot.
+    """
+    metric = _check_metric(metric or DISTANCE_METRIC)
+    names, matrix, meta = load_env_matrix(encoded_dir)
+    matrix = np.asarray(matrix)
+    slices = matrix[:, meta["num_dims"]:]
+    if metric == "l2":
+        return names, matrix, meta["num_dims"]
+
+    _, sketch, _ = load_env_sketch(encoded_dir)
+    n_feat, n_q = len(meta["sketch"]["features"]), len(meta["sketch"]["quantiles"])
+    blocks = np.asarray(sketch).reshape(len(names), n_feat, 1 + n_q)
+    if metric == "wasserstein":
+        numeric = blocks[:, :, 1:].reshape(len(names), n_feat * n_q)
+    else:
+        numeric = blocks[:, :, 0]
+    return names, np.hstack([numeric, slices]), numeric.shape[1]
+
+
+def _metric_map(metric, numeric):
+    """(linear map, p) that turn `metric` into a plain Lp distance on numeric @ map."""
+    dim = numeric.shape[1]
+    if metric == "wasserstein":
+        return np.eye(dim) / dim if dim else np.eye(0), 1
+    if metric == "mahalanobis":
+        cov = np.cov(numeric, rowvar=False).reshape(dim, dim) if len(numeric) > 1 else np.eye(dim)
+        cov = (1 - MAHALANOBIS_SHRINKAGE) * np.nan_to_num(cov) + MAHALANOBIS_SHRINKAGE * np.eye(dim)
+        # Σ⁻¹ = L Lᵀ  →  ΔᵀΣ⁻¹Δ = ‖Δ L‖²
+        return np.linalg.cholesky(np.linalg.inv(cov)), 2
+    return np.eye(dim), 2
+
+
+class EnvIndex:
+    """Exact top-k search with the soft slice penalty, for a batch of query vectors."""
+
+    def __init__(self, names, vectors, num_dims, metric="l2", transform=None, source_stamp=None):
+        self.names = list(names)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float64)
+        self.num_dims = int(num_dims)
+        self.metric = _check_metric(metric)
+        self.source_stamp = source_stamp
+        default_map, self.p = _metric_map(self.metric, self.vectors[:, :self.num_dims])
+        self.transform = default_map if transform is None else np.asarray(transform, dtype=np.float64)
+        self.numeric = self.vectors[:, :self.num_dims] @ self.transform
+        # one group per distinct slice one-hot
+        slices = self.vectors[:, self.num_dims:]
+        if len(self.names):
+            self.group_keys, self.group_of = np.unique(slices, axis=0, return_inverse=True)
+            self.group_of = self.group_of.reshape(-1)
+        else:
+            self.group_keys, self.group_of = np.empty((0, slices.shape[1])), np.empty(0, dtype=np.int64)
+        self.groups = [np.flatnonzero(self.group_of == g) for g in range(len(self.group_keys))]
+        self._trees = None
+
+    def __len__(self):
+        return len(self.names)
+
+    # === Construction / persistence ===
+    @classmethod
+    def from_encoded(cls, encoded_dir="encoded_env", exclude_prefix=NEW_PREFIX, metric=None):
+        metric = metric or DISTANCE_METRIC
+        names, vectors, num_dims = embed(encoded_dir, metric)
+        keep = [i for i, n in enumerate(names) if not (exclude_prefix and n.startswith(exclude_prefix))]
+        return cls([names[i] for i in keep], vectors[keep], num_dims, metric=metric,
+                   source_stamp=_matrix_stamp(encoded_dir))
+
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, names=np.array(self.names, dtype=str), vectors=self.vectors,
+                 num_dims=self.num_dims, metric=np.array(self.metric), transform=self.transform,
+                 source_stamp=np.array(self.source_stamp or "", dtype=str))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["names"].tolist(), data["vectors"], int(data["num_dims"]),
+                       metric=str(data["metric"]), transform=data["transform"],
+                       source_stamp=str(data["source_stamp"]) or None)
+
+    @classmethod
+    def load_or_build(cls, encoded_dir="encoded_env", exclude_prefix=NEW_PREFIX, metric=None):
+        """Persisted index if it matches the current env_matrix.npy, else rebuild and save it."""
+        metric = _check_metric(metric or DISTANCE_METRIC)
+        path = os.path.join(encoded_dir, index_file(metric))
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.source_stamp == _matrix_stamp(encoded_dir):
+                return index
+        index = cls.from_encoded(encoded_dir, exclude_prefix, metric)
+        index.save(path)
+        return index
+
+    # === Search ===
+    def _group_match(self, queries):
+        """(n_queries, n_groups) bool: query slice equals the group slice."""
+        q_slices = queries[:, self.num_dims:]
+        return np.all(np.isclose(q_slices[:, None, :], self.group_keys[None, :, :]), axis=2)
+
+    def _pairwise(self, q_num):
+        if self.p == 2:
+            d2 = (np.sum(q_num ** 2, axis=1)[:, None] + np.sum(self.numeric ** 2, axis=1)[None, :]
+                  - 2.0 * q_num @ self.numeric.T)
+            return np.sqrt(np.maximum(d2, 0.0))
+        # L1: accumulate one dimension at a time to keep memory at n_queries × n_refs
+        dist = np.zeros((len(q_num), len(self.numeric)))
+        for j in range(q_num.shape[1]):
+            dist += np.abs(q_num[:, j:j + 1] - self.numeric[None, :, j])
+        return dist
+
+    def _brute(self, queries, k):
+        q_num = queries[:, :self.num_dims] @ self.transform
+        dist = self._pairwise(q_num)
+        same = self._group_match(queries)[:, self.group_of]
+        dist = np.where(same, dist, dist * SLICE_PENALTY)
+        cand = np.argpartition(dist, k - 1, axis=1)[:, :k] if k < dist.shape[1] else \
+            np.tile(np.arange(dist.shape[1]), (len(queries), 1))
+        # exact distances for the k survivors (the expanded form above loses a few ulps)
+        exact = np.linalg.norm(self.numeric[cand] - q_num[:, None, :], ord=self.p, axis=2)
+        return np.where(np.take_along_axis(same, cand, axis=1), exact, exact * SLICE_PENALTY), cand
+
+    def _tree(self, queries, k):
+        from scipy.spatial import cKDTree
+        if self._trees is None:
+            self._trees = [cKDTree(self.numeric[rows]) for rows in self.groups]
+        q_num = queries[:, :self.num_dims] @ self.transform
+        match = self._group_match(queries)
+        dists, cands = [], []
+        for g, (rows, tree) in enumerate(zip(self.groups, self._trees)):
+            kk = min(k, len(rows))
+            d, i = tree.query(q_num, k=kk, p=self.p)
+            d, i = d.reshape(len(queries), kk), i.reshape(len(queries), kk)
+            dists.append(np.where(match[:, g:g + 1], d, d * SLICE_PENALTY))
+            cands.append(rows[i])
+        return np.hstack(dists), np.hstack(cands)
+
+    def search(self, queries, k=3):
+        """
+        Top-k for every row of `queries` (n_queries × d, same embedding as the index).
+        Returns (distances, indices), both (n_queries, min(k, len(self))), sorted by
+        distance with ties broken by index order.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float64))
+        if queries.shape[1] != self.vectors.shape[1]:
+            raise ValueError(f"Query dimension {queries.shape[1]} != index dimension {self.vectors.shape[1]}")
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty((len(queries), 0)), np.empty((len(queries), 0), dtype=np.int64)
+
+        use_tree = len(self) > BRUTE_FORCE_MAX and _have_scipy()
+        out_d, out_i = [], []
+        for start in range(0, len(queries), QUERY_BATCH):
+            batch = queries[start:start + QUERY_BATCH]
+            dist, cand = self._tree(batch, k) if use_tree else self._brute(batch, k)
+            order = np.lexsort((cand, dist), axis=1)[:, :k]
+            out_d.append(np.take_along_axis(dist, order, axis=1))
+            out_i.append(np.take_along_axis(cand, order, axis=1))
+        return np.vstack(out_d), np.vstack(out_i)
+
+    def topk(self, queries, k=3):
+        """[[(name, distance), ...] per query]"""
+        dists, idx = self.search(queries, k)
+        return [[(self.names[j], float(d)) for d, j in zip(drow, irow)] for drow, irow in zip(dists, idx)]
+
+
+def _matrix_stamp(encoded_dir):
+    st = os.stat(os.path.join(encoded_dir, MATRIX_NAME))
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _have_scipy():
+    try:
+        import scipy.spatial  # noqa: F401
+        return True
+    except ImportError:
+        return False
@@ -0,0 +1,201 @@
+## llm_batch.py
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+"""
+OpenAI Batch API backend (offline pipeline runs)
+------------------------------------------------
+Instead of one chat call per prompt, a stage's pending requests are written as
+JSONL (one JSON object per line, like requests.jsonl), uploaded, submitted as a
+single batch against /v1/chat/completions, polled until the batch ends, and the
+output file is mapped back to request order by `custom_id`. The stages keep
+writing their own output files from the returned list.
+
+Selected with ORCA_LLM_BACKEND=batch (see queryGPT.Query_GPT4_batch); cached
+prompts are answered locally and only cache misses are submitted.
+
+* Each submission lives under ORCA_LLM_BATCH_DIR as <tag>-<digest>.jsonl plus a
+  .state.json with the batch id. The digest covers the request lines, so
+  rerunning an interrupted stage resumes polling the same batch instead of
+  paying for it twice; failed / expired / cancelled batches are resubmitted.
+* Requests that the batch reports as failed come back as BatchRequestError in
+  their slot.
+* Status polls and output downloads are idempotent reads and are retried on
+  transient API errors with the chat calls' policy (queryGPT._should_retry),
+  so a 5xx or connection reset hours into a batch does not abandon it.
+
+Environment:
+    ORCA_LLM_BACKEND          async (default) | batch
+    ORCA_LLM_BATCH_DIR        JSONL / state / output directory (interim_results/_llm_batches)
+    ORCA_LLM_BATCH_POLL       seconds between status polls (30)
+    ORCA_LLM_BATCH_TIMEOUT    give up waiting after this many seconds (86400)
+    ORCA_LLM_BATCH_WINDOW     completion window requested from the API (24h)
+
+CLI:
+    python llm_batch.py status [batch_dir]
+"""
+
+# === Config ===
+BATCH_DIR = os.environ.get("ORCA_LLM_BATCH_DIR", os.path.join("interim_results", "_llm_batches"))
+POLL_INTERVAL = float(os.environ.get("ORCA_LLM_BATCH_POLL", "30"))
+BATCH_TIMEOUT = float(os.environ.get("ORCA_LLM_BATCH_TIMEOUT", "86400"))
+COMPLETION_WINDOW = os.environ.get("ORCA_LLM_BATCH_WINDOW", "24h")
+ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUS = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchRequestError(RuntimeError):
+    """One request of a batch failed (or the batch ended without answering it)."""
+
+
+def custom_id(i):
+    return f"req-{i:06d}"
+
+
+def build_jsonl(kwargs_list):
+    """Batch input file contents: one chat-completions request per line."""
+    lines = [json.dumps({"custom_id": custom_id(i), "method": "POST", "url": ENDPOINT, "body": kwargs},
+                        ensure_ascii=False, sort_keys=True)
+             for i, kwargs in enumerate(kwargs_list)]
+    return "\n".join(lines) + "\n"
+
+
+def _read_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def submit(client, jsonl_path):
+    """Upload the JSONL and create the batch; returns the batch object."""
+    with open(jsonl_path, "rb") as f:
+        uploaded = client.files.create(file=(os.path.basename(jsonl_path), f), purpose="batch")
+    return client.batches.create(input_file_id=uploaded.id, endpoint=ENDPOINT,
+                                 completion_window=COMPLETION_WINDOW)
+
+
+def _retrying(call, *args):
+    """call(*args), retried with queryGPT's backoff on transient API errors."""
+    from queryGPT import load_openai, _should_retry   # queryGPT imports this module
+    openai = load_openai()
+    attempt = 0
+    while True:
+        try:
+            return call(*args)
+        except openai.APIError as err:
+            delay = _should_retry(attempt, err)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+def wait(client, batch_id, poll=None, timeout=None):
+    """Poll until the batch reaches a terminal status; returns the final batch object."""
+    poll = POLL_INTERVAL if poll is None else poll
+    deadline = time.monotonic() + (BATCH_TIMEOUT if timeout is None else timeout)
+    last = None
+    while True:
+        batch = _retrying(client.batches.retrieve, batch_id)
+        counts = batch.request_counts
+        progress = (batch.status, getattr(counts, "completed", 0), getattr(counts, "failed", 0))
+        if progress != last:
+            total = getattr(counts, "total", 0)
+            print(f"⏳ Batch {batch_id}: {batch.status} ({progress[1]}/{total} done, {progress[2]} failed)")
+            last = progress
+        if batch.status in TERMINAL_STATUS:
+            return batch
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"❌ Batch {batch_id} still '{batch.status}' after {timeout or BATCH_TIMEOUT:.0f}s")
+        time.sleep(poll)
+
+
+def _file_lines(client, file_id):
+    if not file_id:
+        return []
+    text = _retrying(client.files.content, file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def collect(client, batch, n):
+    """Map output / error file lines back to request order (content or BatchRequestError)."""
+    results = [BatchRequestError(f"Batch {batch.id} ended '{batch.status}' without a response")
+               for _ in range(n)]
+    index = {custom_id(i): i for i in range(n)}
+    for line in _file_lines(client, batch.output_file_id) + _file_lines(client, batch.error_file_id):
+        i = index.get(line.get("custom_id"))
+        if i is None:
+            continue
+        response, error = line.get("response") or {}, line.get("error")
+        body = response.get("body") or {}
+        if error or response.get("status_code") != 200:
+            detail = error or body.get("error") or {}
+            results[i] = BatchRequestError(
+                f"Batch request {line['custom_id']} failed: {detail.get('message', 'status ' + str(response.get('status_code')))}")
+        else:
+            results[i] = body["choices"][0]["message"]["content"]
+    return results
+
+
+def run_batch(kwargs_list, client, tag="batch", poll=None, timeout=None):
+    """
+    Submit (or resume) one batch for `kwargs_list` and block until it ends.
+    Returns one entry per request, in order: response text or BatchRequestError.
+    """
+    kwargs_list = list(kwargs_list)
+    if not kwargs_list:
+        return []
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    content = build_jsonl(kwargs_list)
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    jsonl_path = os.path.join(BATCH_DIR, f"{tag}-{digest}.jsonl")
+    state_path = jsonl_path[:-len(".jsonl")] + ".state.json"
+
+    state = _read_state(state_path)
+    if state is not None and state.get("status") not in ("failed", "expired", "cancelled"):
+        print(f"♻️ Resuming batch {state['batch_id']} for {len(kwargs_list)} request(s) ({os.path.basename(jsonl_path)})")
+        batch_id = state["batch_id"]
+    else:
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        batch_id = submit(client, jsonl_path).id
+        state = {"batch_id": batch_id, "requests": len(kwargs_list), "submitted_at": time.time(), "status": "submitted"}
+        _write_state(state_path, state)
+        print(f"📤 Submitted batch {batch_id} with {len(kwargs_list)} request(s) ({os.path.basename(jsonl_path)})")
+
+    batch = wait(client, batch_id, poll, timeout)
+    state["status"] = batch.status
+    _write_state(state_path, state)
+    results = collect(client, batch, len(kwargs_list))
+
+    answered = sum(not isinstance(r, BaseException) for r in results)
+    with open(jsonl_path[:-len(".jsonl")] + ".output.jsonl", "w", encoding="utf-8") as f:
+        for i, result in enumerate(results):
+            f.write(json.dumps({"custom_id": custom_id(i), "ok": not isinstance(result, BaseException),
+                                "content": str(result)}, ensure_ascii=False) + "\n")
+    print(f"📥 Batch {batch_id} {batch.status}: {answered}/{len(results)} response(s)")
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "status":
+        sys.exit("usage: python llm_batch.py status [batch_dir]")
+    folder = sys.argv[2] if len(sys.argv) > 2 else BATCH_DIR
+    states = sorted(f for f in os.listdir(folder) if f.endswith(".state.json")) if os.path.isdir(folder) else []
+    if not states:
+        print(f"📭 No batches under {folder}")
+    for name in states:
+        state = _read_state(os.path.join(folder, name))
+        print(f"📦 {name[:-len('.state.json')]}: {state['batch_id']} — {state['status']} ({state['requests']} request(s))")
@@ -0,0 +1,171 @@
+## llm_cache.py
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+"""
+Persistent LLM response cache (SQLite)
+--------------------------------------
+Key = sha256 over (model, system message, user message, temperature as sent,
+and the structured-output response_format when one is requested),
+so a rerun with identical prompts is answered from disk without an API call.
+
+* TTL: entries older than `ttl` seconds are treated as misses (0 = never expire).
+* Size bound: after each insert the least-recently-used entries are evicted
+  until the stored prompt + response bytes fit in `max_bytes`.
+* WAL mode + a busy timeout, so parallel pipeline processes can share one file.
+* readonly=True (replay mode) opens the file with sqlite's mode=ro and never
+  creates, migrates or updates it; a missing file is an empty cache.
+* In-process hit / miss / write / eviction counters (`stats()`).
+
+CLI:
+    python llm_cache.py stats [path]
+    python llm_cache.py purge [path]     # drop expired entries (ORCA_LLM_CACHE_TTL)
+    python llm_cache.py clear [path]
+"""
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key         TEXT PRIMARY KEY,
+    model       TEXT NOT NULL,
+    request     TEXT NOT NULL,
+    response    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+def cache_key(model, system_msg, user_msg, temperature, response_format=None):
+    """Deterministic key; `temperature` is what is actually sent (None when omitted)."""
+    parts = [model, system_msg, user_msg, temperature]
+    if response_format is not None:  # plain-text keys stay as they were
+        parts.append(response_format)
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe prompt → response store with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=0, max_bytes=512 * 1024 * 1024, readonly=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.readonly = readonly
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        if readonly:
+            # replay over a shared / committed file: never create, migrate or touch it
+            self._db = None
+            if os.path.exists(path):
+                # without a pending -wal file (a closed or committed cache) immutable=1 also keeps
+                # sqlite from creating -wal / -shm side files next to it
+                uri = Path(path).resolve().as_uri() + "?mode=ro"
+                uri += "" if os.path.exists(path + "-wal") else "&immutable=1"
+                self._db = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False, isolation_level=None)
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _expired(self, created_at, now):
+        return self.ttl > 0 and created_at + self.ttl < now
+
+    def get(self, key, readonly=False):
+        """
+        Cached response or None (expired entries count as misses and are dropped).
+        readonly=True (or a read-only cache) never writes: no last_access update, no drop.
+        """
+        now = time.time()
+        readonly = readonly or self.readonly
+        with self._lock:
+            if self._db is None:                     # read-only cache without a file
+                self.counters["misses"] += 1
+                return None
+            row = self._db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._expired(row[1], now):
+                if not readonly:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            if not readonly:
+                self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.counters["hits"] += 1
+            return row[0]
+
+    def put(self, key, model, request, response):
+        now = time.time()
+        request_json = json.dumps(request, ensure_ascii=False)
+        size = len(request_json.encode("utf-8")) + len(response.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, request_json, response, size, now, now))
+            self.counters["writes"] += 1
+            self._evict()
+
+    def _evict(self):
+        if not self.max_bytes:
+            return
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # walk from the least recently used entry until enough bytes are freed
+        excess, victims = total - self.max_bytes, []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.counters["evictions"] += len(victims)
+
+    def purge_expired(self):
+        if self.ttl <= 0:
+            return 0
+        with self._lock:
+            cur = self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+        self._db.execute("VACUUM")
+
+    def stats(self):
+        entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return dict(self.counters, entries=entries, bytes=size)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "purge", "clear"):
+        sys.exit("usage: python llm_cache.py stats|purge|clear [cache_path]")
+    cache = ResponseCache(sys.argv[2] if len(sys.argv) > 2 else os.environ.get("ORCA_LLM_CACHE") or DEFAULT_PATH,
+                          ttl=float(os.environ.get("ORCA_LLM_CACHE_TTL", "0")))
+    if sys.argv[1] == "purge":
+        print(f"🧹 Removed {cache.purge_expired()} expired entr(ies)")
+    elif sys.argv[1] == "clear":
+        cache.clear()
+        print(f"🧹 Cleared {cache.path}")
+    stats = cache.stats()
+    print(f"🗃️ {cache.path}: {stats['entries']} entr(ies), {stats['bytes'] / 1e6:.2f} MB")
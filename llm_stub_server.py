@@ -0,0 +1,227 @@
+## llm_stub_server.py
+
+import sys
+import json
+import time
+import threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Local OpenAI-compatible stub server
+-----------------------------------
+Answers POST .../chat/completions with a canned completion, so the LLM stages
+and queryGPT can be exercised without network access or an API key:
+
+    python llm_stub_server.py 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python _9_Reasoner.py
+
+In-process use (see _llm_client_check.py): `StubServer().start()`, then queue
+scripted failures with `server.script.append((status, headers, delay_s))`.
+Every request is recorded in `server.requests` (body + client port), which
+makes connection reuse observable.
+
+Fake Batch API (for llm_batch.py): POST /v1/files (multipart upload),
+POST /v1/batches, GET /v1/batches/{id} and GET /v1/files/{id}/content. A batch
+reports in_progress for `server.batch_polls` retrievals, then completes with
+one output line per input line; custom_ids listed in `server.batch_fail_ids`
+go to the error file instead. The next `server.batch_poll_errors` retrievals
+answer 503 first.
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_bytes(self, data):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _upload(self, raw):
+        """Parse a multipart/form-data body into {field name: bytes}."""
+        head = b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n"
+        message = BytesParser(policy=default_policy).parsebytes(head + raw)
+        return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                for part in message.iter_parts()}
+
+    def do_GET(self):
+        stub = self.server.stub
+        parts = self.path.split("?")[0].rstrip("/").split("/")
+        with stub.lock:
+            stub.requests.append({"path": self.path, "body": None, "port": self.client_address[1]})
+            if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in stub.batches:
+                if stub.batch_poll_errors:
+                    stub.batch_poll_errors -= 1
+                    self._send_json(503, {"error": {"message": "stub error 503", "type": "stub", "code": 503}})
+                    return
+                self._send_json(200, stub.poll_batch(parts[-1]))
+                return
+            if len(parts) >= 3 and parts[-1] == "content" and parts[-2] in stub.files:
+                self._send_bytes(stub.files[parts[-2]]["data"])
+                return
+        self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "stub"}})
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path.endswith("/files"):
+            with stub.lock:
+                stub.requests.append({"path": self.path, "body": None, "port": self.client_address[1]})
+                self._send_json(200, stub.add_file(self._upload(raw)))
+            return
+        body = json.loads(raw or b"{}")
+        if self.path.endswith("/batches"):
+            with stub.lock:
+                stub.requests.append({"path": self.path, "body": body, "port": self.client_address[1]})
+                self._send_json(200, stub.create_batch(body))
+            return
+        with stub.lock:
+            stub.requests.append({"path": self.path, "body": body, "port": self.client_address[1]})
+            status, headers, delay = stub.script.pop(0) if stub.script else (200, {}, 0.0)
+        if delay:
+            time.sleep(delay)
+        if status != 200:
+            self._send_json(status, {"error": {"message": f"stub error {status}", "type": "stub", "code": status}}, headers)
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "stub"}})
+            return
+        self._send_json(200, stub.reply(body), headers)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # concurrent batch clients open many sockets at once
+
+    def handle_error(self, request, client_address):
+        # clients that time out close the socket mid-reply; that is expected here
+        pass
+
+
+class StubServer:
+    """Threaded stub; `base_url` is ready to pass as OPENAI_BASE_URL."""
+
+    def __init__(self, host="127.0.0.1", port=0, responder=None):
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.stub = self
+        self.lock = threading.Lock()
+        self.script = []
+        self.requests = []
+        self.files = {}
+        self.batches = {}
+        self.batch_polls = 2
+        self.batch_fail_ids = set()
+        self.batch_poll_errors = 0
+        self.responder = responder or (lambda body: f"stub reply ({body['messages'][-1]['content'][:40]})")
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply(self, body):
+        content = self.responder(body)
+        usage = {"prompt_tokens": sum(len(m["content"]) // 4 for m in body.get("messages", [])),
+                 "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return {
+            "id": f"chatcmpl-stub-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+
+    # --- Fake Batch API (called with self.lock held) ------------------------
+    def add_file(self, fields, purpose=None):
+        file_id = f"file-stub-{len(self.files)}"
+        data = fields.get("file", b"")
+        self.files[file_id] = {"data": data, "purpose": purpose or (fields.get("purpose") or b"").decode()}
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": f"{file_id}.jsonl", "purpose": self.files[file_id]["purpose"]}
+
+    def create_batch(self, body):
+        batch_id = f"batch-stub-{len(self.batches)}"
+        lines = self.files[body["input_file_id"]]["data"].decode("utf-8").splitlines()
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "validating", "created_at": int(time.time()),
+            "output_file_id": None, "error_file_id": None, "polls": 0,
+            "request_counts": {"total": sum(1 for line in lines if line.strip()), "completed": 0, "failed": 0},
+        }
+        return self._batch_view(batch_id)
+
+    def _batch_view(self, batch_id):
+        return {k: v for k, v in self.batches[batch_id].items() if k != "polls"}
+
+    def poll_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        if batch["status"] in ("validating", "in_progress"):
+            if batch["polls"] < self.batch_polls:
+                batch["status"] = "in_progress"
+            else:
+                self._finish_batch(batch)
+        return self._batch_view(batch_id)
+
+    def _finish_batch(self, batch):
+        outputs, errors = [], []
+        for n, line in enumerate(self.files[batch["input_file_id"]]["data"].decode("utf-8").splitlines()):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            entry = {"id": f"batch_req_{n}", "custom_id": request["custom_id"], "error": None}
+            if request["custom_id"] in self.batch_fail_ids:
+                entry["response"] = {"status_code": 400, "request_id": f"req_{n}",
+                                     "body": {"error": {"message": "stub batch failure", "type": "stub"}}}
+                errors.append(entry)
+            else:
+                entry["response"] = {"status_code": 200, "request_id": f"req_{n}", "body": self.reply(request["body"])}
+                outputs.append(entry)
+        for kind, entries in (("output_file_id", outputs), ("error_file_id", errors)):
+            if entries:
+                data = "".join(json.dumps(e) + "\n" for e in entries).encode("utf-8")
+                batch[kind] = self.add_file({"file": data}, purpose="batch_output")["id"]
+        batch["request_counts"].update(completed=len(outputs), failed=len(errors))
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    server = StubServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"🧪 LLM stub listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,210 @@
+## oran_loader.py
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+"""
+Shared ORAN log loader
+----------------------
+* Explicit dtype schema: float32 KPMs, small ints for the integer control knobs,
+  categoricals for Slice / Scheduling — roughly a third of the inferred-dtype
+  footprint.
+* Column projection (`columns=`) and chunked iteration (`iter_log_chunks`) so
+  tens-of-millions-row logs never have to sit in memory whole.
+* Optional Parquet cache: set ORAN_PARQUET_CACHE=<dir> and every CSV is
+  converted once (keyed on path, size and mtime); later reads go through
+  pyarrow with native column projection.
+
+Integer columns are parsed as float64 (exact for these value ranges) and then
+given their schema dtype per column, once per file: a column with a NaN, a
+fractional value or a value outside its schema dtype (pandas would silently
+wrap TxPower 200 to -56 when parsing straight into int8) falls back to
+float32 on its own; the other columns keep their small ints. Every chunk of
+`iter_log_chunks` and the Parquet cache use the same per-file dtypes as
+`read_log` (chunked reads pre-scan the integer columns once for this).
+"""
+
+ORAN_SCHEMA = {
+    "TimeStep": "int32",
+    "Slice": "category",
+    "Throughput_Mbps": "float32",
+    "Avg_SNR_dB": "float32",
+    "Avg_Delay_ms": "float32",
+    "Users": "int16",
+    "PRB_num": "int16",
+    "DL_Buffer": "float32",
+    "Scheduling": "category",
+    "TxPower": "int8",
+    "ant_tilt_deg": "int8",
+    "user_throughput": "float32",
+    "CIO": "int8",
+}
+
+CHUNK_ROWS = int(os.environ.get("ORAN_CHUNK_ROWS", "1000000"))
+PARQUET_CACHE_DIR = os.environ.get("ORAN_PARQUET_CACHE", "")
+PARQUET_CACHE_VERSION = 2   # v1 stored every integer column as float32
+
+_CATEGORICAL = {c for c, t in ORAN_SCHEMA.items() if t == "category"}
+
+
+def log_columns(path):
+    """Header of a log without reading any rows."""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _projection(path, columns):
+    header = log_columns(path)
+    if columns is None:
+        return header
+    return [c for c in dict.fromkeys(columns) if c in header]
+
+
+def _integer_columns(columns):
+    return [c for c in columns if ORAN_SCHEMA.get(c, "").startswith("int")]
+
+
+def _dtypes(columns):
+    """Parse dtypes: the schema, with integer columns as float64 (see _integer_plan)."""
+    dtypes = {c: ORAN_SCHEMA[c] for c in columns if c in ORAN_SCHEMA}
+    return {c: ("float64" if t.startswith("int") else t) for c, t in dtypes.items()}
+
+
+def _integer_stats(df, stats):
+    """Accumulate (min, max, has NaN / fractional values) of the integer columns of a chunk."""
+    for col in _integer_columns(df.columns):
+        values = df[col]
+        lo, hi, bad = stats.get(col, (np.inf, -np.inf, False))
+        if len(values):
+            bad = bad or bool(values.isna().any()) or bool((values != np.floor(values)).any())
+            lo, hi = min(lo, values.min()), max(hi, values.max())
+        stats[col] = (lo, hi, bad)
+    return stats
+
+
+def _integer_plan(path, stats):
+    """Final dtype of each integer column: its schema dtype when every value fits, else float32."""
+    plan = {}
+    for col, (lo, hi, bad) in stats.items():
+        target = ORAN_SCHEMA[col]
+        info = np.iinfo(target)
+        if not bad and (lo > hi or (lo >= info.min and hi <= info.max)):
+            plan[col] = target
+            continue
+        reason = "NaN / fractional values" if bad else f"values in [{lo:.0f}, {hi:.0f}] outside {target}"
+        print(f"⚠️ {os.path.basename(path)}: {col} has {reason}, reading it as float32")
+        plan[col] = "float32"
+    return plan
+
+
+def _scan_integer_plan(path, usecols, chunksize):
+    """_integer_plan of a whole file, from one chunked pass over its integer columns only."""
+    ints = _integer_columns(usecols)
+    stats = {}
+    if ints:
+        for chunk in pd.read_csv(path, usecols=ints, dtype=_dtypes(ints), chunksize=chunksize):
+            _integer_stats(chunk, stats)
+    return _integer_plan(path, stats)
+
+
+def _apply_plan(df, plan):
+    for col, dtype in plan.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _restore_categoricals(df):
+    for col in _CATEGORICAL & set(df.columns):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+# === Parquet conversion cache ===
+def parquet_cache_path(path, cache_dir=None):
+    cache_dir = cache_dir if cache_dir is not None else PARQUET_CACHE_DIR
+    if not cache_dir:
+        return None
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|v{PARQUET_CACHE_VERSION}"
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.parquet")
+
+
+def convert_to_parquet(path, cache_path):
+    """Stream a CSV into a Parquet file chunk by chunk (categoricals stored as strings, ints as read_log types them)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    usecols = log_columns(path)
+    # one plan for the whole file keeps the Arrow schema stable across chunks
+    plan = _scan_integer_plan(path, usecols, CHUNK_ROWS)
+    dtypes = {c: ("string" if t == "category" else t) for c, t in _dtypes(usecols).items()}
+    tmp = cache_path + ".tmp"
+    writer = None
+    try:
+        for chunk in pd.read_csv(path, dtype=dtypes, chunksize=CHUNK_ROWS):
+            table = pa.Table.from_pandas(_apply_plan(chunk, plan), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return None
+    os.replace(tmp, cache_path)
+    return cache_path
+
+
+def _cached_parquet(path):
+    cache_path = parquet_cache_path(path)
+    if cache_path is None:
+        return None
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    if not os.path.exists(cache_path):
+        print(f"🗜️ Converting {os.path.basename(path)} → {cache_path}")
+        return convert_to_parquet(path, cache_path)
+    return cache_path
+
+
+# === Public API ===
+def read_log(path, columns=None):
+    """Read one ORAN log with the typed schema, projected onto `columns` (missing ones are dropped)."""
+    parquet = _cached_parquet(path)
+    if parquet is not None:
+        import pyarrow.parquet as pq
+        names = pq.read_schema(parquet).names
+        cols = names if columns is None else [c for c in dict.fromkeys(columns) if c in names]
+        return _restore_categoricals(pq.read_table(parquet, columns=cols).to_pandas())
+
+    usecols = _projection(path, columns)
+    df = pd.read_csv(path, usecols=usecols, dtype=_dtypes(usecols))
+    df = _apply_plan(df, _integer_plan(path, _integer_stats(df, {})))
+    # Ensure unique columns (safety)
+    return df.loc[:, ~df.columns.duplicated()]
+
+
+def iter_log_chunks(path, columns=None, chunksize=None):
+    """Yield typed DataFrame chunks of a log, projected onto `columns`."""
+    chunksize = chunksize or CHUNK_ROWS
+    parquet = _cached_parquet(path)
+    if parquet is not None:
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(parquet)
+        names = pf.schema_arrow.names
+        cols = names if columns is None else [c for c in dict.fromkeys(columns) if c in names]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=cols):
+            yield _restore_categoricals(batch.to_pandas())
+        return
+
+    usecols = _projection(path, columns)
+    plan = _scan_integer_plan(path, usecols, chunksize)
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=_dtypes(usecols), chunksize=chunksize):
+        yield _apply_plan(chunk, plan)
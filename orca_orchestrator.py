@@ -0,0 +1,293 @@
+## orca_orchestrator.py
+
+import os
+import sys
+import json
+import time
+import glob
+import runpy
+import traceback
+import importlib
+import subprocess
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from shap_store import store_path
+
+"""
+Multi-environment ORCA orchestrator
+-----------------------------------
+Replaces the serial per-environment loop of run_ORCA.sh:
+
+* Global stages (env encoding / comparison / decoding, recursive SHAP) run
+  once, in order, before any environment; they are incremental themselves.
+  ORCA_GLOBAL_STAGES=0 skips them (run_ORCA.sh runs them with its own
+  interpreters).
+* Every decoded_differences_ORAN_log_new<id>.txt is one environment, run as a
+  DAG of stages (ENV_DAG). Environments are independent and go to a process
+  pool (ORCA_WORKERS, 0 = one per environment up to the CPU count).
+* Workers are long-lived: each imports pandas / matplotlib / openai / the
+  SHAP store once (WARM_MODULES, plus ORCA_WARM_MODULES) and runs the stage
+  scripts in-process (runpy), so opened SHAP stores, the LLM client and the
+  LLM cache connection are reused by every stage and environment the worker
+  handles. Note that ORCA_LLM_RPM / _TPM limits apply per worker.
+* ORCA_RAG=1 adds the in-process RAG pipeline (rag_pipeline.py) as a stage;
+  workers then load the RAG index and SentenceTransformer at start-up and keep
+  them for every environment. Answers go to _6_organized_answers/env_new<id>/.
+* A finished stage leaves a marker in ORCA_RUN_DIR/env_new<id>/<stage>.done
+  stamped with the environment's inputs (decoded differences, SHAP store);
+  with ORCA_RESUME=1 (default) a stage is skipped while its marker matches and
+  none of its dependencies ran again. Stage output goes to <stage>.log.
+* A failing stage (exception or non-zero exit) only skips its dependants in
+  that environment; other stages and environments carry on.
+* Wall time per stage and environment is printed and written to
+  ORCA_RUN_DIR/report.json.
+
+ORCA_ENV_IDS=0,3 restricts the run to those environments; ORCA_SKIP_IDS skips some.
+"""
+
+# === Config ===
+DECODED_DIR = "./env_encoder/decoded_differences"
+DECODED_PREFIX = "decoded_differences_ORAN_log_new"
+SHAP_DIR = "./shap_outputs"
+RUN_DIR = os.environ.get("ORCA_RUN_DIR", "./interim_results/_orca_runs")
+ORCA_WORKERS = int(os.environ.get("ORCA_WORKERS", "0"))
+ENV_IDS = [i for i in os.environ.get("ORCA_ENV_IDS", "").split(",") if i]
+SKIP_IDS = [i for i in os.environ.get("ORCA_SKIP_IDS", "").split(",") if i]
+RESUME = os.environ.get("ORCA_RESUME", "1") == "1"
+GLOBAL_STAGES = os.environ.get("ORCA_GLOBAL_STAGES", "1") == "1"
+RAG_STAGE = os.environ.get("ORCA_RAG", "0") == "1"
+CPU_COUNT = os.cpu_count() or 1
+
+# (stage, working directory, script), run once each in this order
+GLOBAL_DAG = [
+    ("env_stats", "env_encoder", "compute_env_stats.py"),
+    ("env_encode", "env_encoder", "encoderEnv.py"),
+    ("env_compare", "env_encoder", "compare_new_env.py"),
+    ("env_decode", "env_encoder", "env_difference_decoder.py"),
+    ("shap", ".", "_0_shap_recursive.py"),
+]
+
+# stage → (script, stages it depends on)
+ENV_DAG = {
+    "past_shap_prompt": ("_7_past_shap_prompt.py", []),
+    "shap_infer_prompt": ("_8_shap_infer_prompt.py", ["past_shap_prompt"]),
+    "reasoner": ("_9_Reasoner.py", ["shap_infer_prompt"]),
+    "extrapolation": ("_extrapolation_method.py", []),
+    "no_external_knowledge": ("_no_external_knowledge_llm.py", []),
+    "compare": ("_compare_shap_actual_vs_llm.py", ["reasoner", "extrapolation", "no_external_knowledge"]),
+}
+if RAG_STAGE:
+    ENV_DAG["rag"] = ("rag_pipeline.py", [])
+
+# Extra environment of a stage, formatted with the environment id
+STAGE_ENV = {"rag": {"RAG_ANSWER_DIR": "./interim_results/_6_organized_answers/env_new{env_id}"}}
+
+# Imported once per worker, before its first stage
+WARM_MODULES = ["numpy", "pandas", "matplotlib.pyplot", "queryGPT", "llm_cache", "shap_store",
+                "derivation_store", "oran_loader", "_7_1_shap_prompt"]
+WARM_MODULES += [m for m in os.environ.get("ORCA_WARM_MODULES", "").split(",") if m]
+
+
+def topo_order(dag):
+    order, done = [], set()
+    while len(order) < len(dag):
+        ready = [s for s, (_, deps) in dag.items() if s not in done and all(d in done for d in deps)]
+        if not ready:
+            raise ValueError(f"Cycle in stage DAG: {sorted(set(dag) - done)}")
+        order += ready
+        done.update(ready)
+    return order
+
+
+def file_stamp(path):
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def input_stamps(env_id):
+    """What an environment's stages read, besides the reference SHAP stores and the dataset."""
+    return {
+        "decoded_txt": file_stamp(os.path.join(DECODED_DIR, f"{DECODED_PREFIX}{env_id}.txt")),
+        "decoded_json": file_stamp(os.path.join(DECODED_DIR, f"{DECODED_PREFIX}{env_id}.json")),
+        "shap_store": file_stamp(store_path(SHAP_DIR, f"ORAN_log_new{env_id}")),
+    }
+
+
+def discover_envs():
+    ids = [os.path.basename(p)[len(DECODED_PREFIX):-len(".txt")]
+           for p in glob.glob(os.path.join(DECODED_DIR, f"{DECODED_PREFIX}*.txt"))]
+    ids = sorted((i for i in ids if i.isdigit()), key=int)
+    if ENV_IDS:
+        ids = [i for i in ids if i in ENV_IDS]
+    return [i for i in ids if i not in SKIP_IDS]
+
+
+# === Global stages ===
+def run_global():
+    """Run GLOBAL_DAG as separate processes; returns {stage: seconds}, exits on the first failure."""
+    timings = {}
+    for stage, cwd, script in GLOBAL_DAG:
+        print(f"\n📦 [global] {stage}: {os.path.join(cwd, script)}")
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, script], cwd=cwd)
+        timings[stage] = time.perf_counter() - start
+        if result.returncode != 0:
+            sys.exit(f"❌ Global stage {stage} failed (exit {result.returncode}); no environment was run")
+        print(f"✅ [global] {stage} in {timings[stage]:.2f}s")
+    return timings
+
+
+# === Per-environment worker ===
+def warm_worker():
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"⚠️ Could not preload {name}: {e}")
+    if RAG_STAGE:
+        try:
+            importlib.import_module("rag_pipeline").retrieval.shared_retriever()
+        except Exception as e:   # the rag stage reports it again, per environment
+            print(f"⚠️ Could not preload the RAG index: {e}")
+
+
+def run_script(script, log_path):
+    """Run a stage script in this process as __main__, output to log_path → (ok, error)."""
+    with open(log_path, "w", encoding="utf-8") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            runpy.run_path(script, run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                print(e.code)
+                return False, f"exit: {e.code}"
+        except Exception as e:
+            traceback.print_exc()
+            return False, f"{type(e).__name__}: {e}"
+        finally:
+            if "matplotlib.pyplot" in sys.modules:
+                sys.modules["matplotlib.pyplot"].close("all")
+    return True, None
+
+
+def read_marker(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f).get("inputs")
+
+
+def run_env(env_id, resume=RESUME):
+    """Run one environment's DAG; stage failures are returned, never raised."""
+    env_dir = os.path.join(RUN_DIR, f"env_new{env_id}")
+    os.makedirs(env_dir, exist_ok=True)
+    os.environ["INPUT_ENV_ID"] = env_id
+    inputs = input_stamps(env_id)
+    status, timings, errors, ran = {}, {}, {}, set()
+    for stage in topo_order(ENV_DAG):
+        script, deps = ENV_DAG[stage]
+        if any(status[d] in ("failed", "skipped") for d in deps):
+            status[stage] = "skipped"
+            continue
+        marker = os.path.join(env_dir, f"{stage}.done")
+        if resume and not ran.intersection(deps) and read_marker(marker) == inputs:
+            status[stage] = "resumed"
+            continue
+        if os.path.exists(marker):
+            os.remove(marker)
+
+        for key, value in STAGE_ENV.get(stage, {}).items():
+            os.environ[key] = value.format(env_id=env_id)
+        start = time.perf_counter()
+        ok, error = run_script(script, os.path.join(env_dir, f"{stage}.log"))
+        timings[stage] = time.perf_counter() - start
+        ran.add(stage)
+        if ok:
+            status[stage] = "ok"
+            with open(marker, "w") as f:
+                json.dump({"inputs": inputs, "seconds": round(timings[stage], 3), "finished_at": time.time()}, f)
+        else:
+            status[stage] = "failed"
+            errors[stage] = error
+    return {"env_id": env_id, "status": status, "timings": timings, "errors": errors}
+
+
+# === Report ===
+def print_env(result):
+    parts = []
+    for stage in topo_order(ENV_DAG):
+        state = result["status"].get(stage, "failed")
+        if state == "ok":
+            parts.append(f"{stage} {result['timings'][stage]:.2f}s")
+        else:
+            parts.append(f"{stage} {'⏩' if state == 'resumed' else '❌' if state == 'failed' else '–'}")
+    failed = [s for s, state in result["status"].items() if state == "failed"]
+    print(f"{'❌' if failed else '✅'} new{result['env_id']}: " + ", ".join(parts))
+    for stage in failed:
+        print(f"     {stage}: {result['errors'].get(stage)} "
+              f"(log: {os.path.join(RUN_DIR, 'env_new' + result['env_id'], stage + '.log')})")
+
+
+def write_report(global_timings, results, wall):
+    per_stage = {}
+    for stage in topo_order(ENV_DAG):
+        times = [r["timings"][stage] for r in results if stage in r["timings"]]
+        per_stage[stage] = {"runs": len(times), "total_s": round(sum(times), 3),
+                            "mean_s": round(sum(times) / len(times), 3) if times else None}
+    report = {"wall_s": round(wall, 3), "global": {s: round(t, 3) for s, t in global_timings.items()},
+              "stages": per_stage, "envs": results}
+    os.makedirs(RUN_DIR, exist_ok=True)
+    path = os.path.join(RUN_DIR, "report.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n⏱️ Stage wall time over {len(results)} environment(s):")
+    for stage, entry in per_stage.items():
+        if entry["runs"]:
+            print(f"   {stage:<24} {entry['runs']:>3} run(s)  total {entry['total_s']:>9.2f}s  mean {entry['mean_s']:>8.2f}s")
+        else:
+            print(f"   {stage:<24}   0 run(s)")
+    print(f"📄 Report saved to {path} (wall time {wall:.2f}s)")
+
+
+# === Main ===
+def main():
+    start = time.perf_counter()
+    global_timings = run_global() if GLOBAL_STAGES else {}
+
+    envs = discover_envs()
+    if not envs:
+        sys.exit(f"❌ No {DECODED_PREFIX}*.txt found in {DECODED_DIR}")
+    workers = max(1, min(ORCA_WORKERS if ORCA_WORKERS > 0 else CPU_COUNT, len(envs)))
+    print(f"\n🌍 {len(envs)} environment(s) over {workers} worker(s), resume={'on' if RESUME else 'off'}")
+
+    results = []
+    if workers == 1:
+        warm_worker()
+        for env_id in envs:
+            results.append(run_env(env_id))
+            print_env(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker) as pool:
+            futures = {pool.submit(run_env, env_id): env_id for env_id in envs}
+            for fut in as_completed(futures):
+                try:
+                    result = fut.result()
+                except Exception as e:   # the worker process itself died
+                    result = {"env_id": futures[fut], "status": {s: "failed" for s in ENV_DAG}, "timings": {},
+                              "errors": {s: f"worker crashed: {e}" for s in ENV_DAG}}
+                results.append(result)
+                print_env(result)
+
+    results.sort(key=lambda r: int(r["env_id"]))
+    write_report(global_timings, results, time.perf_counter() - start)
+    failed = [r["env_id"] for r in results if "failed" in r["status"].values()]
+    if failed:
+        sys.exit(f"❌ {len(failed)} environment(s) with failed stages: {', '.join('new' + i for i in failed)}")
+    print("\n🏁 All new environments processed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,425 @@
 ## queryGPT.py
 
 import os
-import subprocess
-import json
-from openai import OpenAI
-import openai
+import re
 import sys
+import time
+import random
+import atexit
+import asyncio
+import threading
+import weakref
+from email.utils import parsedate_to_datetime
 from packaging import version
+import llm_batch
+from llm_cache import ResponseCache, cache_key, DEFAULT_PATH as DEFAULT_CACHE_PATH
 
-# === Version check ===
+"""
+Shared LLM client
+-----------------
+* One module-level OpenAI client per process (created lazily, thread-safe), so
+  every call reuses the same keep-alive HTTP connection pool instead of paying
+  TCP/TLS setup per request.
+* Configurable timeouts, and retries with jittered exponential backoff on
+  429 / 408 / 409 / 5xx / timeouts / connection errors; a Retry-After (or
+  retry-after-ms) header from the server takes precedence over the backoff.
+* `temp` and the model are passed through; o-series reasoning models only
+  accept the default temperature, so it is omitted for them. An optional
+  `response_format` (structured outputs) is passed through as well.
+* Query_GPT4_batch / Query_GPT4_async: asyncio engine for independent
+  requests — bounded concurrency (semaphore) plus requests-per-minute and
+  tokens-per-minute token buckets; results come back in submission order.
+* Persistent response cache (llm_cache.py, SQLite) keyed on model, system
+  message, user message and temperature: reruns cost no API calls. Modes:
+  readwrite (default), replay (read-only; a miss raises CacheMissError
+  instead of calling the API — for offline evaluation) and off.
+* ORCA_LLM_BACKEND=batch routes Query_GPT4_batch through the OpenAI Batch
+  API (llm_batch.py): cheaper, non-interactive bulk runs over many envs.
+
+Environment:
+    OPENAI_API_KEY, OPENAI_BASE_URL   credentials / endpoint (e.g. a local stub)
+    ORCA_LLM_MODEL                    default model (o4-mini)
+    ORCA_LLM_TIMEOUT                  read timeout in seconds (600)
+    ORCA_LLM_CONNECT_TIMEOUT          connect timeout in seconds (10)
+    ORCA_LLM_MAX_RETRIES              retries after the first attempt (6)
+    ORCA_LLM_BACKOFF_BASE / _MAX      backoff base / cap in seconds (1 / 60)
+    ORCA_LLM_CONCURRENCY              in-flight requests per batch (8)
+    ORCA_LLM_RPM / ORCA_LLM_TPM       requests / tokens per minute, 0 = unlimited
+    ORCA_LLM_EST_OUTPUT_TOKENS        completion tokens reserved per request (1024)
+    ORCA_LLM_CACHE                    cache file (llm_cache.sqlite next to this module)
+    ORCA_LLM_CACHE_MODE               readwrite | replay | off
+    ORCA_LLM_CACHE_TTL                seconds before an entry expires, 0 = never (0)
+    ORCA_LLM_CACHE_MAX_MB             LRU size bound of the cache file contents (512)
+    ORCA_LLM_BACKEND                  async | batch (batch settings: see llm_batch.py)
+"""
+
+# === Version check (on first client use) ===
 required_version = "1.0.0"
-current_version = openai.__version__
+openai = None   # the SDK takes ~1 s to import; cache hits and replay runs never need it
+
+
+def load_openai():
+    global openai
+    if openai is None:
+        import openai as sdk
+        if version.parse(sdk.__version__) < version.parse(required_version):
+            sys.exit(f"❌ Incompatible OpenAI version: {sdk.__version__}. Please use >= {required_version}.\n"
+                     f"Try running: pip install --upgrade openai")
+        openai = sdk
+    return openai
+
+
+# === Config ===
+API_KEY = os.environ.get("OPENAI_API_KEY", "Your-API-Key")
+BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+LLM_MODEL = os.environ.get("ORCA_LLM_MODEL", "o4-mini")  # "o4-mini", "gpt-4o"
+LLM_TIMEOUT = float(os.environ.get("ORCA_LLM_TIMEOUT", "600"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("ORCA_LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.environ.get("ORCA_LLM_MAX_RETRIES", "6"))
+BACKOFF_BASE = float(os.environ.get("ORCA_LLM_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.environ.get("ORCA_LLM_BACKOFF_MAX", "60"))
+LLM_CONCURRENCY = int(os.environ.get("ORCA_LLM_CONCURRENCY", "8"))
+LLM_RPM = float(os.environ.get("ORCA_LLM_RPM", "0"))
+LLM_TPM = float(os.environ.get("ORCA_LLM_TPM", "0"))
+EST_OUTPUT_TOKENS = int(os.environ.get("ORCA_LLM_EST_OUTPUT_TOKENS", "1024"))
+CACHE_PATH = os.environ.get("ORCA_LLM_CACHE") or DEFAULT_CACHE_PATH
+CACHE_MODE = os.environ.get("ORCA_LLM_CACHE_MODE", "readwrite")
+CACHE_TTL = float(os.environ.get("ORCA_LLM_CACHE_TTL", "0"))
+CACHE_MAX_MB = float(os.environ.get("ORCA_LLM_CACHE_MAX_MB", "512"))
+CACHE_MODES = ("readwrite", "replay", "off")
+LLM_BACKEND = os.environ.get("ORCA_LLM_BACKEND", "async")
+LLM_BACKENDS = ("async", "batch")
+
+RETRY_STATUS = {408, 409, 429}
+_FIXED_TEMPERATURE_MODEL = re.compile(r"^o\d")
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()  # one AsyncOpenAI per event loop
+_cache = None
+
+
+class CacheMissError(RuntimeError):
+    """Replay mode was asked for a response that is not in the cache."""
+
+
+def _client_kwargs():
+    return {
+        "api_key": API_KEY,
+        "base_url": BASE_URL,
+        "timeout": load_openai().Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        "max_retries": 0,
+    }
+
+
+def get_client():
+    """The process-wide pooled client (retries are handled here, not by the SDK)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = load_openai().OpenAI(**_client_kwargs())
+    return _client
+
+
+def get_async_client():
+    """Pooled async client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = load_openai().AsyncOpenAI(**_client_kwargs())
+        _async_clients[loop] = client
+    return client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_client)
+
+
+# === Response cache ===
+def get_cache():
+    """The shared ResponseCache, or None when caching is off."""
+    global _cache
+    if CACHE_MODE not in CACHE_MODES:
+        raise ValueError(f"Unknown ORCA_LLM_CACHE_MODE '{CACHE_MODE}' (expected one of {CACHE_MODES})")
+    if CACHE_MODE == "off":
+        return None
+    if _cache is None:
+        with _client_lock:
+            if _cache is None:
+                _cache = ResponseCache(CACHE_PATH, ttl=CACHE_TTL, max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+                                       readonly=CACHE_MODE == "replay")
+    return _cache
+
+
+def _cache_lookup(kwargs):
+    """(key, cached response or None); in replay mode a miss raises CacheMissError."""
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    messages = kwargs["messages"]
+    key = cache_key(kwargs["model"], messages[0]["content"], messages[1]["content"],
+                    kwargs.get("temperature"), kwargs.get("response_format"))
+    content = cache.get(key, readonly=CACHE_MODE == "replay")
+    if content is None and CACHE_MODE == "replay":
+        raise CacheMissError(f"No cached response for {kwargs['model']} prompt {key[:12]} (replay mode)")
+    return key, content
+
+
+def _cache_store(key, kwargs, content):
+    if key is not None and content is not None and CACHE_MODE == "readwrite":
+        get_cache().put(key, kwargs["model"], kwargs, content)
+
+
+def _report_cache():
+    if _cache is not None:
+        c = _cache.counters
+        if c["hits"] or c["misses"]:
+            print(f"🗃️ LLM cache: {c['hits']} hit(s), {c['misses']} miss(es), "
+                  f"{c['writes']} write(s), {c['evictions']} eviction(s)")
+        _cache.close()
+
 
-if version.parse(current_version) < version.parse(required_version):
-    sys.exit(f"❌ Incompatible OpenAI version: {current_version}. Please use >= {required_version}.\n"
-             f"Try running: pip install --upgrade openai")
+atexit.register(_report_cache)
 
 
-def Query_GPT4(system_msg, user_msg, temp):
-    client = OpenAI(api_key="Your-API-Key")
-    response = client.chat.completions.create(
-        model="o4-mini",#"o4-mini",#"gpt-4o",
-        messages=[
+# === Retry policy ===
+def is_retryable(err):
+    openai = load_openai()
+    if isinstance(err, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(err, openai.APIStatusError):
+        return err.status_code in RETRY_STATUS or err.status_code >= 500
+    return False
+
+
+def retry_after_seconds(err):
+    """Server-requested delay from retry-after-ms / Retry-After (seconds or HTTP date), if any."""
+    response = getattr(err, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, err=None):
+    """Retry-After when the server sent one, else full-jitter exponential backoff."""
+    requested = retry_after_seconds(err) if err is not None else None
+    if requested is not None:
+        return requested
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def chat_kwargs(system_msg, user_msg, temp, model, response_format=None):
+    kwargs = {
+        "model": model,
+        "messages": [
             {"role": "system", "content": system_msg},
             {"role": "user", "content": user_msg}
-        ]
-    )
-    return response.choices[0].message.content
\ No newline at end of file
+        ],
+    }
+    if temp is not None and not _FIXED_TEMPERATURE_MODEL.match(model):
+        kwargs["temperature"] = temp
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    return kwargs
+
+
+def _should_retry(attempt, err):
+    """Delay before the next attempt, or None when `err` must be raised."""
+    if attempt >= LLM_MAX_RETRIES or not is_retryable(err):
+        return None
+    delay = backoff_delay(attempt, err)
+    print(f"⚠️ LLM call failed ({type(err).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+    return delay
+
+
+def Query_GPT4(system_msg, user_msg, temp, model=None, response_format=None):
+    kwargs = chat_kwargs(system_msg, user_msg, temp, model or LLM_MODEL, response_format)
+    key, cached = _cache_lookup(kwargs)
+    if cached is not None:
+        return cached
+    client = get_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            response = client.chat.completions.create(**kwargs)
+            content = response.choices[0].message.content
+            _cache_store(key, kwargs, content)
+            return content
+        except openai.APIError as err:
+            delay = _should_retry(attempt, err)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+# === Async engine ===
+def estimate_tokens(kwargs):
+    """Rough prompt size (≈4 chars per token) plus the reserved completion budget."""
+    return sum(len(m["content"]) for m in kwargs["messages"]) // 4 + EST_OUTPUT_TOKENS
+
+
+class RateLimiter:
+    """Token buckets for requests/min and tokens/min; a limit of 0 disables that bucket."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.rpm = LLM_RPM if rpm is None else rpm
+        self.tpm = LLM_TPM if tpm is None else tpm
+        self._requests, self._tokens = float(self.rpm), float(self.tpm)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._last = now - self._last, now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens):
+        """Wait (FIFO) until one request and `tokens` tokens fit in the budget, then take them."""
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+        return tokens
+
+    def settle(self, reserved, used):
+        """Correct the token bucket once the real usage of a request is known."""
+        if self.tpm and used is not None:
+            self._tokens += reserved - used
+
+
+async def Query_GPT4_async(system_msg, user_msg, temp, model=None, limiter=None, response_format=None):
+    kwargs = chat_kwargs(system_msg, user_msg, temp, model or LLM_MODEL, response_format)
+    key, cached = _cache_lookup(kwargs)
+    if cached is not None:
+        return cached
+    client = get_async_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        reserved = await limiter.acquire(estimate_tokens(kwargs)) if limiter is not None else 0
+        try:
+            response = await client.chat.completions.create(**kwargs)
+        except openai.APIError as err:
+            delay = _should_retry(attempt, err)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        if limiter is not None:
+            usage = getattr(response, "usage", None)
+            limiter.settle(reserved, getattr(usage, "total_tokens", None))
+        content = response.choices[0].message.content
+        _cache_store(key, kwargs, content)
+        return content
+
+
+async def _run_batch(requests, temp, model, concurrency, response_format=None, latencies=None):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter()
+
+    async def one(n, request):
+        system_msg, user_msg = request[0], request[1]
+        request_temp = request[2] if len(request) > 2 else temp
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return await Query_GPT4_async(system_msg, user_msg, request_temp, model, limiter, response_format)
+            finally:
+                if latencies is not None:
+                    latencies[n] = time.perf_counter() - start
+
+    try:
+        return await asyncio.gather(*(one(n, r) for n, r in enumerate(requests)), return_exceptions=True)
+    finally:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+
+def _run_offline_batch(requests, temp, model, response_format=None):
+    """Answer cache hits locally and send the misses as one Batch API job."""
+    results, pending = [None] * len(requests), []
+    for i, request in enumerate(requests):
+        kwargs = chat_kwargs(request[0], request[1], request[2] if len(request) > 2 else temp,
+                             model or LLM_MODEL, response_format)
+        try:
+            key, cached = _cache_lookup(kwargs)
+        except CacheMissError as err:
+            results[i] = err
+            continue
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append((i, key, kwargs))
+    if pending:
+        tag = os.path.splitext(os.path.basename(sys.argv[0] or "batch"))[0] or "batch"
+        answers = llm_batch.run_batch([kwargs for _, _, kwargs in pending], get_client(), tag=tag)
+        for (i, key, kwargs), answer in zip(pending, answers):
+            if not isinstance(answer, BaseException):
+                _cache_store(key, kwargs, answer)
+            results[i] = answer
+    return results
+
+
+def Query_GPT4_batch(requests, temp=0, model=None, concurrency=None, return_exceptions=False,
+                     response_format=None, latencies=None):
+    """
+    Run independent (system_msg, user_msg[, temp]) requests concurrently, or as
+    one Batch API job when ORCA_LLM_BACKEND=batch. `response_format` (e.g. a
+    json_schema structured-output spec) applies to every request.
+    Returns the responses in request order. With return_exceptions=True a failed
+    request yields its exception in place; otherwise the first failure (in
+    request order) is raised after every request has finished.
+    `latencies`, if given a list, is filled with each request's own wall time in
+    seconds (from getting a concurrency slot to its answer, retries included);
+    entries stay None with the batch backend, which has no per-request timing.
+    """
+    requests = list(requests)
+    if latencies is not None:
+        latencies[:] = [None] * len(requests)
+    if not requests:
+        return []
+    if LLM_BACKEND not in LLM_BACKENDS:
+        raise ValueError(f"Unknown ORCA_LLM_BACKEND '{LLM_BACKEND}' (expected one of {LLM_BACKENDS})")
+    if LLM_BACKEND == "batch":
+        results = _run_offline_batch(requests, temp, model, response_format)
+    else:
+        results = asyncio.run(_run_batch(requests, temp, model, concurrency or LLM_CONCURRENCY, response_format,
+                                         latencies))
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    return results
@@ -0,0 +1,274 @@
+## rag_builder.py
+
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import numpy as np
+import faiss
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sklearn.feature_extraction.text import TfidfVectorizer
+from rag_records import Document
+
+"""
+Offline RAG index builder
+-------------------------
+Chunks a local document corpus (.txt / .md, .pdf when pypdf is installed) and
+writes everything _3_hybrid_rag_retrieval.py loads from rag_index/:
+
+    documents.pkl           chunk Documents (page_content + metadata["source"])
+    dense_index.faiss       IndexFlatL2 over all-MiniLM-L6-v2 embeddings
+    tfidf_vectorizer.pkl    TF-IDF vectorizer fitted on the chunks
+    tfidf_matrix.npz/.json  L2-normalised sparse document matrix + stamps
+    embeddings.npy          dense vectors, row-aligned with documents.pkl
+    manifest.json           sources, chunk hashes, settings, index version
+
+Incremental: chunks are keyed by the sha256 of their text, so a rebuild only
+embeds chunks that are not in the previous index. New chunks are appended
+after the existing ones (document ids stay stable and the FAISS index is
+extended in place); chunks of edited or deleted files are dropped and the
+index is recompacted from embeddings.npy without re-embedding. The TF-IDF
+side is refitted whenever the chunk set changes (idf depends on the corpus).
+A different model or chunking setting triggers a full rebuild.
+
+Every file of a build is written to rag_index/.staging/ first and then moved
+into place; the old manifest.json is removed before the first move and the new
+one moved in last, so an interrupted build leaves no manifest and the next
+build starts from scratch instead of trusting a mixed set of files.
+
+CLI:
+    python rag_builder.py build      # incremental (default)
+    python rag_builder.py rebuild    # ignore the previous index
+    python rag_builder.py status
+
+Environment:
+    RAG_CORPUS_DIR      documents to index (./rag_corpus)
+    RAG_INDEX_DIR       output directory (./rag_index)
+    RAG_EMBED_MODEL     sentence-transformers model (all-MiniLM-L6-v2)
+    RAG_EMBED_BATCH     chunks per encode call (64)
+    RAG_CHUNK_SIZE / RAG_CHUNK_OVERLAP   characters per chunk / overlap (1000 / 200)
+"""
+
+# === Config ===
+CORPUS_DIR = os.environ.get("RAG_CORPUS_DIR", "./rag_corpus")
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "./rag_index")
+EMBED_MODEL = os.environ.get("RAG_EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_BATCH = int(os.environ.get("RAG_EMBED_BATCH", "64"))
+CHUNK_SIZE = int(os.environ.get("RAG_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", "200"))
+TEXT_SUFFIXES = (".txt", ".md")
+MANIFEST_VERSION = 1
+
+
+
+# === Corpus ===
+def file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def read_document(path):
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def corpus_files(corpus_dir):
+    """Relative paths of indexable files, sorted."""
+    suffixes = TEXT_SUFFIXES
+    try:
+        import pypdf  # noqa: F401
+        suffixes += (".pdf",)
+    except ImportError:
+        pass
+    found = []
+    for root, _, names in os.walk(corpus_dir):
+        for name in names:
+            if name.lower().endswith(suffixes):
+                found.append(os.path.relpath(os.path.join(root, name), corpus_dir))
+    return sorted(found)
+
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Fixed-size character windows with overlap, cut at a paragraph / sentence end when possible."""
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = max(text.rfind("\n\n", start, end), text.rfind(". ", start, end))
+            if cut > start + size // 2:
+                end = cut + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+# === Index files ===
+def _paths(index_dir):
+    return {name: os.path.join(index_dir, name) for name in (
+        "documents.pkl", "dense_index.faiss", "tfidf_vectorizer.pkl", "tfidf_matrix.npz",
+        "tfidf_matrix.json", "embeddings.npy", "manifest.json")}
+
+
+def load_manifest(index_dir=INDEX_DIR):
+    path = _paths(index_dir)["manifest.json"]
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def _write(path, write, mode="wb"):
+    with open(path, mode) as f:
+        write(f)
+
+
+def _commit(staging, index_dir):
+    """Move the staged files into index_dir, invalidating the old manifest first and committing the new one last."""
+    manifest_path = _paths(index_dir)["manifest.json"]
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    names = sorted(os.listdir(staging), key=lambda name: name == "manifest.json")
+    for name in names:
+        os.replace(os.path.join(staging, name), os.path.join(index_dir, name))   # atomic per file for readers
+    os.rmdir(staging)
+
+
+def embed(texts, encoder, batch_size=None):
+    """float32 embeddings, encoded `batch_size` (RAG_EMBED_BATCH) chunks per call."""
+    batch_size = batch_size or EMBED_BATCH
+    parts = []
+    for start in range(0, len(texts), batch_size):
+        parts.append(np.asarray(encoder.encode(texts[start:start + batch_size], batch_size=batch_size),
+                                dtype=np.float32))
+        print(f"   🧠 Embedded {min(start + batch_size, len(texts))}/{len(texts)} chunk(s)")
+    return np.concatenate(parts) if parts else None
+
+
+def build(corpus_dir=CORPUS_DIR, index_dir=INDEX_DIR, encoder=None, rebuild=False):
+    """Build or incrementally update the index; returns the new manifest."""
+    paths = _paths(index_dir)
+    settings = {"model": EMBED_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    manifest = None if rebuild else load_manifest(index_dir)
+    if manifest is not None and any(manifest.get(k) != v for k, v in settings.items()):
+        print("♻️ Model or chunking settings changed, rebuilding from scratch")
+        manifest = None
+
+    # --- Previous chunks (order = document ids) --------------------------
+    old_docs, old_emb = [], None
+    if manifest is not None:
+        with open(paths["documents.pkl"], "rb") as f:
+            old_docs = pickle.load(f)
+        old_emb = np.load(paths["embeddings.npy"])
+
+    # --- Current corpus -------------------------------------------------
+    sources, current = {}, []            # current: (hash, source, chunk_index, text)
+    for rel in corpus_files(corpus_dir):
+        text = read_document(os.path.join(corpus_dir, rel))
+        chunks = chunk_text(text)
+        sources[rel] = {"sha256": text_hash(text), "chunks": len(chunks)}
+        current += [(text_hash(c), rel, n, c) for n, c in enumerate(chunks)]
+
+    current_keys = {(h, src, n) for h, src, n, _ in current}
+    kept = [i for i, doc in enumerate(old_docs)
+            if (doc.metadata["chunk_hash"], doc.metadata["source"], doc.metadata["chunk"]) in current_keys]
+    kept_keys = {(old_docs[i].metadata["chunk_hash"], old_docs[i].metadata["source"], old_docs[i].metadata["chunk"])
+                 for i in kept}
+    added = [c for c in current if (c[0], c[1], c[2]) not in kept_keys]
+    removed = len(old_docs) - len(kept)
+    if manifest is not None and not added and not removed:
+        print(f"✅ Index v{manifest['index_version']} is up to date ({len(old_docs)} chunk(s))")
+        return manifest
+    if not current:
+        raise FileNotFoundError(f"❌ No indexable documents under {corpus_dir}")
+
+    # --- Embeddings: reuse by content hash, encode only unseen chunks -------
+    known = {old_docs[i].metadata["chunk_hash"]: old_emb[i] for i in kept} if old_emb is not None else {}
+    to_embed = list(dict.fromkeys(h for h, _, _, _ in added if h not in known))
+    text_of = {h: text for h, _, _, text in added}
+    print(f"📚 {len(current)} chunk(s) from {len(sources)} file(s): "
+          f"{len(added)} new, {removed} removed, {len(to_embed)} to embed")
+    if to_embed:
+        if encoder is None:
+            from sentence_transformers import SentenceTransformer
+            encoder = SentenceTransformer(EMBED_MODEL)
+        known.update(zip(to_embed, embed([text_of[h] for h in to_embed], encoder)))
+
+    docs = [old_docs[i] for i in kept] + [
+        Document(text, {"source": src, "chunk": n, "chunk_hash": h}) for h, src, n, text in added]
+    new_emb = np.stack([known[h] for h, _, _, _ in added]).astype(np.float32) if added else None
+    emb = old_emb[kept] if old_emb is not None else np.zeros((0, new_emb.shape[1]), dtype=np.float32)
+    if new_emb is not None:
+        emb = np.concatenate([emb, new_emb])
+
+    # --- Dense index: append in place, or recompact after removals ----------
+    staging = os.path.join(index_dir, ".staging")
+    shutil.rmtree(staging, ignore_errors=True)          # leftover of an interrupted build
+    os.makedirs(staging)
+    staged = _paths(staging)
+    if manifest is not None and not removed and os.path.exists(paths["dense_index.faiss"]):
+        index = faiss.read_index(paths["dense_index.faiss"])
+        index.add(new_emb)
+    else:
+        index = faiss.IndexFlatL2(emb.shape[1])
+        index.add(emb)
+    _write(staged["dense_index.faiss"], lambda f: f.write(faiss.serialize_index(index).tobytes()))
+    _write(staged["embeddings.npy"], lambda f: np.save(f, emb))
+
+    # --- Sparse side (refitted: idf depends on the whole chunk set) ---------
+    texts = [doc.page_content for doc in docs]
+    vectorizer = TfidfVectorizer()
+    matrix = normalize(vectorizer.fit_transform(texts)).tocsr()
+    _write(staged["documents.pkl"], lambda f: pickle.dump(docs, f))
+    _write(staged["tfidf_vectorizer.pkl"], lambda f: pickle.dump(vectorizer, f))
+    _write(staged["tfidf_matrix.npz"], lambda f: sparse.save_npz(f, matrix))
+    stamps = {"documents": file_stamp(staged["documents.pkl"]),          # os.replace keeps size / mtime
+              "vectorizer": file_stamp(staged["tfidf_vectorizer.pkl"])}
+    with open(staged["tfidf_matrix.json"], "w") as f:
+        json.dump({"stamps": stamps, "shape": list(matrix.shape)}, f, indent=2)
+
+    # --- Manifest ------------------------------------------------------------
+    previous = manifest or {"index_version": 0, "history": []}
+    manifest = dict(settings, version=MANIFEST_VERSION, index_version=previous["index_version"] + 1,
+                    built_at=time.time(), num_chunks=len(docs), embedding_dim=int(emb.shape[1]),
+                    sources=sources, chunks=[doc.metadata["chunk_hash"] for doc in docs],
+                    history=previous["history"] + [{"index_version": previous["index_version"] + 1,
+                                                    "added": len(added), "removed": removed,
+                                                    "embedded": len(to_embed), "at": time.time()}])
+    _write(staged["manifest.json"], lambda f: json.dump(manifest, f, indent=2), mode="w")
+    _commit(staging, index_dir)
+    print(f"✅ Index v{manifest['index_version']} written to {index_dir} ({len(docs)} chunk(s))")
+    return manifest
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command not in ("build", "rebuild", "status"):
+        sys.exit("usage: python rag_builder.py build|rebuild|status")
+    if command == "status":
+        manifest = load_manifest()
+        if manifest is None:
+            print(f"📭 No index under {INDEX_DIR}")
+        else:
+            built = time.strftime("%Y-%m-%d %H:%M", time.localtime(manifest["built_at"]))
+            print(f"📦 {INDEX_DIR}: v{manifest['index_version']}, {manifest['num_chunks']} chunk(s) from "
+                  f"{len(manifest['sources'])} file(s), {manifest['model']}, built {built}")
+    else:
+        build(rebuild=command == "rebuild")
@@ -0,0 +1,76 @@
+## rag_fusion.py
+
+import hashlib
+import numpy as np
+
+"""
+Hybrid retrieval fusion
+-----------------------
+Merges the dense (FAISS) and sparse (TF-IDF) candidate lists of one query into
+a single fixed-size ranking with scores, deduplicated on document ids:
+
+* rrf       – reciprocal rank fusion, Σ 1 / (RRF_K + rank). Scale-free, so
+              L2 distances and cosines need no calibration.
+* weighted  – per-list min-max normalised scores, summed with `weights`
+              (a document missing from a list contributes 0 for it).
+
+Chunks with identical text (the same passage indexed twice) collapse onto one
+canonical id and keep their best rank / score, so the reranker never sees the
+same passage twice.
+"""
+
+RRF_K = 60
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def canonical_ids(documents):
+    """Document id → id of the first document with the same page_content."""
+    first = {}
+    return np.array([first.setdefault(hashlib.sha1(doc.page_content.encode("utf-8")).digest(), i)
+                     for i, doc in enumerate(documents)], dtype=np.int64)
+
+
+def topk_rows(scores, k):
+    """Per-row top-k column ids of a dense score block, best first, ties by id (argpartition)."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _best_per_doc(ids, scores, canonical):
+    """{canonical id: (rank, score)} keeping the first (best) occurrence; FAISS -1 padding dropped."""
+    best = {}
+    for rank, (doc, score) in enumerate(zip(ids, scores), 1):
+        if doc < 0:
+            continue
+        doc = int(canonical[doc]) if canonical is not None else int(doc)
+        if doc not in best:
+            best[doc] = (rank, float(score))
+    return best
+
+
+def fuse(results, method="rrf", top_n=5, canonical=None, weights=None, rrf_k=RRF_K):
+    """
+    `results`: one (ids, scores) pair per retriever, best first, higher score = better.
+    Returns up to `top_n` (doc id, fused score) pairs, best first, ties by id.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}' (expected one of {FUSION_METHODS})")
+    weights = weights or [1.0] * len(results)
+    fused = {}
+    for (ids, scores), weight in zip(results, weights):
+        best = _best_per_doc(ids, scores, canonical)
+        if not best:
+            continue
+        if method == "rrf":
+            for doc, (rank, _) in best.items():
+                fused[doc] = fused.get(doc, 0.0) + weight / (rrf_k + rank)
+        else:
+            values = np.array([score for _, score in best.values()])
+            low, span = values.min(), values.max() - values.min()
+            for doc, (_, score) in best.items():
+                norm = (score - low) / span if span > 0 else 1.0
+                fused[doc] = fused.get(doc, 0.0) + weight * norm
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:top_n]
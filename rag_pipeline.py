@@ -0,0 +1,136 @@
+## rag_pipeline.py
+
+import os
+import time
+import _2_query_generator as query_gen
+import _3_hybrid_rag_retrieval as retrieval
+import _4_rerank_with_llm as rerank
+import _6_generate_organized_answer as organize
+from rag_records import QueryRecord, RetrievalRecord, RerankRecord, AnswerRecord, query_records, read_jsonl, write_jsonl
+
+"""
+In-process RAG runner (_2 → _3 → _4 → _6)
+-----------------------------------------
+Runs query generation, hybrid retrieval, reranking and answer organization in
+one process, handing typed records (rag_records) from stage to stage instead of
+writing and re-parsing the text files. _5_split_reranked_queries.py is not
+needed: each RerankRecord already is one query.
+
+    queries    [QueryRecord]      ← _2 generate_query_texts
+    retrieved  [RetrievalRecord]  ← _3 HybridRetriever.retrieve
+    reranked   [RerankRecord]     ← _4 rerank_records
+    answers    [AnswerRecord]     ← _6 answer_all
+
+Each stage is checkpointed as JSONL under RAG_RECORDS_DIR/env_new<INPUT_ENV_ID>/
+(RAG_CHECKPOINTS=0 to skip). RAG_RESUME=1 loads every stage whose checkpoint
+exists instead of recomputing it, up to the first missing one; everything after
+a recomputed stage is recomputed too. The organized answers are written to the
+same organized_answer_NNN.txt files as _6 (in RAG_ANSWER_DIR if set);
+RAG_TEXT_OUTPUTS=1 also writes the retrieved_chunks_* / reranked_results_* text
+files for inspection.
+
+The retriever (index + SentenceTransformer) and reranker are process-wide, so
+a warm orca_orchestrator worker running this for several environments loads
+them once.
+
+The per-script path (_2, _3, _4, _5, _6 run one by one) still works unchanged.
+"""
+
+# === Config ===
+INPUT_ENV_ID = os.environ.get("INPUT_ENV_ID", "0")
+RECORDS_DIR = os.path.join(os.environ.get("RAG_RECORDS_DIR", "./interim_results/_rag_records"), f"env_new{INPUT_ENV_ID}")
+CHECKPOINTS = os.environ.get("RAG_CHECKPOINTS", "1") == "1"
+RESUME = os.environ.get("RAG_RESUME", "0") == "1"
+TEXT_OUTPUTS = os.environ.get("RAG_TEXT_OUTPUTS", "0") == "1"
+ANSWER_DIR = os.environ.get("RAG_ANSWER_DIR") or organize.output_dir
+INPUT_TXT_FILE = f"./env_encoder/decoded_differences/decoded_differences_ORAN_log_new{INPUT_ENV_ID}.txt"
+
+STAGES = [("queries", QueryRecord), ("retrieved", RetrievalRecord), ("reranked", RerankRecord), ("answers", AnswerRecord)]
+
+
+def checkpoint_path(stage):
+    return os.path.join(RECORDS_DIR, f"{stage}.jsonl")
+
+
+# === Stages ===
+def generate_queries():
+    envs = query_gen.load_environment_differences(INPUT_TXT_FILE, query_gen.TOP_K)
+    prompts = [query_gen.generate_llm_prompt_for_query_generation(query_gen.TARGET_KPMS, env) for env in envs]
+    texts = query_gen.generate_query_texts(prompts)
+    return [record for variant, text in enumerate(texts, start=1) for record in query_records(variant, text)]
+
+
+def retrieve(queries):
+    return retrieval.shared_retriever().retrieve(queries)
+
+
+def rerank_stage(retrieved):
+    return rerank.rerank_records(retrieved)
+
+
+def answer(reranked):
+    records = [r for r in reranked if r.error is None]
+    for r in reranked:
+        if r.error is not None:
+            print(f"❌ Skipping query '{r.query}' (rerank failed: {r.error})")
+    answers = organize.answer_all([rerank.format_reranked(r) for r in records])
+    return [AnswerRecord(r.query_id, r.variant, r.query, error=str(a)) if isinstance(a, Exception)
+            else AnswerRecord(r.query_id, r.variant, r.query, answer=a) for r, a in zip(records, answers)]
+
+
+# === Outputs ===
+def by_variant(records):
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record.variant, []).append(record)
+    return grouped
+
+
+def write_text_outputs(retrieved, reranked):
+    os.makedirs(retrieval.output_dir, exist_ok=True)
+    for variant, records in by_variant(retrieved).items():
+        with open(retrieval.output_dir / f"retrieved_chunks_{variant}.txt", "w") as f:
+            f.write(retrieval.format_retrieved(records))
+    os.makedirs(rerank.output_dir, exist_ok=True)
+    for variant, records in by_variant(reranked).items():
+        with open(os.path.join(rerank.output_dir, f"reranked_results_{variant}.txt"), "w", encoding="utf-8") as f:
+            f.writelines(rerank.format_reranked(r) for r in records)
+    rerank.write_latency_report(reranked)
+
+
+def write_answers(answers):
+    # Same numbering as _5 → _6: variants in file-name order, queries in order, failed reranks skipped
+    ordered = [r for variant in sorted(by_variant(answers)) for r in by_variant(answers)[variant]]
+    for i, record in enumerate(ordered):
+        if record.error is not None:
+            print(f"❌ Error for query '{record.query}': {record.error}")
+            continue
+        organize.write_answer(i, f"=== Query: {record.query} ===", record.answer, ANSWER_DIR)
+
+
+# === Main ===
+def main():
+    print(f"🌍 RAG pipeline for new{INPUT_ENV_ID} (checkpoints: {RECORDS_DIR if CHECKPOINTS else 'off'})")
+    compute = {"queries": lambda _: generate_queries(), "retrieved": retrieve, "reranked": rerank_stage, "answers": answer}
+    results, records, resuming = {}, None, RESUME
+    for stage, cls in STAGES:
+        loaded = read_jsonl(checkpoint_path(stage), cls) if resuming else None
+        if loaded is not None:
+            print(f"⏩ [{stage}] {len(loaded)} record(s) from {checkpoint_path(stage)}")
+            records = loaded
+        else:
+            resuming = False
+            start = time.perf_counter()
+            records = compute[stage](records)
+            print(f"✅ [{stage}] {len(records)} record(s) in {time.perf_counter() - start:.2f}s")
+            if CHECKPOINTS:
+                write_jsonl(checkpoint_path(stage), records)
+        results[stage] = records
+
+    if TEXT_OUTPUTS:
+        write_text_outputs(results["retrieved"], results["reranked"])
+    write_answers(results["answers"])
+
+
+if __name__ == "__main__":
+    main()
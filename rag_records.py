@@ -0,0 +1,125 @@
+## rag_records.py
+
+import os
+import json
+from dataclasses import dataclass, field, asdict
+
+"""
+Typed records for the RAG stages (_2 → _6)
+------------------------------------------
+    QueryRecord      one generated retrieval query
+    RetrievalRecord  a query with its fused, scored chunks            (_3)
+    RerankRecord     the same chunks in reranked order + latency      (_4)
+    AnswerRecord     the organized answer for one query               (_6)
+    Document         an indexed chunk in rag_index/documents.pkl      (rag_builder)
+
+Records are plain dataclasses, streamed between stages in memory by
+rag_pipeline.py; stage-level checkpoints are JSONL files with one record per
+line (`write_jsonl` / `read_jsonl`). `query_id` ("<variant>-<nnn>") ties the
+records of one query together across stages.
+"""
+
+RECORD_VERSION = 1
+
+
+@dataclass
+class QueryRecord:
+    query_id: str
+    variant: str          # top-k reference environment the query was generated for ("1", "2", ...)
+    text: str
+
+
+@dataclass
+class ChunkRecord:
+    content: str
+    source: str
+    score: float = None
+    doc_id: int = None
+
+
+@dataclass
+class RetrievalRecord:
+    query_id: str
+    variant: str
+    query: str
+    method: str
+    chunks: list = field(default_factory=list)      # [ChunkRecord], best first
+
+
+@dataclass
+class RerankRecord:
+    query_id: str
+    variant: str
+    query: str
+    backend: str
+    chunks: list = field(default_factory=list)      # [ChunkRecord], reranked, score = reranker score
+    latency_ms: float = None
+    error: str = None
+
+
+@dataclass
+class AnswerRecord:
+    query_id: str
+    variant: str
+    query: str
+    answer: str = None
+    error: str = None
+
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    @dataclass
+    class Document:
+        """Stand-in with the LangChain Document attributes the pipeline uses; lives here (not in
+        rag_builder) so documents.pkl written by `python rag_builder.py` unpickles anywhere."""
+        page_content: str
+        metadata: dict = field(default_factory=dict)
+
+
+_NESTED = {RetrievalRecord: "chunks", RerankRecord: "chunks"}
+
+
+def to_dict(record):
+    return asdict(record)
+
+
+def from_dict(cls, data):
+    data = dict(data)
+    if cls in _NESTED:
+        data[_NESTED[cls]] = [ChunkRecord(**c) for c in data.get(_NESTED[cls], [])]
+    return cls(**data)
+
+
+def write_jsonl(path, records):
+    """Checkpoint a stage: a header line, then one record per line (written atomically)."""
+    records = list(records)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        kind = type(records[0]).__name__ if records else None
+        f.write(json.dumps({"version": RECORD_VERSION, "type": kind, "count": len(records)}) + "\n")
+        for record in records:
+            f.write(json.dumps(to_dict(record), ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def read_jsonl(path, cls):
+    """Records of a checkpoint written by write_jsonl, or None when missing / incompatible."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("version") != RECORD_VERSION or header.get("type") not in (cls.__name__, None):
+            return None
+        records = [from_dict(cls, json.loads(line)) for line in f if line.strip()]
+    return records if len(records) == header.get("count") else None
+
+
+def parse_query_text(text):
+    """Generated query list (one '- query' per line) → query strings, as _3 reads them."""
+    return [q.strip("- ").strip() for q in text.splitlines(keepends=True) if q.strip()]
+
+
+def query_records(variant, text):
+    return [QueryRecord(f"{variant}-{n:03d}", str(variant), query) for n, query in enumerate(parse_query_text(text))]
@@ -0,0 +1,150 @@
+## rerankers.py
+
+import os
+import re
+import json
+import time
+
+"""
+Pluggable chunk rerankers
+-------------------------
+Every backend takes [(query, [chunk text, ...]), ...] and returns, per query,
+a ranking [(chunk index, score), ...] best first plus its latency in seconds,
+so _4_rerank_with_llm.py writes the chunks itself instead of asking a model
+to echo them.
+
+* cross-encoder – local CPU cross-encoder (MiniLM-class, sentence-transformers
+                  CrossEncoder). The (query, chunk) pairs of a query are
+                  scored in batches of RERANK_BATCH_SIZE; RERANK_ONNX=1 runs the
+                  ONNX export instead of torch, RERANK_ONNX_FILE picks e.g. a
+                  quantized file (onnx/model_qint8_avx512.onnx).
+* llm           – the LLM is asked for chunk numbers only (a JSON list), never
+                  for the chunk text; all queries go out as one concurrent
+                  batch and each request is timed on its own (no per-query
+                  latency with ORCA_LLM_BACKEND=batch).
+* none          – keep the retrieval (fusion) order.
+
+Select with RERANK_BACKEND (default: llm). get_reranker keeps one instance per
+backend, so a long-lived process loads the cross-encoder once.
+"""
+
+RERANK_BACKEND = os.environ.get("RERANK_BACKEND", "llm")
+CROSS_ENCODER_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "32"))
+RERANK_ONNX = os.environ.get("RERANK_ONNX", "0") == "1"
+RERANK_ONNX_FILE = os.environ.get("RERANK_ONNX_FILE")
+LLM_CHUNK_CHARS = 800
+
+
+class Reranker:
+    name = "base"
+
+    def rerank(self, jobs):
+        """
+        [(query, [chunk, ...])] → ([[(index, score), ...] best first], [seconds per query]).
+        A query whose reranking failed gets its exception in place of the ranking;
+        a latency is None when the backend cannot time queries individually.
+        """
+        raise NotImplementedError
+
+
+class IdentityReranker(Reranker):
+    name = "none"
+
+    def rerank(self, jobs):
+        return [[(i, 1.0 / (i + 1)) for i in range(len(chunks))] for _, chunks in jobs], [0.0] * len(jobs)
+
+
+class CrossEncoderReranker(Reranker):
+    name = "cross-encoder"
+
+    def __init__(self, model_name=None, batch_size=None, onnx=None, onnx_file=None):
+        from sentence_transformers import CrossEncoder
+        onnx = RERANK_ONNX if onnx is None else onnx
+        kwargs = {}
+        if onnx:
+            kwargs["backend"] = "onnx"
+            if onnx_file or RERANK_ONNX_FILE:
+                kwargs["model_kwargs"] = {"file_name": onnx_file or RERANK_ONNX_FILE}
+        self.model = CrossEncoder(model_name or CROSS_ENCODER_MODEL, device="cpu", **kwargs)
+        self.batch_size = batch_size or RERANK_BATCH_SIZE
+
+    def rerank(self, jobs):
+        rankings, latencies = [], []
+        for query, chunks in jobs:
+            start = time.perf_counter()
+            scores = self.model.predict([(query, chunk) for chunk in chunks], batch_size=self.batch_size) if chunks else []
+            order = sorted(range(len(chunks)), key=lambda i: (-float(scores[i]), i))
+            rankings.append([(i, float(scores[i])) for i in order])
+            latencies.append(time.perf_counter() - start)
+        return rankings, latencies
+
+
+def build_index_prompt(query, chunks):
+    lines = [
+        "You are a 5G systems expert. Given the following query and retrieved document chunks from 3GPP/ORAN specs, "
+        "re-rank the chunks from most to least relevant based on how useful they are to answer the query.\n\n",
+        f"Query: \"{query}\"\n\nChunks:\n",
+    ]
+    for i, chunk in enumerate(chunks, 1):
+        lines.append(f"--- Chunk #{i} ---\n{chunk[:LLM_CHUNK_CHARS]}\n\n")
+    lines.append(f"Return only a JSON list of all {len(chunks)} chunk numbers from most to least relevant, "
+                 f"e.g. [2, 1, 3]. No text, no chunk content.\n")
+    return "".join(lines)
+
+
+def parse_index_ranking(text, n):
+    """
+    0-based chunk order from an LLM reply; unknown / repeated numbers are dropped, missing ones appended.
+    A reply that is not a JSON list (or an object holding one) is read as the numbers it contains.
+    """
+    text = text or ""
+    try:
+        values = json.loads(text)
+    except ValueError:
+        values = None
+    if isinstance(values, dict):
+        values = next((v for v in values.values() if isinstance(v, list)), [])
+    if not isinstance(values, list):
+        values = re.findall(r"\d+", text)
+    order = []
+    for value in values:
+        try:
+            i = int(value) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < n and i not in order:
+            order.append(i)
+    return order + [i for i in range(n) if i not in order]
+
+
+class LLMReranker(Reranker):
+    name = "llm"
+    system_msg = ""
+
+    def rerank(self, jobs):
+        from queryGPT import Query_GPT4_batch
+        latencies = []
+        responses = Query_GPT4_batch([(self.system_msg, build_index_prompt(query, chunks)) for query, chunks in jobs],
+                                     temp=0, return_exceptions=True, latencies=latencies)
+        rankings = []
+        for (_, chunks), response in zip(jobs, responses):
+            if isinstance(response, Exception):
+                rankings.append(response)
+                continue
+            order = parse_index_ranking(response, len(chunks))
+            rankings.append([(i, (len(chunks) - r) / len(chunks)) for r, i in enumerate(order)])
+        return rankings, latencies
+
+
+RERANKERS = {"cross-encoder": CrossEncoderReranker, "llm": LLMReranker, "none": IdentityReranker}
+_instances = {}
+
+
+def get_reranker(name=None):
+    name = name or RERANK_BACKEND
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown RERANK_BACKEND '{name}' (expected one of {tuple(RERANKERS)})")
+    if name not in _instances:
+        _instances[name] = RERANKERS[name]()
+    return _instances[name]
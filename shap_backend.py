@@ -0,0 +1,55 @@
+## shap_backend.py
+
+import os
+import numpy as np
+
+"""
+Selectable SHAP backends for the XGBoost KPM models
+---------------------------------------------------
+* native         – XGBoost's built-in exact TreeSHAP (Booster.predict(pred_contribs=True)).
+                   Path-dependent, no background sample, fastest.
+* interventional – shap.TreeExplainer over a background sample with interventional
+                   perturbation. Same algorithm the generic shap.Explainer(model, background)
+                   picks for tree models.
+* explainer      – the original generic shap.Explainer(model, background) call, kept as
+                   the reference path for equivalence checks.
+
+Select with SHAP_BACKEND=<name> (default: native). `shap` and `xgboost` are
+imported on first use, so importing this module costs nothing.
+"""
+
+SHAP_BACKENDS = ("native", "interventional", "explainer")
+SHAP_BACKEND = os.environ.get("SHAP_BACKEND", "native")
+BACKGROUND_SEED = 42
+
+
+def sample_background(X_train, background_size):
+    import shap
+    return shap.utils.sample(X_train, background_size, random_state=BACKGROUND_SEED)
+
+
+def native_tree_shap(model, X):
+    """Exact path-dependent TreeSHAP straight from the booster (bias column dropped)."""
+    import xgboost as xgb
+    booster = model.get_booster()
+    contribs = booster.predict(xgb.DMatrix(np.asarray(X)), pred_contribs=True, validate_features=False)
+    return contribs[:, :-1]
+
+
+def compute_shap_values(model, X_train, X_test, backend=None, background_size=100):
+    """Return the (n_test, n_features) SHAP matrix for a fitted XGBRegressor."""
+    backend = backend or SHAP_BACKEND
+    if backend not in SHAP_BACKENDS:
+        raise ValueError(f"Unknown SHAP backend '{backend}' (expected one of {SHAP_BACKENDS})")
+
+    if backend == "native":
+        return native_tree_shap(model, X_test)
+
+    import shap
+    background = sample_background(X_train, background_size)
+    if backend == "interventional":
+        explainer = shap.TreeExplainer(model, background, feature_perturbation="interventional")
+        return np.asarray(explainer.shap_values(X_test))
+
+    explainer = shap.Explainer(model, background)
+    return explainer(X_test).values
@@ -0,0 +1,490 @@
+## shap_pipeline.py
+
+import os
+import sys
+import glob
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from shap_backend import SHAP_BACKEND, compute_shap_values
+from shap_store import ShapStore, aggregate_scheduling, build_entry, store_path, write_env
+from oran_loader import read_log
+
+"""
+Configurable recursive-SHAP pipeline
+------------------------------------
+* One declarative config per SHAP variant (target → input features, output dir).
+* Several configs run in one pass: every log is read once, preprocessors are
+  fitted once per (rows, features) and a model shared by several configs is
+  trained and explained once, then written to each config's output dir.
+* (file, target) jobs fan out over a process pool (SHAP_WORKERS) and are
+  skipped when their content-hash manifest entry is still valid (SHAP_CACHE).
+* Artifacts go to one memory-mapped `<env>.shapstore` per environment (see
+  shap_store); SHAP_LEGACY_NPY=1 additionally writes the old per-target .npy files.
+* xgboost / sklearn / matplotlib / seaborn are imported by the functions that
+  use them, so a run whose jobs are all cached never loads them.
+
+Run `python shap_pipeline.py` with SHAP_CONFIGS=recursive,mod to pick configs.
+"""
+
+# === Feature classification ===
+CONTROL_FEATURES = ['ant_tilt_deg', 'CIO', 'TxPower', 'PRB_num', 'Scheduling']
+KPM_TARGETS = ['Throughput_Mbps', 'Avg_Delay_ms', 'user_throughput']
+
+# === SHAP variant configs ===
+# base_features feed the correlation heatmap and (with the KPMs) the dropna row filter.
+RECURSIVE_CONFIG = {
+    "name": "recursive",
+    "output_dir": "shap_outputs",
+    "base_features": CONTROL_FEATURES + ['DL_Buffer', 'Avg_SNR_dB'],
+    "kpm_targets": KPM_TARGETS,
+    "kpm_features": CONTROL_FEATURES + ['DL_Buffer'],
+    "recursive_targets": ['Avg_SNR_dB'],
+    "recursive_features": CONTROL_FEATURES,
+}
+
+MOD_CONFIG = {
+    "name": "mod",
+    "output_dir": "shap_outputs_mod",
+    "base_features": CONTROL_FEATURES,
+    "kpm_targets": KPM_TARGETS,
+    "kpm_features": CONTROL_FEATURES,
+    "recursive_targets": [],
+    "recursive_features": CONTROL_FEATURES,
+}
+
+SHAP_CONFIGS = {c["name"]: c for c in (RECURSIVE_CONFIG, MOD_CONFIG)}
+DATASET_GLOB = "dataset/ORAN_log*.csv"
+
+# === Model / explainer hyperparameters (part of the cache key) ===
+XGB_PARAMS = {"n_estimators": 100, "max_depth": 6, "random_state": 42}
+SPLIT_PARAMS = {"test_size": 0.2, "random_state": 42}
+BACKGROUND_SIZE = 100
+
+# === Incremental cache ===
+# SHAP_CACHE=0 forces a full rebuild; bump CACHE_VERSION when the artifact
+# layout or the SHAP computation itself changes.
+SHAP_CACHE = os.environ.get("SHAP_CACHE", "1") != "0"
+CACHE_VERSION = 3
+MANIFEST_NAME = "shap_manifest.json"
+SHAP_LEGACY_NPY = os.environ.get("SHAP_LEGACY_NPY", "0") == "1"
+
+# === Parallel execution ===
+# SHAP_WORKERS=1 keeps the original serial behaviour; 0 means "one per core".
+SHAP_WORKERS = int(os.environ.get("SHAP_WORKERS", "1"))
+CPU_COUNT = os.cpu_count() or 1
+
+
+# === Config helpers ===
+def config_targets(config):
+    return config["kpm_targets"] + config["recursive_targets"]
+
+
+def target_features(config, target):
+    # Determine SHAP input features
+    if target in config["recursive_targets"]:
+        return config["recursive_features"]
+    return config["kpm_features"]
+
+
+def required_columns(config):
+    return config["base_features"] + config["kpm_targets"]
+
+
+def artifact_paths(config, base, target):
+    out = config["output_dir"]
+    paths = [store_path(out, base)]
+    if SHAP_LEGACY_NPY:
+        paths += [f"{out}/{base}_{target}_{kind}.npy" for kind in ("features", "shap", "mean_abs", "ytest")]
+        xtest = xtest_path(config, base, target)
+        if xtest:
+            paths.append(xtest)
+    return paths
+
+
+def xtest_path(config, base, target):
+    out = config["output_dir"]
+    if target in config["recursive_targets"]:
+        return f"{out}/{base}_{target}_Xtest.npy"
+    if target == config["kpm_targets"][0]:
+        # All KPM targets share the same encoded X_test; write it from a single
+        # job so parallel workers never race on the same file.
+        return f"{out}/{base}_Xtest.npy"
+    return None
+
+
+# === Worker / thread sizing ===
+def resolve_workers(n_jobs, workers=SHAP_WORKERS):
+    """Clamp the requested worker count to [1, n_jobs]."""
+    if workers <= 0:
+        workers = CPU_COUNT
+    return max(1, min(workers, n_jobs))
+
+
+def xgb_threads_per_worker(workers):
+    """Split the cores between workers so XGBoost does not oversubscribe."""
+    return max(1, CPU_COUNT // workers)
+
+
+# === Manifest cache ===
+def file_digest(fp, known=None):
+    """sha256 of the CSV contents; reuse the manifest digest while size/mtime are unchanged."""
+    st = os.stat(fp)
+    if known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns:
+        return known
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return {"sha256": h.hexdigest(), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def manifest_path(config):
+    return os.path.join(config["output_dir"], MANIFEST_NAME)
+
+
+def load_manifest(config):
+    path = manifest_path(config)
+    if not SHAP_CACHE or not os.path.exists(path):
+        return {"version": CACHE_VERSION, "files": {}, "jobs": {}}
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != CACHE_VERSION:
+        print(f"♻️ SHAP manifest version changed — rebuilding {config['output_dir']}")
+        return {"version": CACHE_VERSION, "files": {}, "jobs": {}}
+    return manifest
+
+
+def save_manifest(config, manifest):
+    path = manifest_path(config)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def job_key(digest, target, features, required):
+    """Everything that determines a job's artifacts, hashed into one cache key."""
+    payload = {
+        "version": CACHE_VERSION,
+        "csv_sha256": digest,
+        "target": target,
+        "features": list(features),
+        "rows": sorted(required),
+        "xgb": XGB_PARAMS,
+        "split": SPLIT_PARAMS,
+        "background": BACKGROUND_SIZE,
+        "shap_backend": SHAP_BACKEND,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def is_cached(manifest, job_id, key, artifacts):
+    entry = manifest["jobs"].get(job_id)
+    return bool(SHAP_CACHE and entry and entry["key"] == key and all(os.path.exists(p) for p in artifacts))
+
+
+# === Data + model ===
+def prepare_frame(raw, required, fp=""):
+    """Keep only the required columns and complete rows, or return None."""
+    if not all(col in raw.columns for col in required):
+        print(f"❌ Missing required columns — skipping {fp}")
+        return None
+
+    df = raw[list(required)].dropna()
+    if len(df) < 2:
+        print(f"❌ Skipping {fp} (not enough data)")
+        return None
+    return df
+
+
+def load_log(fp, config=RECURSIVE_CONFIG):
+    """Read one ORAN log and keep only the columns used by `config`, or return None."""
+    return prepare_frame(read_log(fp, required_columns(config)), required_columns(config), fp)
+
+
+def fit_preprocessor(df, features):
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("num", StandardScaler(), [f for f in features if f != "Scheduling"]),
+            ("cat", OneHotEncoder(drop="first", sparse_output=False, handle_unknown="ignore"),
+            ["Scheduling"]),
+        ],
+        verbose_feature_names_out=False          # <── this kills "num__"/"cat__"
+    )
+    X_encoded = preprocessor.fit_transform(df[list(features)])
+    return preprocessor, X_encoded
+
+
+def fit_model(df, target, features=None, n_threads=None, encoded=None):
+    """Fit the target's XGBoost model on the train split of the encoded features."""
+    from xgboost import XGBRegressor
+    from sklearn.model_selection import train_test_split
+    features = features or target_features(RECURSIVE_CONFIG, target)
+    preprocessor, X_encoded = encoded or fit_preprocessor(df, features)
+    y = df[target]
+
+    X_train, X_test, y_train, y_test = train_test_split(X_encoded, y, **SPLIT_PARAMS)
+
+    model = XGBRegressor(**XGB_PARAMS, n_jobs=n_threads)
+    model.fit(X_train, y_train)
+    return preprocessor, model, X_train, X_test, y_test
+
+
+def plot_corr_map(df, base_features, out_path, base):
+    # Filter out non-numeric features before computing correlation
+    numeric_feats = [f for f in base_features if pd.api.types.is_numeric_dtype(df[f])]
+
+    if numeric_feats:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        corr_matrix = df[numeric_feats].corr()
+
+        plt.figure(figsize=(10, 8))
+        sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=0.5)
+        plt.title(f"Correlation Map: {base}")
+        plt.tight_layout()
+        plt.savefig(out_path)
+        plt.close()
+
+        print(f"📊 Correlation heatmap saved for {base}.")
+    else:
+        print(f"⚠️ No numeric features available for correlation heatmap ({base}).")
+
+
+def save_legacy_artifacts(out, base, target, feature_names, shap_values, feat, vals, X_test, xtest, y_test):
+    # --- Save outputs (pre-store .npy layout) ---
+    np.save(f"{out}/{base}_{target}_features.npy", feature_names)
+    np.save(f"{out}/{base}_{target}_shap.npy", shap_values)
+    np.save(f"{out}/{base}_{target}_mean_abs.npy", np.array([feat, vals], dtype=object))
+    if xtest:
+        np.save(xtest, X_test)
+    np.save(f"{out}/{base}_{target}_ytest.npy", y_test.to_numpy())
+
+
+def explain(model, preprocessor, X_train, X_test):
+    shap_values = compute_shap_values(model, X_train, X_test, background_size=BACKGROUND_SIZE)
+    feature_names = preprocessor.get_feature_names_out()
+
+    # === Aggregate Scheduling importance (same merge as the store's agg_features) ===
+    mean_abs = np.mean(np.abs(shap_values), axis=0)
+    feat, vals = aggregate_scheduling(list(map(str, feature_names)), mean_abs)
+    return feature_names, shap_values, feat, vals.tolist()
+
+
+def run_file_jobs(fp, jobs, n_threads=None):
+    """
+    Run every job of one log with a shared DataFrame: rows are filtered once per
+    required-column set and the preprocessor is fitted once per feature list.
+    """
+    base = os.path.splitext(os.path.basename(fp))[0]
+    # typed, column-projected read of everything this task's jobs need
+    raw = read_log(fp, [c for job in jobs for c in job["required"]])
+    frames, encoders, results = {}, {}, []
+
+    for job in jobs:
+        required = tuple(job["required"])
+        if required not in frames:
+            frames[required] = prepare_frame(raw, required, fp)
+        df = frames[required]
+        if df is None:
+            results.append({"job": job, "ok": False})
+            continue
+
+        if job["kind"] == "corr_map":
+            for out in job["outputs"]:
+                plot_corr_map(df, job["features"], f"{out['output_dir']}/{base}_corr_map.png", base)
+            results.append({"job": job, "ok": True})
+            continue
+
+        features = tuple(job["features"])
+        if (required, features) not in encoders:
+            encoders[(required, features)] = fit_preprocessor(df, features)
+        preprocessor, model, X_train, X_test, y_test = fit_model(
+            df, job["target"], features, n_threads, encoded=encoders[(required, features)])
+        from sklearn.metrics import mean_squared_error
+        rmse = np.sqrt(mean_squared_error(y_test, model.predict(X_test)))
+        feature_names, shap_values, feat, vals = explain(model, preprocessor, X_train, X_test)
+
+        if SHAP_LEGACY_NPY:
+            for out in job["outputs"]:
+                save_legacy_artifacts(out["output_dir"], base, job["target"], feature_names, shap_values,
+                                      feat, vals, X_test, out["xtest"], y_test)
+
+        top = sorted(zip(feat, vals), key=lambda x: -x[1])[:8]
+        results.append({"job": job, "ok": True, "rmse": float(rmse),
+                        "top": [(f, float(v)) for f, v in top],
+                        "entry": build_entry(feature_names, shap_values, X_test, y_test)})
+    return results
+
+
+def report(fp, result):
+    job = result["job"]
+    if not result["ok"] or job["kind"] == "corr_map":
+        return
+    base = os.path.splitext(os.path.basename(fp))[0]
+    configs = ", ".join(out["config"] for out in job["outputs"])
+    print(f"\n🔎 SHAP for {base} → {job['target']}  [{configs}]")
+    print(f"✅ RMSE ({job['target']}): {result['rmse']:.4f}")
+    # Print top features for quick check
+    print("Top |SHAP| features:")
+    for f, v in result["top"]:
+        print(f"  • {f:18s}: {v:.4f}")
+
+
+# === Planning ===
+def plan_jobs(configs, file_paths, manifests):
+    """
+    Collect the stale (file, target) jobs of every config, merging identical
+    models (same log, rows, target and features) into one job with several outputs.
+    """
+    jobs_by_file = {fp: {} for fp in file_paths}
+    skipped = 0
+    for fp in file_paths:
+        base = os.path.splitext(os.path.basename(fp))[0]
+        digest = None
+        for config in configs:
+            manifest = manifests[config["name"]]
+            digest = file_digest(fp, manifest["files"].get(base) or digest)
+            manifest["files"][base] = digest
+            required = tuple(required_columns(config))
+
+            wanted = [("corr_map", "corr_map", config["base_features"],
+                       [f"{config['output_dir']}/{base}_corr_map.png"], None)]
+            for target in config_targets(config):
+                wanted.append(("shap", target, target_features(config, target),
+                               artifact_paths(config, base, target), xtest_path(config, base, target)))
+
+            store = ShapStore(config["output_dir"])
+            for kind, target, features, artifacts, xtest in wanted:
+                job_id = f"{base}/{target}"
+                key = job_key(digest["sha256"], target, features, required)
+                in_store = kind == "corr_map" or (store.exists(base) and store.open(base).has(target))
+                if in_store and is_cached(manifest, job_id, key, artifacts):
+                    skipped += 1
+                    continue
+                share_key = (kind, target, tuple(features), required)
+                job = jobs_by_file[fp].setdefault(share_key, {
+                    "kind": kind, "target": target, "features": list(features),
+                    "required": list(required), "outputs": []})
+                job["outputs"].append({"config": config["name"], "output_dir": config["output_dir"],
+                                       "xtest": xtest, "job_id": job_id, "key": key})
+    return {fp: list(jobs.values()) for fp, jobs in jobs_by_file.items() if jobs}, skipped
+
+
+def split_tasks(jobs_by_file, workers):
+    """One task per log, split further when there are fewer logs than workers."""
+    n_chunks = max(1, -(-workers // max(len(jobs_by_file), 1)))
+    tasks = []
+    for fp, jobs in jobs_by_file.items():
+        size = max(1, -(-len(jobs) // n_chunks))
+        tasks += [(fp, jobs[i:i + size]) for i in range(0, len(jobs), size)]
+    return tasks
+
+
+def run(configs, file_glob=DATASET_GLOB):
+    """Run the SHAP pipeline for several configs in a single pass over the logs."""
+    for config in configs:
+        os.makedirs(config["output_dir"], exist_ok=True)
+    file_paths = sorted(glob.glob(file_glob))
+    if not file_paths:
+        print(f"❌ No ORAN logs found matching {file_glob}")
+        return
+
+    manifests = {c["name"]: load_manifest(c) for c in configs}
+    jobs_by_file, skipped = plan_jobs(configs, file_paths, manifests)
+    n_jobs = sum(len(jobs) for jobs in jobs_by_file.values())
+    n_outputs = sum(len(job["outputs"]) for jobs in jobs_by_file.values() for job in jobs)
+    print(f"🗂️ Cache: {skipped} up-to-date, {n_jobs} job(s) to run for {n_outputs} output(s) "
+          f"across configs {[c['name'] for c in configs]}")
+
+    by_name = {c["name"]: c for c in configs}
+    # (config, env) -> outstanding SHAP jobs; the env's store is rewritten once they are all in
+    pending, fresh = {}, {}
+    for fp, jobs in jobs_by_file.items():
+        base = os.path.splitext(os.path.basename(fp))[0]
+        for job in jobs:
+            if job["kind"] == "shap":
+                for out in job["outputs"]:
+                    pending[(out["config"], base)] = pending.get((out["config"], base), 0) + 1
+
+    def flush_store(name, base):
+        config = by_name[name]
+        store = ShapStore(config["output_dir"])
+        entries = {}
+        if store.exists(base):
+            old = store.open(base)
+            entries = {t: old.entry(t) for t in old.targets}
+        entries.update(fresh.pop((name, base), {}))
+        if entries:
+            write_env(store.path(base), base, entries)
+            print(f"💾 SHAP store updated: {store.path(base)} ({len(entries)} target(s))")
+
+    def finish(fp, job, result=None):
+        base = os.path.splitext(os.path.basename(fp))[0]
+        for out in job["outputs"]:
+            if result is not None and result["ok"]:
+                manifests[out["config"]]["jobs"][out["job_id"]] = {"key": out["key"]}
+                if job["kind"] == "shap":
+                    fresh.setdefault((out["config"], base), {})[job["target"]] = result["entry"]
+            if job["kind"] == "shap":
+                pending[(out["config"], base)] -= 1
+                if not pending[(out["config"], base)]:
+                    flush_store(out["config"], base)
+
+    def save_all():
+        for config in configs:
+            save_manifest(config, manifests[config["name"]])
+
+    if not n_jobs:
+        save_all()
+        print("✅ All SHAP artifacts are up to date.")
+        return
+
+    workers = resolve_workers(n_jobs)
+    n_threads = xgb_threads_per_worker(workers)
+    print(f"⚙️ {n_jobs} jobs over {len(jobs_by_file)} logs — {workers} worker(s), "
+          f"{n_threads} XGBoost thread(s) each, backend={SHAP_BACKEND}")
+
+    failed = 0
+    if workers == 1:
+        for fp, jobs in jobs_by_file.items():
+            print(f"\n📁 Processing: {fp}")
+            for result in run_file_jobs(fp, jobs, n_threads):
+                report(fp, result)
+                finish(fp, result["job"], result)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_file_jobs, fp, jobs, n_threads): (fp, jobs)
+                       for fp, jobs in split_tasks(jobs_by_file, workers)}
+            for fut in as_completed(futures):
+                fp, jobs = futures[fut]
+                try:
+                    results = fut.result()
+                except Exception as e:
+                    print(f"❌ Jobs failed for {fp}: {e}")
+                    failed += 1
+                    for job in jobs:
+                        finish(fp, job)
+                    continue
+                for result in results:
+                    report(fp, result)
+                    finish(fp, result["job"], result)
+
+    save_all()
+    if failed:
+        sys.exit(f"❌ {failed} SHAP task(s) failed")
+
+
+if __name__ == "__main__":
+    names = os.environ.get("SHAP_CONFIGS", "recursive").split(",")
+    unknown = [n for n in names if n not in SHAP_CONFIGS]
+    if unknown:
+        sys.exit(f"❌ Unknown SHAP config(s) {unknown}; available: {list(SHAP_CONFIGS)}")
+    run([SHAP_CONFIGS[n] for n in names])
@@ -0,0 +1,260 @@
+## shap_store.py
+
+import os
+import sys
+import json
+import glob
+import struct
+import numpy as np
+
+"""
+Columnar SHAP artifact store
+----------------------------
+One `<env>.shapstore` file per environment replaces the scattered
+`<env>_<target>_{features,shap,mean_abs,Xtest,ytest}.npy` files.
+
+Layout (little-endian):
+    8 bytes   magic  b"ORCASHAP"
+    4 bytes   format version (uint32)
+    8 bytes   header length (uint64)
+    header    UTF-8 JSON: per-target feature names, scalar stats and the
+              (offset, shape, dtype) of every array
+    blocks    raw C-contiguous arrays, each aligned to 64 bytes
+
+Readers memory-map the file once and get zero-copy array views. Mean-|SHAP|
+is precomputed per target, both per encoded feature and with the one-hot
+Scheduling_* columns aggregated into "Scheduling" (raw and normalised to 1).
+No pickles are involved anywhere.
+"""
+
+MAGIC = b"ORCASHAP"
+FORMAT_VERSION = 1
+ALIGN = 64
+SUFFIX = ".shapstore"
+_PREAMBLE = struct.Struct("<8sIQ")
+
+
+def store_path(root, env):
+    return os.path.join(root, f"{env}{SUFFIX}")
+
+
+def aggregate_scheduling(features, values):
+    """Merge every one-hot Scheduling_* column into a single trailing "Scheduling" entry."""
+    feat, vals, sched = [], [], []
+    for name, v in zip(features, values):
+        if "Scheduling" in name:
+            sched.append(v)
+        else:
+            feat.append(name)
+            vals.append(v)
+    if sched:
+        feat.append("Scheduling")
+        vals.append(sum(sched))
+    return feat, np.asarray(vals, dtype=np.float64)
+
+
+def build_entry(feature_names, shap_values, X_test, y_test):
+    """Derive every stored vector for one target from its raw SHAP matrix."""
+    shap_values = np.ascontiguousarray(shap_values, dtype=np.float64)
+    mean_abs = np.mean(np.abs(shap_values), axis=0)
+    agg_features, agg_mean_abs = aggregate_scheduling(list(map(str, feature_names)), mean_abs)
+    total = float(agg_mean_abs.sum())
+    y_test = np.asarray(y_test, dtype=np.float64)
+    return {
+        "features": list(map(str, feature_names)),
+        "agg_features": agg_features,
+        "stats": {"mean_abs_total": total, "ytest_mean": float(y_test.mean()) if y_test.size else 0.0},
+        "arrays": {
+            "shap": shap_values,
+            "mean_abs": mean_abs,
+            "agg_mean_abs": agg_mean_abs,
+            "agg_norm": agg_mean_abs / total if total > 0 else agg_mean_abs,
+            "xtest": np.asarray(X_test, dtype=np.float64),
+            "ytest": y_test,
+        },
+    }
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def write_env(path, env, entries):
+    """Atomically write one environment's store from {target: build_entry(...)}."""
+    header = {"env": env, "targets": {}}
+    blobs, offset = [], 0
+    for target, entry in entries.items():
+        arrays = {}
+        for name, arr in entry["arrays"].items():
+            arr = np.ascontiguousarray(arr)
+            arrays[name] = {"offset": offset, "shape": list(arr.shape), "dtype": arr.dtype.str}
+            blobs.append(arr)
+            offset += arr.nbytes + _pad(arr.nbytes)
+        header["targets"][target] = {
+            "features": entry["features"],
+            "agg_features": entry["agg_features"],
+            "stats": entry["stats"],
+            "arrays": arrays,
+        }
+
+    head = json.dumps(header).encode("utf-8")
+    head += b" " * _pad(_PREAMBLE.size + len(head))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(head)))
+        f.write(head)
+        for arr in blobs:
+            f.write(arr.tobytes())
+            f.write(b"\0" * _pad(arr.nbytes))
+    os.replace(tmp, path)
+
+
+class EnvShap:
+    """Read-only, memory-mapped view of one environment's SHAP artifacts."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, head_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a SHAP store file")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported store version {version}")
+            self.header = json.loads(f.read(head_len))
+        self.path = path
+        self.env = self.header["env"]
+        self._data_start = _PREAMBLE.size + head_len
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r")
+
+    @property
+    def targets(self):
+        return list(self.header["targets"])
+
+    def has(self, target):
+        return target in self.header["targets"]
+
+    def _meta(self, target):
+        try:
+            return self.header["targets"][target]
+        except KeyError:
+            raise KeyError(f"No SHAP for target '{target}' in {self.path}") from None
+
+    def array(self, target, name):
+        """Zero-copy view of one stored array."""
+        spec = self._meta(target)["arrays"][name]
+        return np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]),
+                          buffer=self._mm, offset=self._data_start + spec["offset"])
+
+    def shap(self, target):
+        return self.array(target, "shap")
+
+    def xtest(self, target):
+        return self.array(target, "xtest")
+
+    def ytest(self, target):
+        return self.array(target, "ytest")
+
+    def features(self, target):
+        return list(self._meta(target)["features"])
+
+    def stats(self, target):
+        return dict(self._meta(target)["stats"])
+
+    def mean_abs(self, target):
+        """(encoded feature names, mean |SHAP|) — one entry per one-hot column."""
+        return self.features(target), self.array(target, "mean_abs")
+
+    def aggregated(self, target, normalized=False):
+        """(feature names, mean |SHAP|) with Scheduling_* merged into "Scheduling"."""
+        meta = self._meta(target)
+        name = "agg_norm" if normalized else "agg_mean_abs"
+        return list(meta["agg_features"]), self.array(target, name)
+
+    def entry(self, target):
+        """Materialised copy of a target, in the shape accepted by write_env()."""
+        meta = self._meta(target)
+        return {
+            "features": list(meta["features"]),
+            "agg_features": list(meta["agg_features"]),
+            "stats": dict(meta["stats"]),
+            "arrays": {name: np.array(self.array(target, name)) for name in meta["arrays"]},
+        }
+
+
+class ShapStore:
+    """Directory of per-environment store files; opened environments are cached."""
+
+    def __init__(self, root="./shap_outputs"):
+        self.root = root
+        self._open = {}
+
+    def path(self, env):
+        return store_path(self.root, env)
+
+    def envs(self):
+        return sorted(os.path.basename(p)[:-len(SUFFIX)] for p in glob.glob(os.path.join(self.root, f"*{SUFFIX}")))
+
+    def exists(self, env):
+        return os.path.exists(self.path(env))
+
+    def open(self, env):
+        path = self.path(env)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._open.get(env)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, EnvShap(path))
+            self._open[env] = cached
+        return cached[1]
+
+    def has(self, env, target):
+        return self.exists(env) and self.open(env).has(target)
+
+
+_shared = {}
+
+
+def shared_store(root="./shap_outputs"):
+    """Process-wide ShapStore for `root`, so stages run in one worker reuse its opened environments."""
+    key = os.path.abspath(root)
+    if key not in _shared:
+        _shared[key] = ShapStore(root)
+    return _shared[key]
+
+
+def migrate_legacy(root="./shap_outputs"):
+    """Convert legacy <env>_<target>_*.npy artifacts in `root` into store files."""
+    entries = {}
+    for shap_path in sorted(glob.glob(os.path.join(root, "*_shap.npy"))):
+        stem = os.path.basename(shap_path)[:-len("_shap.npy")]
+        feat_path = os.path.join(root, f"{stem}_features.npy")
+        ytest_path = os.path.join(root, f"{stem}_ytest.npy")
+        if not (os.path.exists(feat_path) and os.path.exists(ytest_path)):
+            print(f"⚠️ Incomplete legacy artifacts for {stem} — skipped")
+            continue
+        # feature names were saved as an object array by older runs
+        features = np.load(feat_path, allow_pickle=True)
+        # the shared <env>_Xtest.npy marks where the environment name ends
+        env, target = None, None
+        for split in range(len(stem)):
+            if stem[split] == "_" and os.path.exists(os.path.join(root, f"{stem[:split]}_Xtest.npy")):
+                env, target = stem[:split], stem[split + 1:]
+                break
+        if env is None:
+            print(f"⚠️ Cannot infer environment for {stem} — skipped")
+            continue
+        xtest_path = os.path.join(root, f"{stem}_Xtest.npy")
+        if not os.path.exists(xtest_path):
+            xtest_path = os.path.join(root, f"{env}_Xtest.npy")
+        entries.setdefault(env, {})[target] = build_entry(
+            features, np.load(shap_path), np.load(xtest_path), np.load(ytest_path))
+
+    for env, targets in entries.items():
+        write_env(store_path(root, env), env, targets)
+        print(f"✅ Migrated {env}: {sorted(targets)}")
+    return sorted(entries)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        migrate_legacy(sys.argv[2] if len(sys.argv) > 2 else "./shap_outputs")
+    else:
+        sys.exit("usage: python shap_store.py migrate [shap_outputs_dir]")